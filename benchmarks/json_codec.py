@@ -0,0 +1,42 @@
+"""
+Benchmarks the JSON codecs over recorded SYSTEM_ALL and push notification payloads.
+The legacy figures reproduce the previous parsing path, which decoded every payload to str before parsing it.
+
+    python -m benchmarks.json_codec
+"""
+import json
+import os
+import timeit
+
+from meross_iot.utilities.codec import StdlibJsonCodec, OrjsonCodec, orjson
+
+_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "payloads.json")
+
+
+def main():
+    with open(_DATA_FILE, "rt") as f:
+        recorded = json.load(f)
+
+    codecs = [StdlibJsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    else:
+        print("orjson is not installed: only the stdlib codec will be measured.")
+
+    iterations = 20000
+    for name, message in recorded.items():
+        raw = json.dumps(message, separators=(',', ':')).encode("utf-8")
+        payload = message["payload"]
+        print(f"{name} ({len(raw)} bytes)")
+
+        legacy = min(timeit.repeat(lambda: json.loads(str(raw, "utf8")), number=iterations, repeat=3))
+        print(f"    legacy loads:  {legacy / iterations * 1e6:8.2f} us")
+        for codec in codecs:
+            loads = min(timeit.repeat(lambda: codec.loads(raw), number=iterations, repeat=3))
+            dumps = min(timeit.repeat(lambda: codec.dumps(payload), number=iterations, repeat=3))
+            print(f"    {codec.name:>6} loads: {loads / iterations * 1e6:8.2f} us ({legacy / loads:.1f}x), "
+                  f"dumps: {dumps / iterations * 1e6:8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the outbound message builder, compared with the previous implementation which
+generated a random string char-by-char, hashed it twice and serialized the whole message for every command.
+
+    python -m benchmarks.message_builder
+"""
+import json
+import random
+import string
+import timeit
+from hashlib import md5
+from time import time
+
+from meross_iot.utilities.mqtt import MqttMessageBuilder
+
+_FROM_TOPIC = "/app/12345-0123456789abcdef0123456789abcdef/subscribe"
+_KEY = "0123456789abcdef"
+_UUID = "2008141234567890123448e1e900abcd"
+_NAMESPACE = "Appliance.Control.Electricity"
+_PAYLOAD = {"electricity": {"channel": 0}}
+
+
+def _legacy_build(method, namespace, payload, destination_device_uuid):
+    randomstring = "".join(
+        random.SystemRandom().choice(string.ascii_uppercase + string.digits)
+        for _ in range(16)
+    )
+    md5_hash = md5()
+    md5_hash.update(randomstring.encode("utf8"))
+    message_id = md5_hash.hexdigest().lower()
+    timestamp = int(round(time()))
+    md5_hash = md5()
+    strtohash = "%s%s%s" % (message_id, _KEY, timestamp)
+    md5_hash.update(strtohash.encode("utf8"))
+    signature = md5_hash.hexdigest().lower()
+    data = {
+        "header": {
+            "from": _FROM_TOPIC,
+            "messageId": message_id,
+            "method": method,
+            "namespace": namespace,
+            "payloadVersion": 1,
+            "sign": signature,
+            "timestamp": timestamp,
+            "triggerSrc": "Android",
+            "uuid": destination_device_uuid
+        },
+        "payload": payload,
+    }
+    return json.dumps(data, separators=(',', ':')).encode("utf-8"), message_id
+
+
+def main():
+    builder = MqttMessageBuilder(from_topic=_FROM_TOPIC, key=_KEY)
+    iterations = 100000
+
+    legacy = min(timeit.repeat(lambda: _legacy_build("GET", _NAMESPACE, _PAYLOAD, _UUID),
+                               number=iterations, repeat=3))
+    current = min(timeit.repeat(lambda: builder.build("GET", _NAMESPACE, _PAYLOAD, _UUID),
+                                number=iterations, repeat=3))
+
+    print(f"legacy builder:  {legacy / iterations * 1e6:.2f} us/message")
+    print(f"current builder: {current / iterations * 1e6:.2f} us/message")
+    print(f"speedup: {legacy / current:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Compares the command ACK round-trip latency of the two MQTT loop modes supported by the MerossManager
+(paho network thread vs. asyncio event loop).
+
+The benchmark requires a plain (non-TLS) MQTT broker, such as a local mosquitto instance:
+
+    mosquitto -p 1883 &
+    python -m benchmarks.mqtt_ack_latency --host 127.0.0.1 --port 1883
+
+A fake device, served by a dedicated paho client, immediately acknowledges every command it receives.
+Use --connections to spread the commands over a pool of connections per broker; commands are sent to --devices
+distinct device UUIDs, so that they get sharded among the pooled connections.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime
+from hashlib import md5
+from typing import List
+
+import paho.mqtt.client as mqtt
+
+from meross_iot.http_api import MerossHttpClient
+from meross_iot.manager import MerossManager, MqttLoopMode
+from meross_iot.model.credentials import MerossCloudCreds
+from meross_iot.model.enums import Namespace
+
+_USER_ID = "1234"
+_KEY = "benchmark-key"
+_DEVICE_UUID_PREFIX = "benchmarkdevice"
+
+
+class _PlainMqttManager(MerossManager):
+    """Manager variant that talks to an anonymous plain-TCP broker, as local brokers usually don't expose TLS."""
+
+    def _new_mqtt_client(self, client_id: str) -> mqtt.Client:
+        client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311, clean_session=False)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.on_disconnect = self._on_disconnect
+        client.on_subscribe = self._on_subscribe
+        return client
+
+
+def _start_fake_device(host: str, port: int) -> mqtt.Client:
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe("/appliance/+/subscribe")
+
+    def on_message(client, userdata, msg):
+        device_uuid = msg.topic.split("/")[2]
+        request = json.loads(msg.payload)
+        header = request["header"]
+        message_id = header["messageId"]
+        timestamp = int(time.time())
+        sign = md5(f"{message_id}{_KEY}{timestamp}".encode("utf8")).hexdigest()
+        response = {
+            "header": {
+                "from": f"/appliance/{device_uuid}/publish",
+                "messageId": message_id,
+                "method": f"{header['method']}ACK",
+                "namespace": header["namespace"],
+                "payloadVersion": 1,
+                "sign": sign,
+                "timestamp": timestamp,
+            },
+            "payload": {"online": {"status": 1}},
+        }
+        client.publish(header["from"], json.dumps(response))
+
+    client = mqtt.Client(client_id="fmware:benchmark", protocol=mqtt.MQTTv311, clean_session=True)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host=host, port=port)
+    client.loop_start()
+    return client
+
+
+async def _async_measure(mode: MqttLoopMode, host: str, port: int, samples: int, burst: int,
+                         connections: int, devices: int) -> None:
+    creds = MerossCloudCreds(token="benchmark", key=_KEY, user_id=_USER_ID, user_email="benchmark@localhost",
+                             issued_on=datetime.utcnow(), domain="localhost", mqtt_domain=host, mfa_lock_expire=0)
+    manager = _PlainMqttManager(http_client=MerossHttpClient(cloud_credentials=creds),
+                                mqtt_override_server=(host, port),
+                                auto_discovery_on_connection=False,
+                                mqtt_loop_mode=mode,
+                                mqtt_connections_per_broker=connections)
+    device_uuids = [f"{_DEVICE_UUID_PREFIX}{i:017d}" for i in range(devices)]
+
+    async def send(i: int = 0):
+        return await manager.async_execute_cmd(mqtt_hostname=host, mqtt_port=port,
+                                               destination_device_uuid=device_uuids[i % devices], method="GET",
+                                               namespace=Namespace.SYSTEM_ONLINE, payload={}, timeout=5)
+
+    # Warm up the connections
+    await asyncio.gather(*(send(i) for i in range(devices)))
+
+    latencies: List[float] = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await send()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(burst)))
+    burst_elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{mode.value:>8}: "
+          f"mean {statistics.mean(latencies):.3f}ms, "
+          f"p50 {latencies[len(latencies) // 2]:.3f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f}ms, "
+          f"burst of {burst} commands: {burst / burst_elapsed:.0f} ack/s "
+          f"({connections} connection(s), {devices} device(s))")
+    manager.close()
+    await asyncio.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT ACK round-trip latency benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--burst", type=int, default=2000)
+    parser.add_argument("--connections", type=int, default=1)
+    parser.add_argument("--devices", type=int, default=1)
+    args = parser.parse_args()
+
+    device = _start_fake_device(args.host, args.port)
+    try:
+        for mode in (MqttLoopMode.THREADED, MqttLoopMode.ASYNCIO):
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(_async_measure(mode, args.host, args.port, args.samples, args.burst,
+                                                   args.connections, args.devices))
+            loop.close()
+    finally:
+        device.disconnect()
+        device.loop_stop()
+
+
+if __name__ == '__main__':
+    main()
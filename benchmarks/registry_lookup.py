@@ -0,0 +1,153 @@
+"""
+Measures the cost of the device registry lookups performed on the hot paths (commands sent via LAN, push
+notification dispatching, discovery) with a large synthetic fleet, compared with the previous implementation
+which filtered all the registered devices on every lookup.
+
+    python -m benchmarks.registry_lookup --devices 10000
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Union
+
+from meross_iot.controller.device import BaseDevice, GenericSubDevice, HubDevice
+from meross_iot.controller.mixins.toggle import ToggleXMixin
+from meross_iot.device_factory import build_meross_device_from_abilities
+from meross_iot.http_api import MerossHttpClient
+from meross_iot.manager import DeviceRegistry, MerossManager
+from meross_iot.model.credentials import MerossCloudCreds
+from meross_iot.model.enums import Namespace, OnlineStatus
+from meross_iot.model.http.device import HttpDeviceInfo
+
+_DEVICE_TYPES = {
+    "mss310": {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {}, Namespace.CONTROL_TOGGLEX.value: {}},
+    "msl120": {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {}, Namespace.CONTROL_LIGHT.value: {}},
+    "msh300": {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {}, Namespace.SYSTEM_DIGEST_HUB.value: {}},
+}
+
+
+class _LinearDeviceRegistry(DeviceRegistry):
+    """Registry variant performing the lookups the way the library did before the indexes were introduced."""
+
+    def lookup_base_by_uuid(self, device_uuid: str) -> Optional[BaseDevice]:
+        res = list(
+            filter(
+                lambda d: d.uuid == device_uuid and not isinstance(d, GenericSubDevice),
+                self._devices_by_internal_id.values(),
+            )
+        )
+        if len(res) > 1:
+            raise ValueError(f"Multiple devices found for device_uuid {device_uuid}")
+        elif len(res) == 1:
+            return res[0]
+        else:
+            return None
+
+    def find_all_by(self,
+                    device_uuids: Optional[Iterable[str]] = None,
+                    internal_ids: Optional[Iterable[str]] = None,
+                    device_type: Optional[str] = None,
+                    device_class: Optional[Union[type, Iterable[type]]] = None,
+                    device_name: Optional[str] = None,
+                    online_status: Optional[OnlineStatus] = None,
+                    exclude_classes: Optional[Iterable[type]] = None) -> List[BaseDevice]:
+        def filter_by_excluded_type(dev: Any):
+            for t in exclude_classes:
+                if isinstance(dev, t):
+                    return False
+            return True
+
+        res = self._devices_by_internal_id.values()
+        if internal_ids is not None:
+            res = filter(lambda d: d.internal_id in internal_ids, res)
+        if device_uuids is not None:
+            res = filter(lambda d: d.uuid in device_uuids, res)
+        if device_type is not None:
+            res = filter(lambda d: d.type == device_type, res)
+        if online_status is not None:
+            res = filter(lambda d: d.online_status == online_status, res)
+        if device_class is not None:
+            res = filter(lambda d: isinstance(d, device_class), res)
+        if device_name is not None:
+            res = filter(lambda d: d.name == device_name, res)
+        if exclude_classes is not None:
+            res = filter(filter_by_excluded_type, res)
+        return list(res)
+
+
+def _populate(registry: DeviceRegistry, manager: MerossManager, devices: int) -> List[str]:
+    uuids = []
+    types = list(_DEVICE_TYPES.keys())
+    for i in range(devices):
+        uuid = f"{i:032x}"
+        device_type = types[i % len(types)]
+        # 1% of the fleet is offline
+        status = OnlineStatus.OFFLINE if i % 100 == 0 else OnlineStatus.ONLINE
+        info = HttpDeviceInfo(uuid=uuid, online_status=status, dev_name=f"Device {i}", device_type=device_type,
+                              channels=[], fmware_version="1.0.0", hdware_version="1.0.0",
+                              domain="mqtt-eu.meross.com", reserved_domain="mqtt-eu.meross.com", bind_time=0)
+        registry.enroll_device(build_meross_device_from_abilities(http_device_info=info,
+                                                                  device_abilities=_DEVICE_TYPES[device_type],
+                                                                  manager=manager))
+        uuids.append(uuid)
+    return uuids
+
+
+def _measure(registry: DeviceRegistry, uuids: List[str], lookups: int) -> dict:
+    results = {}
+    targets = [uuids[(i * 7919) % len(uuids)] for i in range(lookups)]
+    cases = {
+        "lookup_base_by_uuid": lambda u: registry.lookup_base_by_uuid(u),
+        "find_all_by(uuid)": lambda u: registry.find_all_by(device_uuids=(u,), exclude_classes=(GenericSubDevice,)),
+        "find_all_by(offline)": lambda u: registry.find_all_by(online_status=OnlineStatus.OFFLINE),
+        "find_all_by(hub class)": lambda u: registry.find_all_by(device_class=HubDevice),
+        "find_all_by(type+mixin)": lambda u: registry.find_all_by(device_type="mss310", device_class=ToggleXMixin),
+    }
+    for name, case in cases.items():
+        start = time.perf_counter()
+        for u in targets:
+            case(u)
+        results[name] = (time.perf_counter() - start) / lookups
+    return results
+
+
+async def _async_main(devices: int, lookups: int):
+    creds = MerossCloudCreds(token="token", key="key", user_id="1234", user_email="test@localhost",
+                             issued_on=datetime.utcnow(), domain="localhost", mqtt_domain="localhost",
+                             mfa_lock_expire=0)
+    manager = MerossManager(http_client=MerossHttpClient(cloud_credentials=creds), auto_discovery_on_connection=False)
+
+    results = {}
+    for name, registry_class in (("before", _LinearDeviceRegistry), ("after", DeviceRegistry)):
+        registry = registry_class()
+        start = time.perf_counter()
+        uuids = _populate(registry, manager, devices)
+        print(f"{name:>6}: enrolled {devices} devices in {time.perf_counter() - start:.2f}s")
+        results[name] = _measure(registry, uuids, lookups)
+        registry.clear()
+    manager.close()
+
+    print(f"{'lookup':<26}{'before':>12}{'after':>12}{'speedup':>10}")
+    for case in results["before"]:
+        before = results["before"][case]
+        after = results["after"][case]
+        print(f"{case:<26}{before * 1e6:>10.1f}us{after * 1e6:>10.1f}us{before / after:>9.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Device registry lookup benchmark")
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.getLogger("meross_iot").setLevel(logging.ERROR)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(_async_main(args.devices, args.lookups))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
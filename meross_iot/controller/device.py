@@ -5,16 +5,52 @@ import json
 import logging
 import time
 from datetime import datetime
-from typing import List, Union, Optional, Iterable, Callable, Awaitable, Dict
+from typing import List, Union, Optional, Iterable, Callable, Awaitable, Dict, Tuple, FrozenSet
 
 from meross_iot.model.constants import DEFAULT_MQTT_PORT, DEFAULT_MQTT_HOST, DEFAULT_COMMAND_TIMEOUT
 from meross_iot.model.enums import OnlineStatus, Namespace
 from meross_iot.model.http.device import HttpDeviceInfo
+from meross_iot.model.http.subdevice import HttpSubdeviceInfo
 from meross_iot.model.plugin.hub import BatteryInfo
 from meross_iot.utilities.network import extract_domain, extract_port
+from meross_iot.utilities.tracing import trace_span, SPAN_FIRE_PUSH_NOTIFICATION_EVENT, SPAN_PUSH_HANDLER
 
 _LOGGER = logging.getLogger(__name__)
 
+# Attributes holding the state of every device class, collected along its MRO, and the same attributes by namespace
+_state_fields_by_class: Dict[type, Dict[str, Tuple[Namespace, ...]]] = {}
+_state_fields_by_namespace: Dict[type, Dict[Namespace, Tuple[str, ...]]] = {}
+
+
+def get_state_fields(clazz: type) -> Dict[str, Tuple[Namespace, ...]]:
+    """
+    Returns the attributes holding the state of the devices of the given class, mapped to the namespaces
+    whose updates refresh them, as declared by the `_STATE_FIELDS` of the class and of its ancestors
+    """
+    fields = _state_fields_by_class.get(clazz)
+    if fields is None:
+        fields = {}
+        for klass in reversed(clazz.__mro__):
+            for name, namespaces in vars(klass).get('_STATE_FIELDS', {}).items():
+                # Private attributes are name-mangled with the class declaring them
+                if name.startswith('__') and not name.endswith('__'):
+                    name = f"_{klass.__name__.lstrip('_')}{name}"
+                fields[name] = namespaces
+        _state_fields_by_class[clazz] = fields
+    return fields
+
+
+def _get_state_fields_by_namespace(clazz: type) -> Dict[Namespace, Tuple[str, ...]]:
+    by_namespace = _state_fields_by_namespace.get(clazz)
+    if by_namespace is None:
+        lists = {}
+        for name, namespaces in get_state_fields(clazz).items():
+            for namespace in namespaces:
+                lists.setdefault(namespace, []).append(name)
+        by_namespace = {namespace: tuple(names) for namespace, names in lists.items()}
+        _state_fields_by_namespace[clazz] = by_namespace
+    return by_namespace
+
 
 class BaseDevice(object):
     """
@@ -27,11 +63,18 @@ class BaseDevice(object):
     _type: str = "unknown"
     _fwversion: str = "unknown"
     _hwversion: str = "unknown"
-    _online: OnlineStatus = OnlineStatus.UNKNOWN
+    _online_status: OnlineStatus = OnlineStatus.UNKNOWN
+    _state_listener: Optional[Callable[[BaseDevice], None]] = None
     _inner_ip: Optional[str] = None
     _mac_address: Optional[str] = None
     _mqtt_host: str = DEFAULT_MQTT_HOST
     _mqtt_port: int = DEFAULT_MQTT_PORT
+    # Attributes holding the state of the device, mapped to the namespaces whose updates refresh them.
+    # Every mixin declares its own ones: they are persisted by the registry snapshots.
+    _STATE_FIELDS = {
+        '_inner_ip': (Namespace.SYSTEM_ALL,),
+        '_mac_address': (Namespace.SYSTEM_ALL,),
+    }
 
     def __init__(self, device_uuid: str,
                  manager,
@@ -76,10 +119,32 @@ class BaseDevice(object):
             self._abilities = {}
         self._push_coros = []
         self._last_full_update_ts = None
+        # Time each state field was last reported by the device, and fields restored from a snapshot
+        # that the device did not confirm yet
+        self._state_timestamps: Dict[str, float] = {}
+        self._stale_state_fields = set()
 
         # Set default timeout value for command execution
         self._timeout = DEFAULT_COMMAND_TIMEOUT
 
+    @property
+    def _online(self) -> OnlineStatus:
+        return self._online_status
+
+    @_online.setter
+    def _online(self, status: OnlineStatus) -> None:
+        changed = status != self._online_status
+        self._online_status = status
+        if changed:
+            self._notify_state_changed()
+
+    def _notify_state_changed(self) -> None:
+        """
+        Lets the device registry know that the indexed attributes (online status, type) of this device changed
+        """
+        if self._state_listener is not None:
+            self._state_listener(self)
+
     @property
     def cached_http_info(self) -> Optional[HttpDeviceInfo]:
         return self._cached_http_info
@@ -108,6 +173,37 @@ class BaseDevice(object):
     def last_full_update_timestamp(self):
         return self._last_full_update_ts
 
+    @property
+    def state_timestamps(self) -> Dict[str, float]:
+        """
+        Time (seconds since epoch) each field of the cached state was last reported by the device
+        """
+        return dict(self._state_timestamps)
+
+    @property
+    def stale_state_fields(self) -> FrozenSet[str]:
+        """
+        Fields of the cached state restored from a snapshot, which the device did not confirm yet
+        """
+        return frozenset(self._stale_state_fields)
+
+    @property
+    def is_state_stale(self) -> bool:
+        """
+        Whether part of the cached state has been restored from a snapshot and not confirmed by the device yet
+        """
+        return len(self._stale_state_fields) > 0
+
+    def _refresh_state_timestamps(self, namespace: Namespace) -> None:
+        fields = _get_state_fields_by_namespace(type(self)).get(namespace)
+        if not fields:
+            return
+        now = time.time()
+        for field in fields:
+            self._state_timestamps[field] = now
+        if self._stale_state_fields:
+            self._stale_state_fields.difference_update(fields)
+
     def check_full_update_done(self):
         update_done = self._last_full_update_ts is not None
         if not update_done:
@@ -144,11 +240,15 @@ class BaseDevice(object):
             _LOGGER.error(f"Coroutine {coro} was not registered as handler for this device")
 
     async def _fire_push_notification_event(self, namespace: Namespace, data: dict, device_internal_id: str):
-        for c in self._push_coros:
-            try:
-                await c(namespace=namespace, data=data, device_internal_id=device_internal_id)
-            except Exception as e:
-                _LOGGER.exception(f"Error occurred while firing push notification event {namespace} with data: {data}")
+        with trace_span(SPAN_FIRE_PUSH_NOTIFICATION_EVENT, {"meross.device_uuid": self._uuid,
+                                                            "meross.namespace": namespace.value,
+                                                            "meross.handlers": len(self._push_coros)}):
+            for c in self._push_coros:
+                try:
+                    with trace_span(SPAN_PUSH_HANDLER, {"meross.handler": getattr(c, "__qualname__", str(c))}):
+                        await c(namespace=namespace, data=data, device_internal_id=device_internal_id)
+                except Exception as e:
+                    _LOGGER.exception(f"Error occurred while firing push notification event {namespace} with data: {data}")
 
     @property
     def internal_id(self) -> str:
@@ -228,12 +328,14 @@ class BaseDevice(object):
         self._fwversion = hdevice.fmware_version
         self._hwversion = hdevice.hdware_version
         self._online = hdevice.online_status
+        self._notify_state_changed()
 
         # TODO: fire some sort of events to let users see changed data?
         return self
 
     async def async_handle_push_notification(self, namespace: Namespace, data: dict) -> bool:
         _LOGGER.debug(f"MerossBaseDevice {self.name} handling notification {namespace}")
+        self._refresh_state_timestamps(namespace)
 
         # However, we want to notify any registered event handler
         await self._fire_push_notification_event(namespace=namespace, data=data, device_internal_id=self.internal_id)
@@ -246,6 +348,7 @@ class BaseDevice(object):
             system = data.get('all', {}).get('system', {})
             self._inner_ip = system.get('firmware', {}).get('innerIp')
             self._mac_address = system.get('hardware', {}).get('macAddress', None)
+        self._refresh_state_timestamps(namespace)
 
         await self._fire_push_notification_event(namespace=namespace, data=data, device_internal_id=self.internal_id)
         self._last_full_update_ts = time.time() * 1000
@@ -299,6 +402,8 @@ class BaseDevice(object):
                                namespace: Namespace,
                                payload: dict,
                                timeout: Optional[float] = None,
+                               coalesce: Optional[bool] = None,
+                               drop_on_overquota: bool = True,
                                ) -> dict:
         if timeout is None:
             to = self.default_command_timeout
@@ -311,7 +416,9 @@ class BaseDevice(object):
                                                      payload=payload,
                                                      timeout=to,
                                                      mqtt_hostname=self.mqtt_host,
-                                                     mqtt_port=self.mqtt_port)
+                                                     mqtt_port=self.mqtt_port,
+                                                     coalesce=coalesce,
+                                                     drop_on_overquota=drop_on_overquota)
 
     def __repr__(self):
         basic_info = f"{self.name} ({self.type}, HW {self.hardware_version}, FW {self.firmware_version}, class: {self.__class__.__name__})"
@@ -371,6 +478,9 @@ class HubDevice(BaseDevice):
 
 class GenericSubDevice(BaseDevice):
     _UPDATE_ALL_NAMESPACE = None
+    _STATE_FIELDS = {
+        '_online_status': (Namespace.HUB_ONLINE, Namespace.HUB_SENSOR_ALL, Namespace.HUB_MTS100_ALL),
+    }
 
     def __init__(self, hubdevice_uuid: str, subdevice_id: str, manager, **kwargs):
         hubs = manager.find_devices(device_uuids=(hubdevice_uuid,))  # type: List[HubDevice]
@@ -382,6 +492,12 @@ class GenericSubDevice(BaseDevice):
         self._subdevice_id = subdevice_id
         self._type = kwargs.get('subDeviceType')
         self._name = kwargs.get('subDeviceName')
+        self._cached_http_subdevice_info = HttpSubdeviceInfo(sub_device_id=subdevice_id,
+                                                             true_id=kwargs.get('trueId'),
+                                                             sub_device_type=self._type,
+                                                             sub_device_vendor=kwargs.get('subDeviceVendor'),
+                                                             sub_device_name=self._name,
+                                                             sub_device_icon_id=kwargs.get('subDeviceIconId'))
         self._onoff = None
         self._mode = None
         self._temperature = None
@@ -391,7 +507,9 @@ class GenericSubDevice(BaseDevice):
                                method: str,
                                namespace: Namespace,
                                payload: dict,
-                               timeout: Optional[float] = None
+                               timeout: Optional[float] = None,
+                               coalesce: Optional[bool] = None,
+                               drop_on_overquota: bool = True
                                ) -> dict:
         # Every command should be invoked via HUB?
         raise NotImplementedError("Subdevices should rely on Hub in order to send commands.")
@@ -415,7 +533,8 @@ class GenericSubDevice(BaseDevice):
         result = await self._hub._execute_command(method="GET",
                                                   namespace=self._UPDATE_ALL_NAMESPACE,
                                                   payload={'all': [{'id': self.subdevice_id}]},
-                                                  timeout=timeout)
+                                                  timeout=timeout,
+                                                  drop_on_overquota=kwargs.get('drop_on_overquota', True))
         subdevices_states = result.get('all')
         for subdev_state in subdevices_states:
             subdev_id = subdev_state.get('id')
@@ -454,6 +573,13 @@ class GenericSubDevice(BaseDevice):
     def subdevice_id(self):
         return self._subdevice_id
 
+    @property
+    def cached_http_subdevice_info(self) -> HttpSubdeviceInfo:
+        """
+        Information about the subdevice, as reported by the HTTP API when it was enrolled
+        """
+        return self._cached_http_subdevice_info
+
     @property
     def online_status(self) -> OnlineStatus:
         # If the HUB device is offline, return offline
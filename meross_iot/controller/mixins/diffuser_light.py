@@ -9,6 +9,7 @@ _LOGGER = logging.getLogger(__name__)
 
 
 class DiffuserLightMixin(object):
+    _STATE_FIELDS = {'_channel_diffuser_light_status': (Namespace.DIFFUSER_LIGHT, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     check_full_update_done: callable
 
@@ -8,6 +8,7 @@ _LOGGER = logging.getLogger(__name__)
 
 
 class DiffuserSprayMixin(object):
+    _STATE_FIELDS = {'_channel_diffuser_spray_status': (Namespace.DIFFUSER_SPRAY, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     check_full_update_done: callable
 
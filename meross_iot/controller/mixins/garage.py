@@ -12,6 +12,10 @@ class GarageOpenerMixin:
     _execute_command: callable
     check_full_update_done: callable
     uuid: str
+    _STATE_FIELDS = {
+        '_door_open_state_by_channel': (Namespace.GARAGE_DOOR_STATE, Namespace.SYSTEM_ALL),
+        '_door_config_state_by_channel': (Namespace.GARAGE_DOOR_MULTIPLECONFIG,),
+    }
 
     def __init__(self, device_uuid: str,
                  manager,
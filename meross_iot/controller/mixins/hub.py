@@ -74,7 +74,8 @@ class HubMs100Mixin(object):
         result = await self._execute_command(method="GET",
                                              namespace=Namespace.HUB_SENSOR_ALL,
                                              payload={'all': []},
-                                             timeout=timeout)
+                                             timeout=timeout,
+                                             drop_on_overquota=kwargs.get('drop_on_overquota', True))
         subdevs_data = result.get('all', [])
         for d in subdevs_data:
             dev_id = d.get('id')
@@ -142,7 +143,8 @@ class HubMts100Mixin(object):
             result = await self._execute_command(method="GET",
                                                  namespace=Namespace.HUB_MTS100_ALL,
                                                  payload={'all': []},
-                                                 timeout=timeout)
+                                                 timeout=timeout,
+                                                 drop_on_overquota=kwargs.get('drop_on_overquota', True))
             subdevs_data = result.get('all', [])
             for d in subdevs_data:
                 dev_id = d.get('id')
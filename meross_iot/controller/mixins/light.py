@@ -14,6 +14,7 @@ class LightMixin(object):
     """
     Mixin class that enables light control.
     """
+    _STATE_FIELDS = {'_channel_light_status': (Namespace.CONTROL_LIGHT, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     check_full_update_done: callable
 
@@ -13,6 +13,10 @@ class RollerShutterTimerMixin:
     _shutter__state_by_channel: Dict[int, RollerShutterState]
     _shutter__position_by_channel: Dict[int, int]
     _shutter__config_by_channel: Dict[int, Dict]
+    _STATE_FIELDS = {
+        '_shutter__state_by_channel': (Namespace.ROLLER_SHUTTER_STATE,),
+        '_shutter__position_by_channel': (Namespace.ROLLER_SHUTTER_POSITION,),
+    }
 
     def __init__(self, device_uuid: str,
                  manager,
@@ -111,13 +115,14 @@ class RollerShutterTimerMixin:
         # Call the super implementation
         await super().async_update(*args, **kwargs)
         # Update the configuration at the same time
-        await self.async_fetch_config()
+        await self.async_fetch_config(drop_on_overquota=kwargs.get('drop_on_overquota', True))
 
     async def async_fetch_config(self, timeout: Optional[float] = None, *args, **kwargs) -> None:
         data = await self._execute_command(method="GET",
                                     namespace=Namespace.ROLLER_SHUTTER_CONFIG,
                                     payload={},
-                                    timeout=timeout)
+                                    timeout=timeout,
+                                    drop_on_overquota=kwargs.get('drop_on_overquota', True))
         config = data.get('config')
         for d in config:
             channel = d['channel']
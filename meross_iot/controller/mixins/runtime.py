@@ -29,7 +29,8 @@ class SystemRuntimeMixin(object):
         result = await self._execute_command(method="GET",
                                              namespace=Namespace.SYSTEM_RUNTIME,
                                              payload={},
-                                             timeout=timeout)
+                                             timeout=timeout,
+                                             drop_on_overquota=kwargs.get('drop_on_overquota', True))
         data = result.get('runtime')
         self._runtime_info = data
         return data
@@ -47,4 +48,4 @@ class SystemRuntimeMixin(object):
                            **kwargs) -> None:
         # call the superclass implementation first
         await super().async_update(*args, **kwargs)
-        await self.async_update_runtime_info()
+        await self.async_update_runtime_info(drop_on_overquota=kwargs.get('drop_on_overquota', True))
@@ -7,6 +7,7 @@ _LOGGER = logging.getLogger(__name__)
 
 
 class SprayMixin(object):
+    _STATE_FIELDS = {'_channel_spray_status': (Namespace.CONTROL_SPRAY, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     check_full_update_done: callable
     #async_handle_update: Callable[[Namespace, dict], Awaitable]
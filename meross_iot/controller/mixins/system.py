@@ -22,7 +22,8 @@ class SystemAllMixin(object):
         result = await self._execute_command(method="GET",
                                              namespace=Namespace.SYSTEM_ALL,
                                              payload={},
-                                             timeout=timeout)
+                                             timeout=timeout,
+                                             drop_on_overquota=kwargs.get('drop_on_overquota', True))
 
         # Once we have the response, update all the mixin which are interested
         await self.async_handle_update(namespace=Namespace.SYSTEM_ALL, data=result)
@@ -115,6 +115,7 @@ class ThermostatState:
 
 
 class ThermostatModeMixin:
+    _STATE_FIELDS = {'_thermostat_state_by_channel': (Namespace.CONTROL_THERMOSTAT_MODE, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     check_full_update_done: callable
     _thermostat_state_by_channel: Dict[int, ThermostatState]
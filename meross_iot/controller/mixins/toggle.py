@@ -11,6 +11,7 @@ class ToggleXMixin(object):
     This mixin is implemented by devices that support ToggleX operation, such as smart switches
     and smart bulbs.
     """
+    _STATE_FIELDS = {'_channel_togglex_status': (Namespace.CONTROL_TOGGLEX, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     check_full_update_done: callable
     #async_handle_update: Callable[[Namespace, dict], Awaitable]
@@ -124,6 +125,7 @@ class ToggleXMixin(object):
 
 
 class ToggleMixin(object):
+    _STATE_FIELDS = {'_channel_toggle_status': (Namespace.CONTROL_TOGGLE, Namespace.SYSTEM_ALL)}
     _execute_command: callable
     #async_handle_update: Callable[[Namespace, dict], Awaitable]
 
@@ -15,6 +15,11 @@ class Ms100Sensor(GenericSubDevice):
     Moreover, this device is capable of triggering settable alerts.
     """
     _UPDATE_ALL_NAMESPACE = Namespace.HUB_SENSOR_ALL
+    _STATE_FIELDS = {
+        '__temperature': (Namespace.HUB_SENSOR_ALL, Namespace.HUB_SENSOR_TEMPHUM),
+        '__humidity': (Namespace.HUB_SENSOR_ALL, Namespace.HUB_SENSOR_TEMPHUM),
+        '__samples': (Namespace.HUB_SENSOR_TEMPHUM,),
+    }
 
     def __init__(self, hubdevice_uuid: str, subdevice_id: str, manager, **kwargs):
         super().__init__(hubdevice_uuid, subdevice_id, manager, **kwargs)
@@ -22,7 +27,7 @@ class Ms100Sensor(GenericSubDevice):
         self.__humidity = {}
         self.__samples = []
 
-    async def _execute_command(self, method: str, namespace: Namespace, payload: dict, timeout: Optional[float] = None) -> dict:
+    async def _execute_command(self, method: str, namespace: Namespace, payload: dict, timeout: Optional[float] = None, coalesce: Optional[bool] = None, drop_on_overquota: bool = True) -> dict:
         raise NotImplementedError("This method should never be called directly for subdevices.")
 
     async def async_handle_push_notification(self, namespace: Namespace, data: dict) -> bool:
@@ -140,6 +145,14 @@ class Ms100Sensor(GenericSubDevice):
 
 class Mts100v3Valve(GenericSubDevice):
     _UPDATE_ALL_NAMESPACE = Namespace.HUB_MTS100_ALL
+    _STATE_FIELDS = {
+        '__togglex': (Namespace.HUB_MTS100_ALL, Namespace.HUB_TOGGLEX),
+        '__mode': (Namespace.HUB_MTS100_ALL, Namespace.HUB_MTS100_MODE),
+        '__temperature': (Namespace.HUB_MTS100_ALL, Namespace.HUB_MTS100_TEMPERATURE),
+        '__adjust': (Namespace.HUB_MTS100_ALL,),
+        '_schedule_b_mode': (Namespace.HUB_MTS100_ALL,),
+        '_last_active_time': (Namespace.HUB_ONLINE, Namespace.HUB_MTS100_ALL),
+    }
 
     def __init__(self, hubdevice_uuid: str, subdevice_id: str, manager, **kwargs):
         super().__init__(hubdevice_uuid, subdevice_id, manager, **kwargs)
@@ -151,7 +164,7 @@ class Mts100v3Valve(GenericSubDevice):
         self._last_active_time = None
         self.__adjust = {}
 
-    async def _execute_command(self, method: str, namespace: Namespace, payload: dict, timeout: Optional[float] = None) -> dict:
+    async def _execute_command(self, method: str, namespace: Namespace, payload: dict, timeout: Optional[float] = None, coalesce: Optional[bool] = None, drop_on_overquota: bool = True) -> dict:
         raise NotImplementedError("This method should never be called directly for subdevices.")
 
     async def async_handle_push_notification(self, namespace: Namespace, data: dict) -> bool:
@@ -1,5 +1,7 @@
+import hashlib
+import json
 import logging
-from typing import Optional
+from typing import Dict, FrozenSet, Optional, Tuple
 
 from meross_iot.controller.device import BaseDevice, HubDevice, GenericSubDevice
 from meross_iot.controller.mixins.consumption import ConsumptionXMixin, ConsumptionMixin
@@ -84,7 +86,55 @@ _SUBDEVICE_MAPPING = {
     "ms100": Ms100Sensor
 }
 
-_dynamic_types = {}
+# Mixins implementing every ability, in _ABILITY_MATRIX order, and the X version of the abilities that have one
+_ABILITY_ORDER = {ability: index for index, ability in enumerate(_ABILITY_MATRIX)}
+_X_ABILITIES = {ability: f"{ability}X" for ability in _ABILITY_MATRIX if f"{ability}X" in _ABILITY_MATRIX}
+
+# Dynamic types by fingerprint of the abilities they were built for, and resolved mixins by set of abilities
+_dynamic_types: Dict[str, type] = {}
+_resolved_mixins: Dict[FrozenSet[str], Tuple[type, ...]] = {}
+
+
+class DeviceTypeCacheStats(object):
+    """
+    Counters of the cache of the dynamic device types
+    """
+    def __init__(self):
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self) -> int:
+        """Number of devices built from an already existing dynamic type"""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Number of devices that required a new dynamic type"""
+        return self._misses
+
+    @property
+    def types(self) -> int:
+        """Number of dynamic types built so far"""
+        return len(_dynamic_types)
+
+    @property
+    def mixin_resolutions(self) -> int:
+        """Number of distinct ability sets whose mixins have been resolved"""
+        return len(_resolved_mixins)
+
+    def __repr__(self):
+        return f"{self._hits} hits, {self._misses} misses, {self.types} types"
+
+
+_type_cache_stats = DeviceTypeCacheStats()
+
+
+def get_device_type_cache_stats() -> DeviceTypeCacheStats:
+    """
+    Returns the counters of the cache of the dynamic device types
+    """
+    return _type_cache_stats
 
 
 def _caclulate_device_type_name(device_type: str, hardware_version: str, firmware_version: str) -> str:
@@ -98,53 +148,64 @@ def _caclulate_device_type_name(device_type: str, hardware_version: str, firmwar
     return f"{device_type}:{hardware_version}:{firmware_version}"
 
 
-def _lookup_cached_type(device_type: str, hardware_version: str, firmware_version: str) -> Optional[type]:
+def _calculate_abilities_fingerprint(device_abilities: dict) -> str:
     """
-    Returns the cached dynamic type for the specific device, if any was already built for that one.
-    :param device_type:
-    :param hardware_version:
-    :param firmware_version:
+    Calculates a canonical fingerprint of the given abilities, which does not depend on the order of the keys.
+    Devices reporting the same abilities share the same dynamic type.
+    :param device_abilities:
     :return:
     """
-    lookup_string = _caclulate_device_type_name(device_type, hardware_version, firmware_version).strip(":")
-    return _dynamic_types.get(lookup_string)
+    canonical = json.dumps(device_abilities, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
 
 
-def _build_cached_type(type_string: str, device_abilities: dict, base_class: type) -> type:
+def _lookup_cached_type(fingerprint: str) -> Optional[type]:
     """
-    Builds a python type (class) dynamically by looking at the device abilities. In this way, we are able to
-    "plugin" feature/mixins even for unknown new devices, given that they report abilities we already implemented.
-    :param type_string:
-    :param device_abilities:
+    Returns the cached dynamic type for the given abilities fingerprint, if any was already built for that one.
+    :param fingerprint:
+    :return:
+    """
+    return _dynamic_types.get(fingerprint)
+
+
+def _resolve_mixins(abilities: FrozenSet[str]) -> Tuple[type, ...]:
+    """
+    Returns the mixin classes implementing the given abilities. The result is cached per set of abilities.
+    :param abilities:
     :return:
     """
-    # Build a specific type at runtime by mixing plugins on-demand
-    mixin_classes = set()
+    mixins = _resolved_mixins.get(abilities)
+    if mixins is not None:
+        return mixins
 
-    # Add plugins by abilities
-    for key, val in device_abilities.items():
+    mixin_classes = []
+    for ability in sorted(abilities.intersection(_ABILITY_MATRIX), key=_ABILITY_ORDER.get):
         # When a device exposes the same ability like Tooggle and ToogleX, prefer the X version by filtering
         # out the non-X version.
-        clsx = None
-        cls = _ABILITY_MATRIX.get(key)
-
-        # Check if for this ability the device exposes the X version
-        x_key = f"{key}X"
-        x_version_ability = device_abilities.get(x_key)
-        if x_version_ability is not None:
-            clsx = _ABILITY_MATRIX.get(x_key)
+        if _X_ABILITIES.get(ability) in abilities:
+            continue
+        cls = _ABILITY_MATRIX[ability]
+        if cls not in mixin_classes:
+            mixin_classes.append(cls)
+    mixins = tuple(mixin_classes)
+    _resolved_mixins[abilities] = mixins
+    return mixins
 
-        # Now, if we have both the clsx and the cls, prefer the clsx, otherwise go for the cls
-        if clsx is not None:
-            mixin_classes.add(clsx)
-        elif cls is not None:
-            mixin_classes.add(cls)
 
+def _build_cached_type(type_string: str, device_abilities: dict, base_class: type, fingerprint: str) -> type:
+    """
+    Builds a python type (class) dynamically by looking at the device abilities. In this way, we are able to
+    "plugin" feature/mixins even for unknown new devices, given that they report abilities we already implemented.
+    :param type_string: name of the class: the type of the first device it was built for
+    :param device_abilities:
+    :param base_class:
+    :param fingerprint: fingerprint of the abilities, stored as `_abilities_fingerprint` class attribute
+    :return:
+    """
     # We must be careful when ordering the mixin and leaving the BaseMerossDevice as last class.
     # Messing up with that will cause MRO to not resolve inheritance correctly.
-    mixin_classes = list(mixin_classes)
-    mixin_classes.append(base_class)
-    m = type(type_string, tuple(mixin_classes), {"_abilities_spec": device_abilities})
+    mixin_classes = _resolve_mixins(frozenset(device_abilities)) + (base_class,)
+    m = type(type_string, mixin_classes, {"_abilities_spec": device_abilities, "_abilities_fingerprint": fingerprint})
     return m
 
 
@@ -165,17 +226,16 @@ def build_meross_device_from_abilities(http_device_info: HttpDeviceInfo,
     _LOGGER.debug(f"Building managed device for {http_device_info.dev_name} ({http_device_info.uuid}). "
                   f"Reported abilities: {device_abilities}")
 
-    # Check if we already have cached type for that device kind.
-    cached_type = _lookup_cached_type(http_device_info.device_type,
-                                      http_device_info.hdware_version,
-                                      http_device_info.fmware_version)
-    if cached_type is None:
-        _LOGGER.debug(f"Could not find any cached type for {http_device_info.device_type},"
+    # Check if we already have cached type for the abilities of the device.
+    fingerprint = _calculate_abilities_fingerprint(device_abilities)
+    cached_type = _lookup_cached_type(fingerprint)
+    if cached_type is not None:
+        _type_cache_stats._hits += 1
+    else:
+        _type_cache_stats._misses += 1
+        _LOGGER.debug(f"Could not find any cached type for the abilities of {http_device_info.device_type},"
                       f"{http_device_info.hdware_version},"
-                      f"{http_device_info.fmware_version}. It will be generated.")
-        device_type_name = _caclulate_device_type_name(http_device_info.device_type,
-                                                       http_device_info.hdware_version,
-                                                       http_device_info.fmware_version)
+                      f"{http_device_info.fmware_version} ({fingerprint}). It will be generated.")
 
         # Let's now pick the base class where to attach all the mixin.
         # We basically offer two possible base implementations:
@@ -192,10 +252,15 @@ def build_meross_device_from_abilities(http_device_info: HttpDeviceInfo,
                             f"Assuming this is a full-featured HUB.")
             base_class = HubDevice
 
+        # Devices of other types sharing the same abilities reuse the class, which keeps the name of the first one
+        device_type_name = _caclulate_device_type_name(http_device_info.device_type,
+                                                       http_device_info.hdware_version,
+                                                       http_device_info.fmware_version)
         cached_type = _build_cached_type(type_string=device_type_name,
                                          device_abilities=device_abilities,
-                                         base_class=base_class)
-        _dynamic_types[device_type_name] = cached_type
+                                         base_class=base_class,
+                                         fingerprint=fingerprint)
+        _dynamic_types[fingerprint] = cached_type
 
     #component = cached_type(device_uuid=http_device_info.uuid, manager=manager, **http_device_info.to_dict())
     component = cached_type(device_uuid=http_device_info.uuid, manager=manager, http_device_info=http_device_info)
@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta
+from typing import Dict
+
 
 class ErrorBudget:
     def __init__(self, initial_budget:int, window_start:datetime):
@@ -16,6 +18,7 @@ class ErrorBudgetManager:
         dev_budget = self._devices_budget.get(device_uuid)
         if dev_budget is None:
             dev_budget = ErrorBudget(self._max_errors, datetime.utcnow())
+            self._devices_budget[device_uuid] = dev_budget
 
         # Re-init the error budget if window expired
         if datetime.utcnow() > (dev_budget.window_start + self._window):
@@ -35,3 +38,14 @@ class ErrorBudgetManager:
         budget = self._get_update_budget_window(device_uuid)
         return budget.budget < 1
 
+    @property
+    def max_errors(self) -> int:
+        return self._max_errors
+
+    def get_budgets(self) -> Dict[str, int]:
+        """
+        Returns the remaining error budget of every device that reported an error
+        """
+        now = datetime.utcnow()
+        return {uuid: self._max_errors if now > (budget.window_start + self._window) else budget.budget
+                for uuid, budget in self._devices_budget.items()}
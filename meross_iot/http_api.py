@@ -2,7 +2,6 @@ from __future__ import annotations  # Needed for returning the same class type w
 
 import base64
 import hashlib
-import json
 import logging
 import os
 import platform
@@ -22,6 +21,8 @@ from meross_iot.model.http.error_codes import ErrorCodes
 from meross_iot.model.http.exception import TooManyTokensException, TokenExpiredException, AuthenticatedPostException, \
     HttpApiError, BadLoginException, BadDomainException, MissingMFA, WrongMFA
 from meross_iot.model.http.subdevice import HttpSubdeviceInfo
+from meross_iot.utilities.codec import json_dumps, json_loads
+from meross_iot.utilities.latency import LatencyRecorder, LatencyTransport
 from meross_iot.utilities.misc import current_version
 from meross_iot.utilities.stats import HttpStatsCounter
 
@@ -68,6 +69,7 @@ class MerossHttpClient(object):
         self._http_proxy = http_proxy
         self._ua_header = ua_header
         self._stats_counter = HttpStatsCounter()
+        self._latency_recorder = LatencyRecorder()
         self._log_identifier = log_identifier
         self._app_type = app_type
         self._app_version = app_version
@@ -78,6 +80,14 @@ class MerossHttpClient(object):
     def stats(self) -> HttpStatsCounter:
         return self._stats_counter
 
+    @property
+    def latency_stats(self) -> LatencyRecorder:
+        """
+        Round-trip latencies of the HTTP API requests (transport `LatencyTransport.HTTP_API`, keyed by URL).
+        The `MerossManager` relying on this client records the latencies of the device commands here too.
+        """
+        return self._latency_recorder
+
     @property
     def cloud_credentials(self) -> MerossCloudCreds:
         """
@@ -294,7 +304,8 @@ class MerossHttpClient(object):
                                         app_type: str = _DEFAULT_APP_TYPE,
                                         app_version: str = _MODULE_VERSION,
                                         ua_header: str = _DEFAULT_UA_HEADER,
-                                        stats_counter: HttpStatsCounter = None
+                                        stats_counter: HttpStatsCounter = None,
+                                        latency_recorder: LatencyRecorder = None
                                         ) -> dict:
         nonce = _generate_nonce(16)
         timestamp_millis = int(round(time.time() * 1000))
@@ -339,7 +350,13 @@ class MerossHttpClient(object):
 
         _LOGGER.debug(f"Performing HTTP request against {url}, headers: {headers}, post data: {payload}")
         async with ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers, proxy=http_proxy) as response:
+            start = time.monotonic()
+            async with session.post(url, data=json_dumps(payload), headers=headers, proxy=http_proxy) as response:
+                body = await response.read()
+                if latency_recorder is not None:
+                    latency_recorder.record(transport=LatencyTransport.HTTP_API,
+                                            namespace=url,
+                                            latency=time.monotonic() - start)
                 _LOGGER.debug(f"Response Status Code: {response.status}")
                 # Check if that is ok.
                 if response.status != 200:
@@ -351,7 +368,7 @@ class MerossHttpClient(object):
                     raise AuthenticatedPostException("Failed request to API. Response code: %s" % str(response.status))
 
                 # Save returned value
-                jsondata = await response.json()
+                jsondata = json_loads(body)
                 code = jsondata.get('apiStatus')
 
                 error = None
@@ -404,7 +421,8 @@ class MerossHttpClient(object):
                                                                   ua_header=self._ua_header,
                                                                   app_type=self._app_type,
                                                                   app_version=self._app_version,
-                                                                  stats_counter=self._stats_counter)
+                                                                  stats_counter=self._stats_counter,
+                                                                  latency_recorder=self._latency_recorder)
         self._cloud_creds = None
         _LOGGER.info("Logout succeeded.")
         return result
@@ -425,7 +443,8 @@ class MerossHttpClient(object):
                                                                   ua_header=self._ua_header,
                                                                   app_type=self._app_type,
                                                                   app_version=self._app_version,
-                                                                  stats_counter=self._stats_counter)
+                                                                  stats_counter=self._stats_counter,
+                                                                  latency_recorder=self._latency_recorder)
         return result
 
     @classmethod
@@ -481,7 +500,8 @@ class MerossHttpClient(object):
                                                                   ua_header=self._ua_header,
                                                                   app_type=self._app_type,
                                                                   app_version=self._app_version,
-                                                                  stats_counter=self._stats_counter)
+                                                                  stats_counter=self._stats_counter,
+                                                                  latency_recorder=self._latency_recorder)
         return [HttpDeviceInfo.from_dict(x) for x in result]
 
     async def async_list_hub_subdevices(self,
@@ -503,7 +523,8 @@ class MerossHttpClient(object):
                                                                   ua_header=self._ua_header,
                                                                   app_type=self._app_type,
                                                                   app_version=self._app_version,
-                                                                  stats_counter=self._stats_counter)
+                                                                  stats_counter=self._stats_counter,
+                                                                  latency_recorder=self._latency_recorder)
         return [HttpSubdeviceInfo.from_dict(x) for x in result]
 
     def set_http_proxy(self, proxy_url: str):
@@ -512,8 +533,7 @@ class MerossHttpClient(object):
 
 
 def _encode_params(parameters: dict):
-    jsonstring = json.dumps(parameters)
-    return str(base64.b64encode(jsonstring.encode("utf8")), "utf8")
+    return str(base64.b64encode(json_dumps(parameters)), "utf8")
 
 
 def _generate_nonce(length: int):
@@ -1,17 +1,18 @@
 import asyncio
+import concurrent.futures
+import functools
 import json
 import logging
-import random
 import ssl
-import string
 import sys
+import time
+import weakref
 from asyncio import Future, AbstractEventLoop
 from asyncio import TimeoutError
 from datetime import datetime
 from enum import Enum
-from hashlib import md5
-from time import time
-from typing import Optional, List, TypeVar, Iterable, Callable, Awaitable, Tuple, Union, Any
+from typing import Optional, List, TypeVar, Iterable, Callable, Awaitable, Tuple, Union, Any, Dict, AsyncIterator, \
+    Iterator
 
 import paho.mqtt.client as mqtt
 from aiohttp import ClientSession
@@ -29,14 +30,56 @@ from meross_iot.model.enums import Namespace, OnlineStatus
 from meross_iot.model.exception import (
     CommandTimeoutError,
     CommandError,
-    UnknownDeviceType
+    UnknownDeviceType,
+    RateLimitExceeded,
 )
 from meross_iot.model.http.device import HttpDeviceInfo
 from meross_iot.model.http.subdevice import HttpSubdeviceInfo
 from meross_iot.model.push.factory import parse_push_notification
 from meross_iot.model.push.generic import GenericPushNotification
-from meross_iot.model.push.online import OnlinePushNotification
+from meross_iot.model.push.online import ConnectionDropPushNotification, OnlinePushNotification
 from meross_iot.model.push.unbind import UnbindPushNotification
+from meross_iot.utilities.ability_cache import AbilityCache
+from meross_iot.utilities.asyncio_mqtt import AsyncioMqttSocketDriver
+from meross_iot.utilities.bulk import (
+    BulkCommandResult,
+    BulkConcurrencyLimiter,
+    DEFAULT_BULK_MAX_CONCURRENCY,
+    DEFAULT_BULK_MAX_CONCURRENCY_PER_BROKER,
+    DEFAULT_BULK_MAX_CONCURRENCY_PER_DEVICE,
+)
+from meross_iot.utilities.codec import json_loads
+from meross_iot.utilities.discovery import (
+    DiscoveryStats,
+    DEFAULT_DISCOVERY_MAX_CONCURRENCY,
+    DEFAULT_DISCOVERY_ABILITY_TIMEOUT,
+    DEFAULT_DISCOVERY_ABILITY_RETRIES,
+    DEFAULT_DISCOVERY_ABILITY_RETRY_DELAY,
+    PHASE_LIST_DEVICES,
+    PHASE_ENROLL_NEW_DEVICES,
+    PHASE_UPDATE_KNOWN_DEVICES,
+    PHASE_LIST_HUB_SUBDEVICES,
+    PHASE_UPDATE_HUBS,
+)
+from meross_iot.utilities.dispatcher import (
+    PushDispatcher,
+    PushHandlerStats,
+    PushCoalescingPolicy,
+    DEFAULT_LATEST_WINS_NAMESPACES,
+    push_payload_channels,
+    DEFAULT_PUSH_DISPATCH_MAX_CONCURRENCY,
+)
+from meross_iot.utilities.coalescing import CommandCoalescer
+from meross_iot.utilities.latency import LatencyRecorder, LatencyTransport
+from meross_iot.utilities.limiter import ApiRateLimiter, RateLimitDecision
+from meross_iot.utilities.ingest import BatchedIngestQueue, IngestQueueStats, DEFAULT_INGEST_MAX_BATCH_SIZE
+from meross_iot.utilities.pending import PendingCommandTable, DEFAULT_MAX_PENDING_COMMANDS
+from meross_iot.utilities.pool import (
+    MqttConnection,
+    MqttConnectionPool,
+    MqttConnectionStats,
+    DEFAULT_MQTT_CONNECTIONS_PER_BROKER,
+)
 from meross_iot.utilities.mqtt import (
     generate_mqtt_password,
     generate_client_and_app_id,
@@ -45,8 +88,22 @@ from meross_iot.utilities.mqtt import (
     verify_message_signature,
     device_uuid_from_push_notification,
     build_device_request_topic,
+    MqttMessageBuilder,
 )
 from meross_iot.utilities.network import extract_domain
+from meross_iot.utilities.resync import DeviceResyncJob, DEFAULT_RESYNC_MAX_CONCURRENCY
+from meross_iot.utilities.snapshot import (
+    encode_snapshot,
+    parse_device_info,
+    parse_subdevice_info,
+    read_snapshot,
+    restore_state,
+    snapshot_devices,
+    write_snapshot,
+)
+from meross_iot.utilities.stats import ApiCounter
+from meross_iot.utilities.tracing import trace_span, is_tracing_enabled, SPAN_EXECUTE_COMMAND, \
+    SPAN_SEND_AND_WAIT_ACK, SPAN_MQTT_MESSAGE, SPAN_DISPATCH_PUSH_NOTIFICATION
 
 logging.basicConfig(
     format="%(levelname)s:%(message)s", level=logging.INFO, stream=sys.stdout
@@ -54,6 +111,7 @@ logging.basicConfig(
 _LOGGER = logging.getLogger(__name__)
 
 _CONNECTION_DROP_UPDATE_SCHEDULE_INTERVAL = 2
+_LAN_HTTP_HEADERS = {"Content-Type": "application/json"}
 
 T = TypeVar("T", bound=BaseDevice)  # Declare type variable
 ManagerPushNotificationHandlerType = Callable[[GenericPushNotification, List[BaseDevice], 'MerossManager'], Awaitable]
@@ -61,6 +119,11 @@ ManagerPushNotificationHandlerType = Callable[[GenericPushNotification, List[Bas
 _PENDING_FUTURES = []
 
 
+# Kinds of messages moved from the mqtt network side to the event loop
+_INGEST_ACK = 0
+_INGEST_PUSH = 1
+
+
 def _mqtt_key_from_domain_port(domain: str, port: int) -> str:
     return f"{domain}:{port}"
 
@@ -71,6 +134,13 @@ class TransportMode(Enum):
     LAN_HTTP_FIRST_ONLY_GET = 2
 
 
+class MqttLoopMode(Enum):
+    THREADED = "THREADED"
+    """Every broker connection is served by its own paho network thread (loop_start)"""
+    ASYNCIO = "ASYNCIO"
+    """Broker sockets are driven by the manager's event loop: no network thread, no cross-thread hop"""
+
+
 class MqttConnectionStatus(Enum):
     DISCONNECTED = "DISCONNECTED"
     CONNECTING = "CONNECTING"
@@ -92,6 +162,20 @@ class MerossManager(object):
             loop: Optional[AbstractEventLoop] = None,
             mqtt_override_server: Optional[Tuple[str, int]] = None,
             auto_discovery_on_connection: bool = True,
+            mqtt_loop_mode: MqttLoopMode = MqttLoopMode.THREADED,
+            ingest_max_batch_size: int = DEFAULT_INGEST_MAX_BATCH_SIZE,
+            max_pending_commands: int = DEFAULT_MAX_PENDING_COMMANDS,
+            mqtt_connections_per_broker: int = DEFAULT_MQTT_CONNECTIONS_PER_BROKER,
+            coalesced_namespaces: Optional[Iterable[Union[Namespace, str]]] = None,
+            rate_limiter: Optional[ApiRateLimiter] = None,
+            resync_max_concurrency: int = DEFAULT_RESYNC_MAX_CONCURRENCY,
+            push_dispatch_max_concurrency: int = DEFAULT_PUSH_DISPATCH_MAX_CONCURRENCY,
+            push_handler_timeout: Optional[float] = None,
+            push_backlog_limit: Optional[int] = None,
+            push_coalescing_threshold: Optional[int] = None,
+            discovery_max_concurrency: int = DEFAULT_DISCOVERY_MAX_CONCURRENCY,
+            discovery_ability_timeout: float = DEFAULT_DISCOVERY_ABILITY_TIMEOUT,
+            ability_cache: Optional[AbilityCache] = None,
             *args,
             **kwords,
     ) -> None:
@@ -111,7 +195,57 @@ class MerossManager(object):
                                      obtained via HTTP API, and port 443 will be used.
         :param auto_discovery_on_connection: (Optional) When set instructs the manager to issue a discovery as soon as
                                              the mqtt connection is established against the MQTT broker (defaults to True)
+        :param mqtt_loop_mode: (Optional) Selects how the MQTT sockets are served. `MqttLoopMode.THREADED` (default)
+                               spawns a paho network thread per broker, while `MqttLoopMode.ASYNCIO` runs the sockets
+                               on the manager's event loop, so that ACKs and push notifications are handled without
+                               any cross-thread handoff.
+        :param ingest_max_batch_size: (Optional) Maximum number of received ACKs/push notifications processed by the
+                                      event loop in a single pass.
+        :param max_pending_commands: (Optional) Maximum number of commands that can wait for an ACK at the same time.
+                                     When reached, new commands fail with `TooManyPendingCommandsError`.
+        :param mqtt_connections_per_broker: (Optional) Number of MQTT connections opened against every broker.
+                                            Each connection uses its own app/client id and response topic, and
+                                            devices are assigned to a connection by a stable hash of their UUID.
+                                            Defaults to 1.
+        :param coalesced_namespaces: (Optional) Namespaces for which identical concurrent GET commands (same device,
+                                     namespace and payload) are coalesced: later callers wait for the result of
+                                     the command already in flight, instead of sending it again.
+                                     See `enable_get_coalescing()`.
+        :param rate_limiter: (Optional) Token-bucket limiter applied to the commands sent via MQTT, with global and
+                             per-device budgets. When None (default), commands are never throttled.
+        :param resync_max_concurrency: (Optional) Maximum number of devices refreshed at the same time after a
+                                       reconnection to the MQTT broker. Defaults to 20.
+        :param push_dispatch_max_concurrency: (Optional) Maximum number of devices whose push notifications are
+                                              dispatched at the same time. Push notifications of the same device
+                                              are always dispatched one at a time, in arrival order. Defaults to 50.
+        :param push_handler_timeout: (Optional) Seconds after which a manager-level push notification handler is
+                                     cancelled. Defaults to None: handlers are never cancelled.
+        :param push_backlog_limit: (Optional) Maximum number of received push notifications waiting to be
+                                   dispatched. When set, the overload mode is enabled: once the backlog exceeds
+                                   `push_coalescing_threshold`, push notifications of LATEST_WINS namespaces replace
+                                   the queued ones for the same device, namespace and channel, and once the backlog
+                                   is full, push notifications that cannot be coalesced are dropped.
+                                   See `set_push_coalescing_policy()`. Defaults to None (unbounded backlog).
+        :param push_coalescing_threshold: (Optional) Backlog size past which push notifications are coalesced.
+                                          Defaults to half of `push_backlog_limit`.
+        :param discovery_max_concurrency: (Optional) Maximum number of devices enrolled, updated or queried for their
+                                          subdevices at the same time during a discovery. Defaults to 20.
+        :param discovery_ability_timeout: (Optional) Seconds to wait for a newly discovered device to report its
+                                          abilities. Devices that do not answer in time are built from their known
+                                          type (when possible) and their abilities are fetched again in background.
+                                          Defaults to 3 seconds.
+        :param ability_cache: (Optional) Persistent cache of the device abilities. When set, discovered devices
+                              are built from the cached abilities, without querying them, and their abilities are
+                              refreshed in background when stale or when their firmware changes.
         """
+        if mqtt_connections_per_broker < 1:
+            raise ValueError("mqtt_connections_per_broker must be greater than zero")
+        if resync_max_concurrency < 1:
+            raise ValueError("resync_max_concurrency must be greater than zero")
+        if push_dispatch_max_concurrency < 1:
+            raise ValueError("push_dispatch_max_concurrency must be greater than zero")
+        if discovery_max_concurrency < 1:
+            raise ValueError("discovery_max_concurrency must be greater than zero")
 
         # Store local attributes
         self._http_client = http_client
@@ -119,17 +253,48 @@ class MerossManager(object):
         self._auto_reconnect = auto_reconnect
         self._ca_cert = ca_cert
         self._app_id, self._client_id = generate_client_and_app_id()
-        self._pending_messages_futures = {}
+        self._pending_commands = PendingCommandTable(max_pending=max_pending_commands)
+        self._command_coalescer = CommandCoalescer()
+        self._api_counter = ApiCounter()
+        # Latencies are recorded alongside the ones of the HTTP API, so that all the transports can be queried at once
+        self._latency_recorder = self._http_client.latency_stats
+        self._rate_limiter = rate_limiter
+        self._coalesced_namespaces = set()
+        for ns in coalesced_namespaces or ():
+            self.enable_get_coalescing(ns)
         self._device_registry = DeviceRegistry()
         self._push_coros = []
+        self._connection_drop_coros = []
         self._mqtt_skip_validation = mqtt_skip_cert_validation
-        self._mqtt_clients = {}
-        self._mqtt_connected_and_subscribed = {}
+        self._mqtt_pools = {}
+        self._mqtt_connections_by_client = {}
+        self._mqtt_connections_per_broker = mqtt_connections_per_broker
         self._auto_discovery_on_connection = auto_discovery_on_connection
+        self._mqtt_loop_mode = mqtt_loop_mode
 
         # By default, assume MQTT-Only transport mode
         self._default_transport_mode = TransportMode.MQTT_ONLY
         self._error_budget_manager = ErrorBudgetManager()
+        self._push_notification_counts: Dict[str, int] = {}
+        self._resync_max_concurrency = resync_max_concurrency
+        self._resync_job: Optional[DeviceResyncJob] = None
+        self._last_interaction: Dict[str, float] = {}
+        self._discovery_max_concurrency = discovery_max_concurrency
+        self._discovery_ability_timeout = discovery_ability_timeout
+        self._discovery_ability_retries = DEFAULT_DISCOVERY_ABILITY_RETRIES
+        self._discovery_ability_retry_delay = DEFAULT_DISCOVERY_ABILITY_RETRY_DELAY
+        self._ability_refresh_tasks: Dict[str, asyncio.Task] = {}
+        self._ability_refresh_semaphore: Optional[asyncio.Semaphore] = None
+        self._ability_cache = ability_cache
+        self._last_discovery_stats: Optional[DiscoveryStats] = None
+        self._push_coalescing_policies: Dict[str, PushCoalescingPolicy] = {
+            ns.value: PushCoalescingPolicy.LATEST_WINS for ns in DEFAULT_LATEST_WINS_NAMESPACES}
+        self._push_dispatcher = PushDispatcher(process=self._handle_and_dispatch_push_notification,
+                                               max_concurrency=push_dispatch_max_concurrency,
+                                               handler_timeout=push_handler_timeout,
+                                               max_backlog=push_backlog_limit,
+                                               coalescing_threshold=push_coalescing_threshold,
+                                               coalescing_key=self._push_coalescing_key)
 
         # Default proxy setup
         self._enable_proxy = False
@@ -140,6 +305,13 @@ class MerossManager(object):
         # Setup synchronization primitives
         self._mqtt_looper_task = None
         self._loop = asyncio.get_event_loop() if loop is None else loop
+        # Registry snapshots are encoded and written by a single thread, in the order they were requested
+        self._snapshot_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._last_snapshot_write: Optional[concurrent.futures.Future] = None
+        self._ingest_queue = BatchedIngestQueue(consumer=self._process_ingested_messages,
+                                                wake=self._wake_ingest,
+                                                reschedule=self._loop.call_soon,
+                                                max_batch_size=ingest_max_batch_size)
 
         # Prepare MQTT info
         self._mqtt_password = generate_mqtt_password(user_id=self._cloud_creds.user_id, key=self._cloud_creds.key)
@@ -147,6 +319,8 @@ class MerossManager(object):
             user_id=self._cloud_creds.user_id, app_id=self._app_id
         )
         self._user_topic = build_client_user_topic(user_id=self._cloud_creds.user_id)
+        self._inbound_routes = {}
+        self._message_builder = MqttMessageBuilder(from_topic=self._client_response_topic, key=self._cloud_creds.key)
         self._override_mqtt_server = mqtt_override_server
 
     @property
@@ -166,47 +340,289 @@ class MerossManager(object):
     def default_transport_mode(self, value: TransportMode) -> None:
         self._default_transport_mode = value
 
+    @property
+    def mqtt_loop_mode(self) -> MqttLoopMode:
+        """How the MQTT broker sockets are served (paho network threads or the manager's event loop)"""
+        return self._mqtt_loop_mode
+
+    @property
+    def mqtt_connections_per_broker(self) -> int:
+        """Number of MQTT connections opened against every broker"""
+        return self._mqtt_connections_per_broker
+
+    @property
+    def mqtt_connection_stats(self) -> List[MqttConnectionStats]:
+        """Per-connection counters (such as the number of in-flight commands) of all the MQTT connections"""
+        return [stat for pool in self._mqtt_pools.values() for stat in pool.stats()]
+
+    @property
+    def api_stats(self) -> ApiCounter:
+        """Counter of the commands sent, delayed and dropped (because of the rate limiter) via MQTT"""
+        return self._api_counter
+
+    @property
+    def latency_stats(self) -> LatencyRecorder:
+        """Round-trip latency histograms, by device UUID, namespace and transport (MQTT, LAN, HTTP API)"""
+        return self._latency_recorder
+
+    @property
+    def rate_limiter(self) -> Optional[ApiRateLimiter]:
+        """Rate limiter applied to the commands sent via MQTT, if any"""
+        return self._rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, value: Optional[ApiRateLimiter]) -> None:
+        self._rate_limiter = value
+
+    @property
+    def coalesced_namespaces(self) -> List[str]:
+        """Namespaces for which identical concurrent GET commands are coalesced by default"""
+        return sorted(self._coalesced_namespaces)
+
+    @property
+    def coalesced_requests(self) -> int:
+        """Number of GET commands that were not sent because an identical one was already in flight"""
+        return self._command_coalescer.saved_requests
+
+    def coalesced_requests_by_namespace(self) -> Dict[str, int]:
+        """Number of GET commands that were not sent because an identical one was already in flight, by namespace"""
+        return self._command_coalescer.saved_requests_by_namespace()
+
+    def enable_get_coalescing(self, namespace: Union[Namespace, str]) -> None:
+        """
+        Enables the coalescing of identical concurrent GET commands for the given namespace: while a GET command
+        is waiting for its ACK, identical ones (same device, namespace and payload) wait for the same response
+        instead of being sent again. Coalesced callers share the outcome (and the timeout) of the first command.
+        """
+        if not isinstance(namespace, Namespace) and not isinstance(namespace, str):
+            raise ValueError("Namespace parameter must be a Namespace enum or a string.")
+        self._coalesced_namespaces.add(namespace.value if isinstance(namespace, Namespace) else namespace)
+
+    def disable_get_coalescing(self, namespace: Union[Namespace, str]) -> None:
+        """Disables the coalescing of identical concurrent GET commands for the given namespace"""
+        self._coalesced_namespaces.discard(namespace.value if isinstance(namespace, Namespace) else namespace)
+
+    @property
+    def resync_job(self) -> Optional[DeviceResyncJob]:
+        """
+        Job refreshing the devices after the last reconnection to the MQTT broker (None if no resync happened yet).
+        It can be awaited to wait for the resync to complete and exposes its progress.
+        """
+        return self._resync_job
+
+    @property
+    def error_budget(self) -> ErrorBudgetManager:
+        """Budget of LAN errors tolerated per device, before falling back to MQTT only"""
+        return self._error_budget_manager
+
+    @property
+    def push_notification_stats(self) -> Dict[str, int]:
+        """Number of push notifications received since the manager was created, by namespace"""
+        return dict(self._push_notification_counts)
+
+    @property
+    def ability_cache(self) -> Optional[AbilityCache]:
+        """Persistent cache of the device abilities, if any"""
+        return self._ability_cache
+
+    @property
+    def last_discovery_stats(self) -> Optional[DiscoveryStats]:
+        """Timings and counters of the last completed device discovery"""
+        return self._last_discovery_stats
+
+    @property
+    def push_handler_stats(self) -> List[PushHandlerStats]:
+        """Execution counters (calls, errors, timeouts, timings) of the manager-level push notification handlers"""
+        return self._push_dispatcher.handler_stats()
+
+    @property
+    def push_dispatch_backlog(self) -> int:
+        """Number of received push notifications waiting to be dispatched"""
+        return self._push_dispatcher.backlog
+
+    @property
+    def push_dropped(self) -> int:
+        """Number of push notifications dropped because the push backlog was full"""
+        return self._push_dispatcher.dropped
+
+    @property
+    def push_coalesced(self) -> int:
+        """Number of queued push notifications superseded by a newer one for the same device/namespace/channel"""
+        return self._push_dispatcher.coalesced
+
+    def set_push_coalescing_policy(self, namespace: Union[Namespace, str], policy: PushCoalescingPolicy) -> None:
+        """
+        Sets how the push notifications of the given namespace are handled when the push backlog is overloaded.
+        With `LATEST_WINS`, a queued push notification is replaced by a newer one for the same device and channel;
+        with `KEEP_ALL`, every push notification is dispatched unless the backlog is full.
+        Namespaces that carry the whole state of a channel (toggles, lights, sensors, ...) default to `LATEST_WINS`,
+        all the other ones to `KEEP_ALL`.
+        """
+        self._push_coalescing_policies[namespace.value if isinstance(namespace, Namespace) else namespace] = policy
+
+    def get_push_coalescing_policy(self, namespace: Union[Namespace, str]) -> PushCoalescingPolicy:
+        return self._push_coalescing_policies.get(namespace.value if isinstance(namespace, Namespace) else namespace,
+                                                  PushCoalescingPolicy.KEEP_ALL)
+
+    def _push_coalescing_key(self, push_notification: GenericPushNotification) -> Optional[tuple]:
+        namespace = push_notification.namespace.value
+        if self._push_coalescing_policies.get(namespace) != PushCoalescingPolicy.LATEST_WINS:
+            return None
+        return namespace, push_payload_channels(push_notification.raw_data or {})
+
+    async def async_wait_push_dispatch(self) -> None:
+        """Waits until all the received push notifications have been dispatched"""
+        await self._push_dispatcher.async_join()
+
+    @property
+    def pending_commands(self) -> PendingCommandTable:
+        """Table of the commands waiting for an ACK, which also accounts late responses per device/namespace"""
+        return self._pending_commands
+
+    @property
+    def ingest_stats(self) -> IngestQueueStats:
+        """Counters of the queue that moves received ACKs and push notifications to the event loop"""
+        return self._ingest_queue.stats
+
+    @property
+    def ingest_max_batch_size(self) -> int:
+        """Maximum number of received messages processed by the event loop in a single pass"""
+        return self._ingest_queue.max_batch_size
+
+    @ingest_max_batch_size.setter
+    def ingest_max_batch_size(self, value: int) -> None:
+        self._ingest_queue.max_batch_size = value
+
+    def _call_in_loop(self, callback: Callable, *args) -> None:
+        """
+        Invokes the given callback within the event loop. When the MQTT sockets are driven by the event loop
+        itself, we are already running on the loop thread and the callback is invoked right away.
+        """
+        if self._mqtt_loop_mode == MqttLoopMode.ASYNCIO:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _wake_ingest(self, drain: Callable) -> None:
+        """
+        Schedules the drain of the ingest queue. Even when the MQTT sockets are driven by the event loop, the drain
+        runs in a later loop iteration, so that the messages read from all the ready sockets form a single batch.
+        """
+        if self._mqtt_loop_mode == MqttLoopMode.ASYNCIO:
+            self._loop.call_soon(drain)
+        else:
+            self._loop.call_soon_threadsafe(drain)
+
+    def _schedule_coroutine(self, coro: Awaitable) -> None:
+        """
+        Schedules the given coroutine for execution within the event loop, from either the paho network thread
+        or the event loop thread (depending on the mqtt loop mode).
+        """
+        if self._mqtt_loop_mode == MqttLoopMode.ASYNCIO:
+            self._loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, loop=self._loop)
+
     def _get_client_from_domain_port(self, client: mqtt.Client) -> Tuple[Optional[str], Optional[int]]:
-        for k, v in self._mqtt_clients.items():
-            if v == client:
-                domain, port = k.split(":")
-                return domain, int(port)
-        return None, None
+        connection = self._mqtt_connections_by_client.get(client)
+        if connection is None:
+            return None, None
+        domain, port = connection.broker.split(":")
+        return domain, int(port)
 
-    async def _async_get_create_mqtt_client(self, domain: str, port: int) -> mqtt.Client:
+    def _get_create_mqtt_pool(self, domain: str, port: int) -> MqttConnectionPool:
         """
-        Retrieves the mqtt_client for the given domain/port combination.
-        If not existing, a new one is created
+        Retrieves the pool of mqtt connections for the given domain/port combination.
+        If not existing, a new one is allocated (connections are not established yet).
         """
         dict_key = _mqtt_key_from_domain_port(domain=domain, port=port)
-        client = self._mqtt_clients.get(dict_key)
-        if client is not None:
-            _LOGGER.debug("MQTT Client for %s already available.", dict_key)
-        else:
-            _LOGGER.info("Allocating new mqtt client for %s...", dict_key)
-            client = self._new_mqtt_client()
-            client.user_data_set(dict_key)
+        pool = self._mqtt_pools.get(dict_key)
+        if pool is not None:
+            return pool
+
+        _LOGGER.info("Allocating %d mqtt client(s) for %s...", self._mqtt_connections_per_broker, dict_key)
+        connections = []
+        for index in range(self._mqtt_connections_per_broker):
+            # The first connection uses the manager identity, the others get an identity of their own, so that
+            # every connection receives its ACKs on a dedicated response topic.
+            if index == 0:
+                app_id, client_id = self._app_id, self._client_id
+                response_topic, message_builder = self._client_response_topic, self._message_builder
+            else:
+                app_id, client_id = generate_client_and_app_id()
+                response_topic = build_client_response_topic(user_id=self._cloud_creds.user_id, app_id=app_id)
+                message_builder = MqttMessageBuilder(from_topic=response_topic, key=self._cloud_creds.key)
+
+            client = self._new_mqtt_client(client_id=client_id)
+            connection = MqttConnection(broker=dict_key,
+                                        index=index,
+                                        client=client,
+                                        app_id=app_id,
+                                        client_id=client_id,
+                                        response_topic=response_topic,
+                                        message_builder=message_builder)
+            client.user_data_set(connection)
+            if self._mqtt_loop_mode == MqttLoopMode.ASYNCIO:
+                connection.driver = AsyncioMqttSocketDriver(client=client,
+                                                            loop=self._loop,
+                                                            auto_reconnect=self._auto_reconnect)
             if self._enable_proxy:
                 _LOGGER.info("Proxy configuration set for newly created client")
                 client.proxy_set(proxy_type=self._proxy_type, proxy_addr=self._proxy_addr, proxy_port=self._proxy_port)
-            self._mqtt_clients[dict_key] = client
-        # Init the client
-        if not client.is_connected():
-            conn_evt = self._mqtt_connected_and_subscribed.get(dict_key)  # type: asyncio.Event
-            if conn_evt is None:
-                conn_evt = asyncio.Event()
-                _LOGGER.debug("MQTT client connecting to %s:%d", domain, port)
-                client.connect(host=domain, port=port, keepalive=30)
-                self._mqtt_connected_and_subscribed[dict_key] = conn_evt
-            # Start the client looper
-            client.loop_start()
+            self._mqtt_connections_by_client[client] = connection
+            connections.append(connection)
+
+        pool = MqttConnectionPool(broker=dict_key, connections=connections)
+        self._mqtt_pools[dict_key] = pool
+        return pool
+
+    def _start_mqtt_connection(self, connection: MqttConnection, domain: str, port: int) -> asyncio.Event:
+        """
+        Starts connecting the given mqtt connection, if not already started, and returns the event
+        that is set as soon as the connection is established and subscribed.
+        """
+        if connection.connected_and_subscribed is None:
+            connection.connected_and_subscribed = asyncio.Event()
+            _LOGGER.debug("MQTT client %s connecting to %s:%d", connection, domain, port)
+            connection.client.connect(host=domain, port=port, keepalive=30)
+        # Start the client looper. In asyncio mode the socket is already registered to the event loop.
+        if self._mqtt_loop_mode == MqttLoopMode.THREADED:
+            connection.client.loop_start()
+        return connection.connected_and_subscribed
+
+    async def _async_get_create_mqtt_connection(self,
+                                                domain: str,
+                                                port: int,
+                                                device_uuid: Optional[str] = None) -> MqttConnection:
+        """
+        Retrieves the mqtt connection that serves the given device on the given domain/port broker,
+        connecting it when needed.
+        """
+        pool = self._get_create_mqtt_pool(domain=domain, port=port)
+        connection = pool.connection_for(device_uuid)
+
+        # Push notifications are only delivered to the first connection of the pool: make sure it's connected too
+        push_connection = pool.push_connection
+        if connection is not push_connection and not push_connection.client.is_connected():
+            self._start_mqtt_connection(push_connection, domain=domain, port=port)
+
+        if not connection.client.is_connected():
+            conn_evt = self._start_mqtt_connection(connection, domain=domain, port=port)
             # Wait for the client to connect
             await conn_evt.wait()
-        return client
+        return connection
+
+    async def _async_get_create_mqtt_client(self, domain: str, port: int) -> mqtt.Client:
+        """
+        Retrieves the mqtt_client for the given domain/port combination.
+        If not existing, a new one is created
+        """
+        connection = await self._async_get_create_mqtt_connection(domain=domain, port=port)
+        return connection.client
 
-    def _new_mqtt_client(self) -> mqtt.Client:
+    def _new_mqtt_client(self, client_id: str) -> mqtt.Client:
         # Setup mqtt client
-        client = mqtt.Client(client_id=self._client_id, protocol=mqtt.MQTTv311, clean_session=False)
+        client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311, clean_session=False)
         client.username_pw_set(username=self._cloud_creds.user_id, password=self._mqtt_password)
 
         # Certificate validation setup
@@ -233,7 +649,7 @@ class MerossManager(object):
     ) -> None:
         """
         Registers a coroutine so that it gets invoked whenever a push notification is received from the Meross
-        MQTT broker.
+        MQTT broker. Handlers are invoked concurrently: a slow handler does not delay the other ones.
         :param coro: coroutine-function: a function that, when invoked, returns a Coroutine object that can be awaited.
         :return:
         """
@@ -246,6 +662,48 @@ class MerossManager(object):
             return
         self._push_coros.append(coro)
 
+    def register_connection_drop_handler_coroutine(
+            self, coro: ManagerPushNotificationHandlerType
+    ) -> None:
+        """
+        Registers a coroutine so that it gets invoked once whenever the connection to an MQTT broker drops, with a
+        `ConnectionDropPushNotification` and the list of all the devices served by that broker. The devices also
+        emit their own ONLINE push notifications, delivered to the handlers registered via
+        `register_push_notification_handler_coroutine()`.
+        :param coro: coroutine-function: a function that, when invoked, returns a Coroutine object that can be awaited.
+        :return:
+        """
+        if not asyncio.iscoroutinefunction(coro):
+            raise ValueError("The coro parameter must be a coroutine function")
+        if coro in self._connection_drop_coros:
+            _LOGGER.error(f"Coroutine {coro} was already added to the connection drop handlers")
+            return
+        self._connection_drop_coros.append(coro)
+
+    def unregister_connection_drop_handler_coroutine(
+            self, coro: ManagerPushNotificationHandlerType
+    ) -> None:
+        """
+        Unregisters the connection drop handler
+        :param coro: coroutine-function previously registered via `register_connection_drop_handler_coroutine()`
+        :return:
+        """
+        if coro in self._connection_drop_coros:
+            self._connection_drop_coros.remove(coro)
+        else:
+            _LOGGER.error(f"Coroutine function {coro} was not registered as connection drop handler")
+
+    def set_push_notification_handler_timeout(
+            self, coro: ManagerPushNotificationHandlerType, timeout: Optional[float]
+    ) -> None:
+        """
+        Overrides the `push_handler_timeout` of the manager for the given push notification handler.
+        :param coro: push notification handler, registered via `register_push_notification_handler_coroutine()`
+        :param timeout: seconds after which the handler is cancelled, or None to never cancel it
+        :return:
+        """
+        self._push_dispatcher.set_handler_timeout(coro, timeout)
+
     def unregister_push_notification_handler_coroutine(
             self, coro: ManagerPushNotificationHandlerType
     ) -> None:
@@ -257,6 +715,7 @@ class MerossManager(object):
         """
         if coro in self._push_coros:
             self._push_coros.remove(coro)
+            self._push_dispatcher.remove_handler(coro)
         else:
             _LOGGER.error(
                 f"Coroutine function {coro} was not registered as handler for this device"
@@ -268,9 +727,26 @@ class MerossManager(object):
         for f in _PENDING_FUTURES:
             if not f.cancelled():
                 f.cancel()
+        self._pending_commands.cancel_all()
+        self._cancel_resync()
+        self._push_dispatcher.close()
+        for task in self._ability_refresh_tasks.values():
+            task.cancel()
+        if self._snapshot_executor is not None:
+            # Pending snapshots are written before returning
+            self._snapshot_executor.shutdown(wait=True)
+            self._snapshot_executor = None
+        if self._ability_cache is not None:
+            try:
+                self._ability_cache.save()
+            except Exception:
+                _LOGGER.exception("Error occurred while saving the ability cache")
         # Disconnect from all mqtt clients
-        for client in self._mqtt_clients.values():
-            client.disconnect()
+        for pool in self._mqtt_pools.values():
+            for connection in pool.connections:
+                if connection.driver is not None:
+                    connection.driver.stop()
+                connection.client.disconnect()
 
     def find_devices(
             self,
@@ -316,6 +792,31 @@ class MerossManager(object):
             online_status=online_status,
         )
 
+    def create_view(
+            self,
+            device_uuids: Optional[Iterable[str]] = None,
+            internal_ids: Optional[Iterable[str]] = None,
+            device_type: Optional[str] = None,
+            device_class: Optional[Union[type, Iterable[type]]] = None,
+            device_name: Optional[str] = None,
+            online_status: Optional[OnlineStatus] = None,
+    ) -> "DeviceView":
+        """
+        Returns a live view of the devices matching the given filters, which accept the same values of
+        `find_devices()`. The view is kept up to date as devices are discovered, removed or change their
+        online status, so it can be read repeatedly at no cost. Use `DeviceView.register_added_callback()`
+        and `DeviceView.register_removed_callback()` to react to membership changes, and `DeviceView.close()`
+        when the view is no longer needed.
+        """
+        return self._device_registry.create_view(
+            device_uuids=device_uuids,
+            internal_ids=internal_ids,
+            device_type=device_type,
+            device_class=device_class,
+            device_name=device_name,
+            online_status=online_status,
+        )
+
     async def async_device_discovery(
             self,
             update_subdevice_status: bool = True,
@@ -338,9 +839,70 @@ class MerossManager(object):
 
         :return: A list of discovered device, which implement `BaseDevice`
         """
+        return await self._async_run_discovery(update_subdevice_status=update_subdevice_status,
+                                               meross_device_uuid=meross_device_uuid,
+                                               cached_http_device_list=cached_http_device_list)
+
+    async def async_iter_discovery(
+            self,
+            update_subdevice_status: bool = True,
+            meross_device_uuid: str = None,
+            cached_http_device_list: Optional[Iterable[HttpDeviceInfo]] = None
+    ) -> AsyncIterator[BaseDevice]:
+        """
+        Streaming variant of `async_device_discovery()`: devices (hub subdevices included) are yielded as soon as
+        they are built and enrolled, so that they can be used while the discovery of the other ones is still
+        in progress. Subdevices are yielded before their hub status is updated, so their online status might
+        still be UNKNOWN.
+        If the caller stops iterating early, the discovery is cancelled as soon as the iterator is closed (e.g. via
+        `aclose()`, or when it is garbage collected): only the devices yielded so far are enrolled.
+        Parameters have the same meaning as the ones of `async_device_discovery()`.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(self._async_run_discovery(update_subdevice_status=update_subdevice_status,
+                                                               meross_device_uuid=meross_device_uuid,
+                                                               cached_http_device_list=cached_http_device_list,
+                                                               on_device=queue.put_nowait))
+        # Wake up the consumer when the discovery ends, even if no device is enrolled
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        completed = False
+        try:
+            while True:
+                device = await queue.get()
+                if device is None:
+                    break
+                yield device
+            completed = True
+        finally:
+            if not completed:
+                # The caller stopped iterating (or was cancelled): stop the discovery too
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    _LOGGER.exception("Device discovery failed after the caller stopped iterating")
+        # Propagate the discovery errors, if any
+        task.result()
+
+    async def _async_run_discovery(
+            self,
+            update_subdevice_status: bool = True,
+            meross_device_uuid: str = None,
+            cached_http_device_list: Optional[Iterable[HttpDeviceInfo]] = None,
+            on_device: Optional[Callable[[BaseDevice], None]] = None
+    ) -> List[BaseDevice]:
+        """
+        Runs a device discovery. Every device goes through its own pipeline (enrollment or update, then subdevice
+        listing and status update for hubs), so that a slow device only delays itself. The given callback,
+        if any, is invoked as soon as each device is enrolled.
+        """
+        stats = DiscoveryStats()
         if cached_http_device_list is None:
             _LOGGER.info(f"\n\n------- Triggering Manager Discovery, filter_device: [{meross_device_uuid}] -------")
-            http_devices = await self._http_client.async_list_devices()
+            with stats.phase(PHASE_LIST_DEVICES):
+                http_devices = await self._http_client.async_list_devices()
         else:
             _LOGGER.info(
                 f"\n\n------- Triggering Manager Discovery (using cached http device list), filter_device: [{meross_device_uuid}] -------")
@@ -369,15 +931,6 @@ class MerossManager(object):
         _LOGGER.debug(
             f"The following devices are new to me: {discovered_new_http_devices}"
         )
-
-        enrolled_devices = []
-        for d in discovered_new_http_devices:
-            dev = await self._async_enroll_new_http_dev(d)
-            enrolled_devices.append(dev)
-        for hdevice, ldevice in already_known_http_devices.items():
-            dev = await ldevice.update_from_http_state(hdevice)
-            enrolled_devices.append(dev)
-
         _LOGGER.debug(
             f"Updating %d known devices form HTTPINFO and fetching "
             f"data from %d newly discovered devices...",
@@ -385,34 +938,88 @@ class MerossManager(object):
             len(discovered_new_http_devices)
         )
 
-        _LOGGER.info(f"Fetch and update done")
-
-        hubs = []
-        enrolled_subdevices = []
-        for d in enrolled_devices:
-            if isinstance(d, HubDevice):
-                hubs.append(d)
-                subdevs = await self._http_client.async_list_hub_subdevices(
-                    hub_id=d.uuid
-                )
-                for sd in subdevs:
-                    dev = await self._async_enroll_new_http_subdev(
-                        subdevice_info=sd,
-                        hub=d,
-                        hub_reported_abilities=d.abilities)
-                    enrolled_subdevices.append(dev)
-
-        # We need to update the state of hubs in order to refresh subdevices online status
-        if update_subdevice_status:
-            for h in hubs:
-                await h.async_update(drop_on_overquota=False)
-        _LOGGER.info(f"\n------- Manager Discovery ended -------\n")
+        # All the phases share the same concurrency budget, so that a slow device only holds one slot
+        semaphore = asyncio.Semaphore(self._discovery_max_concurrency)
+
+        async def _bounded(phase: str, coro_fn: Callable[[], Awaitable], description: str):
+            async with semaphore:
+                # The time spent waiting for a slot is not accounted to the phase
+                with stats.phase(phase):
+                    try:
+                        return await coro_fn()
+                    except Exception:
+                        stats.failed_devices += 1
+                        _LOGGER.exception(f"Error occurred while {description}")
+                        return None
+
+        async def _hub_pipeline(hub: HubDevice) -> List[GenericSubDevice]:
+            subdevices = await _bounded(PHASE_LIST_HUB_SUBDEVICES,
+                                        functools.partial(self._async_enroll_hub_subdevices, hub),
+                                        f"enrolling subdevices of hub {hub.uuid}")
+            subdevices = subdevices or []
+            stats.subdevices += len(subdevices)
+            if on_device is not None:
+                for sd in subdevices:
+                    on_device(sd)
+            # We need to update the state of hubs in order to refresh subdevices online status
+            if update_subdevice_status:
+                await _bounded(PHASE_UPDATE_HUBS, functools.partial(hub.async_update, drop_on_overquota=False),
+                               f"updating hub {hub.uuid}")
+            return subdevices
+
+        async def _device_pipeline(phase: str, coro_fn: Callable[[], Awaitable], description: str) \
+                -> Tuple[Optional[BaseDevice], List[GenericSubDevice]]:
+            device = await _bounded(phase, coro_fn, description)
+            if device is None:
+                return None, []
+            if on_device is not None:
+                on_device(device)
+            if isinstance(device, HubDevice):
+                return device, await _hub_pipeline(device)
+            return device, []
+
+        new_results, known_results = await asyncio.gather(
+            asyncio.gather(*(_device_pipeline(PHASE_ENROLL_NEW_DEVICES,
+                                              functools.partial(self._async_enroll_new_http_dev, d,
+                                                                ability_timeout=self._discovery_ability_timeout,
+                                                                retry_on_timeout=True,
+                                                                stats=stats),
+                                              f"enrolling device {d.uuid}")
+                             for d in discovered_new_http_devices)),
+            asyncio.gather(*(_device_pipeline(PHASE_UPDATE_KNOWN_DEVICES,
+                                              functools.partial(self._async_update_known_device, ldevice, hdevice),
+                                              f"updating device {ldevice.uuid}")
+                             for hdevice, ldevice in already_known_http_devices.items())))
+        new_devices = [d for d, _ in new_results if d is not None]
+        known_devices = [d for d, _ in known_results if d is not None]
+        stats.new_devices = len(new_devices)
+        stats.known_devices = len(known_devices)
+        enrolled_devices = new_devices + known_devices
+        enrolled_subdevices = [sd for _, subdevices in new_results + known_results for sd in subdevices]
+        await self._async_save_ability_cache()
+        stats.finish()
+        self._last_discovery_stats = stats
+        _LOGGER.info(f"\n------- Manager Discovery ended: {stats} -------\n")
 
         res = []
         res.extend(enrolled_devices)
         res.extend(enrolled_subdevices)
         return res
 
+    async def _async_enroll_hub_subdevices(self, hub: HubDevice) -> List[GenericSubDevice]:
+        """
+        Lists the subdevices of the given hub via the HTTP API and enrolls them
+        """
+        subdevs = await self._http_client.async_list_hub_subdevices(hub_id=hub.uuid)
+        enrolled_subdevices = []
+        for sd in subdevs:
+            dev = await self._async_enroll_new_http_subdev(
+                subdevice_info=sd,
+                hub=hub,
+                hub_reported_abilities=hub.abilities)
+            enrolled_subdevices.append(dev)
+        return enrolled_subdevices
+
     async def _async_enroll_new_http_subdev(
             self,
             subdevice_info: HttpSubdeviceInfo,
@@ -442,24 +1049,43 @@ class MerossManager(object):
         """
         pass
 
+    async def _async_fetch_abilities(self, device_info: HttpDeviceInfo, timeout: float) -> Optional[dict]:
+        res_abilities = await self.async_execute_cmd(
+            destination_device_uuid=device_info.uuid,
+            method="GET",
+            namespace=Namespace.SYSTEM_ABILITY,
+            payload={},
+            mqtt_hostname=extract_domain(device_info.domain),
+            mqtt_port=DEFAULT_MQTT_PORT,
+            timeout=timeout,
+            drop_on_overquota=False
+        )
+        return res_abilities.get("ability")
+
     async def _async_enroll_new_http_dev(
-            self, device_info: HttpDeviceInfo
+            self,
+            device_info: HttpDeviceInfo,
+            ability_timeout: float = DEFAULT_COMMAND_TIMEOUT,
+            retry_on_timeout: bool = False,
+            stats: Optional[DiscoveryStats] = None
     ) -> Optional[BaseDevice]:
-        # If the device is online, try to query the device for its abilities.
         device = None
         abilities = None
-        if device_info.online_status == OnlineStatus.ONLINE:
+        timed_out = False
+        cached_abilities = self._ability_cache.get(device_info) if self._ability_cache is not None else None
+        if cached_abilities is not None:
+            # Build the device straight away: its abilities are refreshed in background, when stale
+            abilities = cached_abilities
+            if stats is not None:
+                stats.cached_abilities += 1
+        # If the device is online, try to query the device for its abilities.
+        elif device_info.online_status == OnlineStatus.ONLINE:
             try:
-                res_abilities = await self.async_execute_cmd(
-                    destination_device_uuid=device_info.uuid,
-                    method="GET",
-                    namespace=Namespace.SYSTEM_ABILITY,
-                    payload={},
-                    mqtt_hostname=extract_domain(device_info.domain),
-                    mqtt_port=DEFAULT_MQTT_PORT
-                )
-                abilities = res_abilities.get("ability")
+                abilities = await self._async_fetch_abilities(device_info, timeout=ability_timeout)
+                if abilities is not None and self._ability_cache is not None:
+                    self._ability_cache.put(device_info, abilities)
             except CommandTimeoutError:
+                timed_out = True
                 _LOGGER.warning(
                     f"Device %s (%s) is online, but timeout occurred "
                     f"when fetching its abilities. ", str(device_info.dev_name), str(device_info.uuid)
@@ -488,12 +1114,121 @@ class MerossManager(object):
         # Enroll the device
         if device is not None:
             self._device_registry.enroll_device(device)
-            return device
 
-    def _on_connect(self, client: mqtt.Client, userdata, rc, other):
-        # NOTE! This method is called by the paho-mqtt thread, thus any invocation to the
-        # asyncio platform must be scheduled via `self._loop.call_soon_threadsafe()` method.
-        topics = [(self._user_topic, 1), (self._client_response_topic, 1)]
+        if timed_out:
+            if stats is not None:
+                stats.ability_timeouts += 1
+            if retry_on_timeout:
+                self._schedule_ability_refresh(device_info=device_info,
+                                               current_device=device,
+                                               delay=self._discovery_ability_retry_delay)
+        elif cached_abilities is not None and device_info.online_status == OnlineStatus.ONLINE \
+                and self._ability_cache.is_stale(device_info):
+            self._schedule_ability_refresh(device_info=device_info, current_device=device, delay=0)
+        return device
+
+    async def _async_update_known_device(self, device: BaseDevice, device_info: HttpDeviceInfo) -> BaseDevice:
+        previous_versions = (device.hardware_version, device.firmware_version)
+        device = await device.update_from_http_state(device_info)
+        if self._ability_cache is not None \
+                and previous_versions != (device_info.hdware_version, device_info.fmware_version):
+            # A firmware upgrade might have changed the abilities: the override of this device (if any) no longer
+            # applies, and the abilities are fetched again.
+            _LOGGER.info("Device %s (%s) changed its firmware version from %s to %s, refreshing its abilities",
+                         device.name, device.uuid, previous_versions[1], device_info.fmware_version)
+            self._ability_cache.invalidate_device(device.uuid)
+            self._schedule_ability_refresh(device_info=device_info, current_device=device, delay=0)
+        return device
+
+    def _schedule_ability_refresh(self,
+                                  device_info: HttpDeviceInfo,
+                                  current_device: Optional[BaseDevice],
+                                  delay: float) -> None:
+        task = self._ability_refresh_tasks.get(device_info.uuid)
+        if task is not None and not task.done():
+            return
+        self._ability_refresh_tasks[device_info.uuid] = asyncio.ensure_future(
+            self._async_refresh_abilities(device_info=device_info, current_device=current_device, delay=delay))
+
+    async def _async_refresh_abilities(self,
+                                       device_info: HttpDeviceInfo,
+                                       current_device: Optional[BaseDevice],
+                                       delay: float) -> None:
+        """
+        Fetches, in background and with the default command timeout, the abilities of a device that did not report
+        them in time during the discovery, or that was built from stale cached abilities. When the abilities differ
+        from the ones of the current device (or no device could be built), the device is enrolled again.
+        """
+        if self._ability_refresh_semaphore is None:
+            self._ability_refresh_semaphore = asyncio.Semaphore(self._discovery_max_concurrency)
+        cancelled = False
+        try:
+            for attempt in range(self._discovery_ability_retries):
+                await asyncio.sleep(delay if attempt == 0 else self._discovery_ability_retry_delay * (2 ** attempt))
+                try:
+                    async with self._ability_refresh_semaphore:
+                        abilities = await self._async_fetch_abilities(device_info, timeout=DEFAULT_COMMAND_TIMEOUT)
+                except CommandTimeoutError:
+                    _LOGGER.debug("Device %s (%s) did not report its abilities (attempt %d)",
+                                  device_info.dev_name, device_info.uuid, attempt + 1)
+                    continue
+                if abilities is None:
+                    return
+                if self._ability_cache is not None:
+                    self._ability_cache.put(device_info, abilities)
+                if self._device_registry.lookup_base_by_uuid(device_info.uuid) is not current_device:
+                    # The device has been enrolled (e.g. by a later discovery) or removed meanwhile
+                    return
+                if current_device is not None and current_device.abilities == abilities:
+                    return
+                device = build_meross_device_from_abilities(
+                    http_device_info=device_info, device_abilities=abilities, manager=self
+                )
+                if current_device is not None:
+                    for d in self._device_registry.find_all_by(device_uuids=(device_info.uuid,)):
+                        self._device_registry.relinquish_device(d.internal_id)
+                self._device_registry.enroll_device(device)
+                _LOGGER.info("Device %s (%s) reported its abilities and has been enrolled",
+                             device_info.dev_name, device_info.uuid)
+                if isinstance(device, HubDevice):
+                    await self._async_enroll_hub_subdevices(device)
+                    await device.async_update(drop_on_overquota=False)
+                return
+            _LOGGER.warning("Device %s (%s) did not report its abilities after %d attempts",
+                            device_info.dev_name, device_info.uuid, self._discovery_ability_retries)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception:
+            _LOGGER.exception(f"Error occurred while refreshing the abilities of device {device_info.uuid}")
+        finally:
+            if self._ability_refresh_tasks.get(device_info.uuid) is asyncio.current_task():
+                del self._ability_refresh_tasks[device_info.uuid]
+            # Persist the refreshed abilities once all the pending refreshes are over
+            if not cancelled and not self._ability_refresh_tasks:
+                await self._async_save_ability_cache()
+
+    async def _async_save_ability_cache(self) -> None:
+        if self._ability_cache is None:
+            return
+        try:
+            await self._ability_cache.async_save()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _LOGGER.exception("Error occurred while saving the ability cache")
+
+    def _on_connect(self, client: mqtt.Client, userdata: MqttConnection, rc, other):
+        # NOTE! This method is called by the paho-mqtt thread (unless running in asyncio loop mode), thus any
+        # invocation to the asyncio platform must be scheduled via `self._call_in_loop()` method.
+        if userdata.driver is not None:
+            userdata.driver.notify_connected()
+        self._register_inbound_routes(userdata.response_topic)
+        topics = [(userdata.response_topic, 1)]
+        # Only one connection per broker subscribes to the user topic, otherwise push notifications
+        # would be received multiple times.
+        if userdata.receives_push_notifications:
+            topics.insert(0, (self._user_topic, 1))
 
         _LOGGER.debug(f"Connected with result code {rc}")
         # Subscribe to the relevant topics
@@ -503,74 +1238,94 @@ class MerossManager(object):
         if result != mqtt.MQTT_ERR_SUCCESS:
             _LOGGER.error("Failed to subscribe to topics %s", str(topics))
 
-    def _on_disconnect(self, client: mqtt.Client, userdata, rc):
-        # NOTE! This method is called by the paho-mqtt thread, thus any invocation to the
-        # asyncio platform must be scheduled via `self._loop.call_soon_threadsafe()` method.
-        _LOGGER.info("Disconnection detected. Reason: %s" % str(rc))
+    def _on_disconnect(self, client: mqtt.Client, userdata: MqttConnection, rc):
+        # NOTE! This method is called by the paho-mqtt thread (unless running in asyncio loop mode), thus any
+        # invocation to the asyncio platform must be scheduled via `self._call_in_loop()` method.
+        _LOGGER.info("Disconnection detected on %s. Reason: %s", userdata, str(rc))
 
-        # When a disconnection occurs, we need to set "unavailable" status.
-        asyncio.run_coroutine_threadsafe(
-            self._notify_connection_drop(), loop=self._loop
-        )
+        # When the connection receiving push notifications drops, we need to set "unavailable" status.
+        if userdata.receives_push_notifications:
+            self._call_in_loop(self._cancel_resync)
+            self._schedule_coroutine(self._notify_connection_drop(userdata.broker))
 
-        conn_evt = self._mqtt_connected_and_subscribed.get(userdata) # type: asyncio.Event
-        conn_evt.clear()
+        userdata.connected_and_subscribed.clear()
+
+        if userdata.driver is not None:
+            userdata.driver.notify_disconnected(rc)
 
     def _on_unsubscribe(self):
-        # NOTE! This method is called by the paho-mqtt thread, thus any invocation to the
-        # asyncio platform must be scheduled via `self._loop.call_soon_threadsafe()` method.
+        # NOTE! This method is called by the paho-mqtt thread (unless running in asyncio loop mode), thus any
+        # invocation to the asyncio platform must be scheduled via `self._call_in_loop()` method.
         _LOGGER.debug("Unsubscribed from topics")
 
-    def _on_subscribe(self, client: mqtt.Client, userdata, mid, granted_qos):
-        # NOTE! This method is called by the paho-mqtt thread, thus any invocation to the
-        # asyncio platform must be scheduled via `self._loop.call_soon_threadsafe()` method.
+    def _on_subscribe(self, client: mqtt.Client, userdata: MqttConnection, mid, granted_qos):
+        # NOTE! This method is called by the paho-mqtt thread (unless running in asyncio loop mode), thus any
+        # invocation to the asyncio platform must be scheduled via `self._call_in_loop()` method.
         _LOGGER.debug("Successfully subscribed to topics.")
-        sub_event = self._mqtt_connected_and_subscribed.get(userdata)
-        self._loop.call_soon_threadsafe(sub_event.set)
+        self._call_in_loop(userdata.connected_and_subscribed.set)
+
+        # Devices state is refreshed once per broker, when the connection receiving push notifications is up
+        if not userdata.receives_push_notifications:
+            return
 
         # When the connection happens after a disconnection (i.e. it is a re-connection)
         # we need to trigger Online Events for devices which where offline before.
-        # Also, we want to update entirely the device status
-        # To avoid flooding, schedule updates every 2s intervals.
+        # Also, we want to update entirely the device status.
         _LOGGER.info(
             "Subscribed to topics, scheduling state update for already known devices."
         )
 
-        async def _update_devices_after_reconnection():
-            # In case of reconnections, we need to issue a device_discovery via HTTP in order to update
-            # ONLINE state. We also need to manually trigger "ONLINE" events for devices that resulted to be
-            # OFFLINE and went ONLINE while our manager was off-network. To do so, we store into a dict the previous
-            # online state and then issue the update only for devices that changed their state
-
-            # Store the previous connection state for all known devices
-            _prev_online_status = {d.uuid: d.online_status for d in self.find_devices()}
-
-            # Issue a new discovery to update their connection status. This will rely on HTTP api to update it
-            await self.async_device_discovery(update_subdevice_status=True)
-
-            i = 0
-            for d in self.find_devices():
-                old_status = _prev_online_status.get(d.uuid)
-                if old_status is None:
-                    # This is a new device that has been added while we were offline.
-                    _LOGGER.warning("Found a new device %s that has become online while we were offline.", d)
-                    # TODO: do we need to issue a BINDING event manually here?
-                    continue
-                else:
-                    _schedule_later(self._update_and_send_push(dev=d, old_status=old_status), start_delay=i,
-                                    loop=self._loop)
-                    i += 1
-
         # If a connection drop occurs, we must update the device state in order to be consistent
         # TODO: Do we need to issue this command only when connection drops occur or also at first connection attempt?
         if self._auto_discovery_on_connection:
-            asyncio.run_coroutine_threadsafe(coro=_update_devices_after_reconnection(), loop=self._loop)
+            self._call_in_loop(self._start_resync)
+
+    def _start_resync(self) -> None:
+        # A new resync supersedes the one that might still be running
+        self._cancel_resync()
+        job = DeviceResyncJob(max_concurrency=self._resync_max_concurrency)
+        self._resync_job = job
+        job.start(self._async_update_devices_after_reconnection(job))
+
+    def _cancel_resync(self) -> None:
+        if self._resync_job is not None:
+            self._resync_job.cancel()
+
+    async def _async_update_devices_after_reconnection(self, job: DeviceResyncJob) -> None:
+        # In case of reconnections, we need to issue a device_discovery via HTTP in order to update
+        # ONLINE state. We also need to manually trigger "ONLINE" events for devices that resulted to be
+        # OFFLINE and went ONLINE while our manager was off-network. To do so, we store into a dict the previous
+        # online state and then issue the update only for devices that changed their state
+
+        # Store the previous connection state for all known devices
+        _prev_online_status = {d.uuid: d.online_status for d in self.find_devices()}
+
+        # Issue a new discovery to update their connection status. This will rely on HTTP api to update it
+        await self.async_device_discovery(update_subdevice_status=True)
+
+        devices = []
+        for d in self.find_devices():
+            old_status = _prev_online_status.get(d.uuid)
+            if old_status is None:
+                # This is a new device that has been added while we were offline.
+                _LOGGER.warning("Found a new device %s that has become online while we were offline.", d)
+                # TODO: do we need to issue a BINDING event manually here?
+                continue
+            devices.append((d, old_status))
+
+        # Devices that changed their online status come first, then the most recently used ones.
+        # Refresh commands are subject to the rate limiter (if any), which delays them when over budget.
+        devices.sort(key=lambda item: (item[0].online_status == item[1],
+                                       -self._last_interaction.get(item[0].uuid, 0.0)))
+        await job.async_refresh([(d.uuid, functools.partial(self._update_and_send_push, dev=d, old_status=old_status))
+                                 for d, old_status in devices])
+        _LOGGER.info("Device resync completed: %s", job.progress)
 
     async def _update_and_send_push(self, dev: BaseDevice, old_status: OnlineStatus) -> None:
         if dev.online_status == OnlineStatus.ONLINE:
             # In case the device was known and is ONLINE, we want to manually update its status
             _LOGGER.warning("Updating status for device %s", dev)
-            await dev.async_update()
+            await dev.async_update(drop_on_overquota=False)
 
         # In case the device was known and is not ONLINE, we just send the ONLINE push notification
         if dev.online_status != old_status:
@@ -579,110 +1334,114 @@ class MerossManager(object):
             await dev.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
                                                      data={'online': {'status': dev.online_status.value}})
 
+    def _register_inbound_routes(self, response_topic: str) -> None:
+        """
+        Populates the table that routes inbound messages to their handler, given their destination topic and method.
+        Based on the network capture of Meross Devices, we know that there are 4 kinds of messages:
+        1. COMMANDS sent from the app to the device (/appliance/<uuid>/subscribe) topic.
+           Such commands have "from" header populated with "/app/<userid>-<appuuid>/subscribe" as that tells the
+           device where to send its command ACK. Valid methods are GET/SET
+        2. COMMAND-ACKS, which are sent back from the device to the app requesting the command execution on the
+           "/app/<userid>-<appuuid>/subscribe" topic. Valid methods are GETACK/SETACK/ERROR
+        3. PUSH notifications, which are sent to the "/app/46884/subscribe" topic from the device (which populates
+           the from header with its topic /appliance/<uuid>/subscribe). In this case, only the PUSH
+           method is allowed.
+        Case 1 is not of our interest, as we don't want to get notified when the device receives the command.
+        Instead we care about case 2 to acknowledge commands from devices and case 3, triggered when another app
+        has successfully changed the state of some device on the network.
+        """
+        routes = dict(self._inbound_routes)
+        for method in ("SETACK", "GETACK", "ERROR"):
+            routes[(response_topic, method)] = self._handle_command_ack_message
+        routes[(self._user_topic, "PUSH")] = self._handle_push_notification_message
+        # Swap the whole table, so that paho threads never observe a partially updated dictionary
+        self._inbound_routes = routes
+
     def _on_message(self, client, userdata, msg):
-        # NOTE! This method is called by the paho-mqtt thread, thus any invocation to the
-        # asyncio platform must be scheduled via `self._loop.call_soon_threadsafe()` method.
-        _LOGGER.debug(f"Received message from topic {msg.topic}: {str(msg.payload)}")
-
-        # In order to correctly dispatch a message, we should look at:
-        # - message destination topic
-        # - message methods
-        # - source device (from value in header)
-        # Based on the network capture of Meross Devices, we know that there are 4 kinds of messages:
-        # 1. COMMANDS sent from the app to the device (/appliance/<uuid>/subscribe) topic.
-        #    Such commands have "from" header populated with "/app/<userid>-<appuuid>/subscribe" as that tells the
-        #    device where to send its command ACK. Valid methods are GET/SET
-        # 2. COMMAND-ACKS, which are sent back from the device to the app requesting the command execution on the
-        #    "/app/<userid>-<appuuid>/subscribe" topic. Valid methods are GETACK/SETACK/ERROR
-        # 3. PUSH notifications, which are sent to the "/app/46884/subscribe" topic from the device (which populates
-        #    the from header with its topic /appliance/<uuid>/subscribe). In this case, only the PUSH
-        #    method is allowed.
-        # Case 1 is not of our interest, as we don't want to get notified when the device receives the command.
-        # Instead we care about case 2 to acknowledge commands from devices and case 3, triggered when another app
-        # has successfully changed the state of some device on the network.
-
-        # Let's parse the message
-        message = json.loads(str(msg.payload, "utf8"))
-        header = message["header"]
-        if not verify_message_signature(header, self._cloud_creds.key):
-            _LOGGER.error(
-                f"Invalid signature received. Message will be discarded. Message: {msg.payload}"
-            )
+        # NOTE! This method is called by the paho-mqtt thread (unless running in asyncio loop mode), thus any
+        # invocation to the asyncio platform must be scheduled via `self._call_in_loop()` method.
+        with trace_span(SPAN_MQTT_MESSAGE) as span:
+            debug = _LOGGER.isEnabledFor(logging.DEBUG)
+            if debug:
+                _LOGGER.debug("Received message from topic %s: %s", msg.topic, msg.payload)
+
+            # Let's parse the message
+            message = json_loads(msg.payload)
+            header = message["header"]
+            span.set_attribute("meross.topic", msg.topic)
+            span.set_attribute("meross.method", header.get("method"))
+            span.set_attribute("meross.namespace", header.get("namespace"))
+            if not verify_message_signature(header, self._cloud_creds.key):
+                _LOGGER.error("Invalid signature received. Message will be discarded. Message: %s", msg.payload)
+                return
+
+            if debug:
+                _LOGGER.debug("Message signature OK")
+
+            # Dispatch the message, looking at its destination topic and method.
+            # We don't check the source topic address, as we trust it's originated by a device on this network.
+            handler = self._inbound_routes.get((msg.topic, header.get("method")))
+            if handler is None:
+                _LOGGER.warning(
+                    "The current implementation of this library does not handle messages received on topic "
+                    "(%s) and when the message method is %s. "
+                    "If you see this message many times, it means Meross has changed the way its protocol "
+                    "works. Contact the developer if that happens!", msg.topic, header.get("method")
+                )
+                return
+            handler(message, header)
+
+    def _handle_command_ack_message(self, message: dict, header: dict) -> None:
+        # If the message is a SETACK/GETACK/ERROR, check if there is any pending command waiting for it and, if so,
+        # resolve its future
+        message_id = header.get("messageId")
+        pending = self._pending_commands.pop(message_id)
+        if pending is None:
+            _LOGGER.debug("No pending command is waiting for message %s (the caller might have given up already)",
+                          message_id)
             return
 
-        _LOGGER.debug("Message signature OK")
-
-        # Let's retrieve the destination topic, message method and source party:
-        destination_topic = msg.topic
-        message_method = header.get("method")
-        source_topic = header.get("from")
-
-        # Dispatch the message.
-        # Check case 2: COMMAND_ACKS. In this case, we don't check the source topic address, as we trust it's
-        # originated by a device on this network that we contacted previously.
-        if destination_topic == build_client_response_topic(
-                self._cloud_creds.user_id, self._app_id
-        ) and message_method in ["SETACK", "GETACK", "ERROR"]:
-            _LOGGER.debug("This message is an ACK to a command this client has send.")
-
-            # If the message is a PUSHACK/GETACK/ERROR, check if there is any pending command waiting for it and, if so,
-            # resolve its future
-            message_id = header.get("messageId")
-            future = self._pending_messages_futures.get(message_id)
-            if future is not None:
-                _LOGGER.debug("Found a pending command waiting for response message")
-                if message_method == "ERROR":
-                    err = CommandError(error_payload=message.get('payload'))
-                    if not self._loop.is_closed():
-                        self._loop.call_soon_threadsafe(_handle_future, future, None, err)
-                    else:
-                        _LOGGER.warning("Could not return message %s to caller as the event loop has been closed already", message)
-                elif message_method in ("SETACK", "GETACK"):
-                    if not self._loop.is_closed():
-                        self._loop.call_soon_threadsafe(
-                            _handle_future, future, message, None
-                        )  # future.set_exception
-                    else:
-                        _LOGGER.warning("Could not return message %s to caller as the event loop has been closed already", message)
-                else:
-                    _LOGGER.error(
-                        f"Unhandled message method {message_method}. Please report it to the developer."
-                        f"raw_msg: {msg}"
-                    )
-                del self._pending_messages_futures[message_id]
-        # Check case 3: PUSH notification.
-        # Again, here we don't check the source topic, we trust that's legitimate.
-        elif (
-                destination_topic == build_client_user_topic(self._cloud_creds.user_id)
-                and message_method == "PUSH"
-        ):
-            namespace = header.get("namespace")
-            payload = message.get("payload")
-            origin_device_uuid = device_uuid_from_push_notification(source_topic)
-
-            parsed_push_notification = parse_push_notification(
-                namespace=namespace,
-                message_payload=payload,
-                originating_device_uuid=origin_device_uuid,
-            )
-            if parsed_push_notification is None:
-                _LOGGER.error(
-                    "Push notification parsing failed. That message won't be dispatched."
-                )
-            else:
-                asyncio.run_coroutine_threadsafe(
-                    self._handle_and_dispatch_push_notification(
-                        parsed_push_notification
-                    ),
-                    loop=self._loop,
-                )
+        if self._loop.is_closed():
+            _LOGGER.warning("Could not return message %s to caller as the event loop has been closed already", message)
+        elif header.get("method") == "ERROR":
+            err = CommandError(error_payload=message.get('payload'))
+            self._ingest_queue.put((_INGEST_ACK, pending.future, None, err))
         else:
-            _LOGGER.warning(
-                f"The current implementation of this library does not handle messages received on topic "
-                f"({destination_topic}) and when the message method is {message_method}. "
-                "If you see this message many times, it means Meross has changed the way its protocol "
-                "works. Contact the developer if that happens!"
+            self._ingest_queue.put((_INGEST_ACK, pending.future, message, None))
+
+    def _handle_push_notification_message(self, message: dict, header: dict) -> None:
+        origin_device_uuid = device_uuid_from_push_notification(header.get("from"))
+        parsed_push_notification = parse_push_notification(
+            namespace=header.get("namespace"),
+            message_payload=message.get("payload"),
+            originating_device_uuid=origin_device_uuid,
+        )
+        if parsed_push_notification is None:
+            _LOGGER.error(
+                "Push notification parsing failed. That message won't be dispatched."
             )
+        else:
+            parsed_push_notification.received_at = time.monotonic()
+            self._ingest_queue.put((_INGEST_PUSH, parsed_push_notification))
+
+    def _process_ingested_messages(self, batch: List[tuple]) -> None:
+        """
+        Consumes a batch of messages received from the MQTT brokers. This method runs within the event loop:
+        pending commands are resolved right away, while push notifications are handed to the dispatcher, which
+        dispatches the ones of every device in arrival order.
+        """
+        for item in batch:
+            if item[0] == _INGEST_ACK:
+                _, future, result, exception = item
+                _handle_future(future, result, exception)
+            else:
+                push_notification = item[1]
+                namespace = push_notification.namespace.value
+                self._push_notification_counts[namespace] = self._push_notification_counts.get(namespace, 0) + 1
+                if push_notification.namespace != Namespace.SYSTEM_ONLINE:
+                    # The device state changed: somebody is likely interacting with it
+                    self._last_interaction[push_notification.originating_device_uuid] = time.monotonic()
+                self._push_dispatcher.submit(push_notification.originating_device_uuid, push_notification)
 
     async def _async_dispatch_push_notification(
             self, push_notification: GenericPushNotification
@@ -737,7 +1496,7 @@ class MerossManager(object):
                 "Received an Unbind PushNotification. Releasing device resources..."
             )
             devs = self._device_registry.find_all_by(
-                device_uuids=(push_notification.originating_device_uuid)
+                device_uuids=(push_notification.originating_device_uuid,)
             )
             for d in devs:
                 _LOGGER.info(f"Releasing resources for device {d.internal_id}")
@@ -757,34 +1516,37 @@ class MerossManager(object):
         :param push_notification:
         :return:
         """
-        # Dispatching
-        handled_device = await self._async_dispatch_push_notification(
-            push_notification=push_notification
-        )
-
-        # Notify any listener that registered explicitly to push_notification
-        target_devs = self._device_registry.find_all_by(
-            device_uuids=(push_notification.originating_device_uuid,)
-        )
+        attributes = None
+        if is_tracing_enabled():
+            attributes = {"meross.device_uuid": push_notification.originating_device_uuid,
+                          "meross.namespace": push_notification.namespace.value}
+            if push_notification.received_at is not None:
+                # Time spent between the reception of the message and its dispatching (e.g. in the loop queue)
+                attributes["meross.queue_delay"] = time.monotonic() - push_notification.received_at
+        with trace_span(SPAN_DISPATCH_PUSH_NOTIFICATION, attributes):
+            # Dispatching
+            handled_device = await self._async_dispatch_push_notification(
+                push_notification=push_notification
+            )
 
-        for handler in self._push_coros:
-            try:
-                await handler(push_notification, target_devs, self)
-            except Exception as e:
-                _LOGGER.exception(f"Uncaught error occurred while executing push notification "
-                                  f"handler {handler} for {push_notification}")
+            # Notify any listener that registered explicitly to push_notification
+            target_devs = self._device_registry.find_all_by(
+                device_uuids=(push_notification.originating_device_uuid,)
+            )
 
-        # Handling post-dispatching
-        handled_post = await self._async_handle_push_notification_post_dispatching(
-            push_notification=push_notification
-        )
+            await self._push_dispatcher.async_invoke_handlers(self._push_coros, push_notification, target_devs, self)
 
-        if not (handled_device or handled_post):
-            _LOGGER.warning(
-                f"Uncaught push notification {push_notification.namespace}. "
-                f"Raw data: {json.dumps(push_notification.raw_data)}"
+            # Handling post-dispatching
+            handled_post = await self._async_handle_push_notification_post_dispatching(
+                push_notification=push_notification
             )
 
+            if not (handled_device or handled_post):
+                _LOGGER.warning(
+                    f"Uncaught push notification {push_notification.namespace}. "
+                    f"Raw data: {json.dumps(push_notification.raw_data)}"
+                )
+
     async def async_execute_cmd(
             self,
             mqtt_hostname: str,
@@ -794,7 +1556,9 @@ class MerossManager(object):
             namespace: Union[Namespace, str],
             payload: dict,
             timeout: float = DEFAULT_COMMAND_TIMEOUT,
-            override_transport_mode: TransportMode = None
+            override_transport_mode: TransportMode = None,
+            coalesce: Optional[bool] = None,
+            drop_on_overquota: bool = True
     ):
         """
         This method sends a command to the device, locally via HTTP or via the MQTT Meross broker.
@@ -807,9 +1571,117 @@ class MerossManager(object):
         :param payload: A dict containing the payload to be sent
         :param timeout: Maximum time interval in seconds to wait for the command-answer
         :param override_transport_mode: when set, overrides the manager transport mode
+        :param coalesce: when True, a GET command identical to one already in flight is not sent again: the
+                         result of the in-flight one is returned instead. When None (default), coalescing only
+                         applies to the namespaces enabled via `enable_get_coalescing()`.
+        :param drop_on_overquota: when False, the command is delayed instead of being dropped when the rate limiter
+                                  runs out of budget (and its policy is `RateLimitPolicy.DROP`)
         :return:
         """
+        namespace_val = namespace.value if isinstance(namespace, Namespace) else namespace
+        if method.upper() == "SET":
+            # SET commands are the result of user interaction: such devices are refreshed first after a reconnection
+            self._last_interaction[destination_device_uuid] = time.monotonic()
+        with trace_span(SPAN_EXECUTE_COMMAND, {"meross.device_uuid": destination_device_uuid,
+                                               "meross.method": method,
+                                               "meross.namespace": namespace_val}):
+            if method.upper() == "GET":
+                if coalesce or (coalesce is None and namespace_val in self._coalesced_namespaces):
+                    return await self._command_coalescer.async_execute(
+                        device_uuid=destination_device_uuid,
+                        namespace=namespace_val,
+                        payload=payload,
+                        command_factory=lambda: self._async_execute_cmd(mqtt_hostname=mqtt_hostname,
+                                                                        mqtt_port=mqtt_port,
+                                                                        destination_device_uuid=destination_device_uuid,
+                                                                        method=method,
+                                                                        namespace=namespace,
+                                                                        payload=payload,
+                                                                        timeout=timeout,
+                                                                        override_transport_mode=override_transport_mode,
+                                                                        drop_on_overquota=drop_on_overquota))
+            return await self._async_execute_cmd(mqtt_hostname=mqtt_hostname,
+                                                 mqtt_port=mqtt_port,
+                                                 destination_device_uuid=destination_device_uuid,
+                                                 method=method,
+                                                 namespace=namespace,
+                                                 payload=payload,
+                                                 timeout=timeout,
+                                                 override_transport_mode=override_transport_mode,
+                                                 drop_on_overquota=drop_on_overquota)
+
+    async def async_execute_many(
+            self,
+            commands: Iterable[Tuple[BaseDevice, str, Union[Namespace, str], dict]],
+            max_concurrency: int = DEFAULT_BULK_MAX_CONCURRENCY,
+            max_concurrency_per_broker: int = DEFAULT_BULK_MAX_CONCURRENCY_PER_BROKER,
+            max_concurrency_per_device: int = DEFAULT_BULK_MAX_CONCURRENCY_PER_DEVICE,
+            timeout: float = DEFAULT_COMMAND_TIMEOUT,
+            override_transport_mode: TransportMode = None
+    ) -> AsyncIterator[BulkCommandResult]:
+        """
+        Executes many commands, bounding the number of commands that are executed at the same time, and
+        yields their results as soon as they complete (so not necessarily in the given order).
+        Errors are reported per command, via `BulkCommandResult.error`, and do not stop the other commands.
+
+        :param commands: iterable of (device, method, namespace, payload) tuples
+        :param max_concurrency: maximum number of commands executed at the same time
+        :param max_concurrency_per_broker: maximum number of commands executed at the same time against each broker
+        :param max_concurrency_per_device: maximum number of commands executed at the same time against each device
+        :param timeout: maximum time interval in seconds to wait for every command-answer
+        :param override_transport_mode: when set, overrides the manager transport mode
+        :return: an async iterator of `BulkCommandResult`
+        """
+        limiter = BulkConcurrencyLimiter(max_concurrency=max_concurrency,
+                                         max_concurrency_per_broker=max_concurrency_per_broker,
+                                         max_concurrency_per_device=max_concurrency_per_device)
+        results = asyncio.Queue()
 
+        async def _execute(index: int, device: BaseDevice, method: str, namespace: Union[Namespace, str],
+                           payload: dict) -> None:
+            try:
+                result = await limiter.async_run(
+                    broker=self._broker_of(device),
+                    device_uuid=device.uuid,
+                    command_factory=lambda: self.async_execute_cmd(mqtt_hostname=device.mqtt_host,
+                                                                   mqtt_port=device.mqtt_port,
+                                                                   destination_device_uuid=device.uuid,
+                                                                   method=method,
+                                                                   namespace=namespace,
+                                                                   payload=payload,
+                                                                   timeout=timeout,
+                                                                   override_transport_mode=override_transport_mode))
+                results.put_nowait(BulkCommandResult(index=index, device=device, method=method, namespace=namespace,
+                                                     payload=payload, result=result))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _LOGGER.debug("Command %s %s against %s failed: %r", method, namespace, device, e)
+                results.put_nowait(BulkCommandResult(index=index, device=device, method=method, namespace=namespace,
+                                                     payload=payload, error=e))
+
+        tasks = [self._loop.create_task(_execute(i, *command)) for i, command in enumerate(commands)]
+        try:
+            for _ in range(len(tasks)):
+                yield await results.get()
+        finally:
+            # The caller might stop iterating before all the commands complete
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    async def _async_execute_cmd(
+            self,
+            mqtt_hostname: str,
+            mqtt_port: int,
+            destination_device_uuid: str,
+            method: str,
+            namespace: Union[Namespace, str],
+            payload: dict,
+            timeout: float,
+            override_transport_mode: Optional[TransportMode],
+            drop_on_overquota: bool = True
+    ):
         # Only attempt local http communication if enabled via configuration.
         transport_mode = override_transport_mode if override_transport_mode is not None else self._default_transport_mode
         attempt_lan = transport_mode == TransportMode.LAN_HTTP_FIRST or transport_mode == TransportMode.LAN_HTTP_FIRST_ONLY_GET and method.upper() == 'GET'
@@ -835,6 +1707,13 @@ class MerossManager(object):
                     _LOGGER.exception("An error occurred while attempting to send a message over internal LAN to device %s. Retrying with MQTT transport.", destination_device_uuid)
                     self._error_budget_manager.notify_error(destination_device_uuid)
 
+        # Commands sent via MQTT are subject to the API rate limits
+        if self._rate_limiter is not None:
+            await self._async_apply_rate_limit(device_uuid=destination_device_uuid,
+                                               method=method,
+                                               namespace=namespace.value if isinstance(namespace, Namespace) else namespace,
+                                               drop_on_overquota=drop_on_overquota)
+
         # Retrieve the mqtt client for the given domain:port broker
         if self._override_mqtt_server is not None:
             _LOGGER.debug("Overriding MQTT host/port as per manager parameter")
@@ -843,14 +1722,30 @@ class MerossManager(object):
 
         _LOGGER.debug("Sending %s-%s command via MQTT to %s via %s:%d", method, str(namespace), destination_device_uuid,
                       mqtt_hostname, mqtt_port)
-        client = await self._async_get_create_mqtt_client(domain=mqtt_hostname, port=mqtt_port)
-        return await self.async_execute_cmd_client(client=client,
+        connection = await self._async_get_create_mqtt_connection(domain=mqtt_hostname,
+                                                                  port=mqtt_port,
+                                                                  device_uuid=destination_device_uuid)
+        return await self.async_execute_cmd_client(client=connection.client,
                                                    destination_device_uuid=destination_device_uuid,
                                                    method=method,
                                                    namespace=namespace,
                                                    payload=payload,
                                                    timeout=timeout)
 
+    async def _async_apply_rate_limit(self, device_uuid: str, method: str, namespace: str,
+                                      drop_on_overquota: bool) -> None:
+        decision, delay = self._rate_limiter.acquire(device_uuid=device_uuid, drop_on_overquota=drop_on_overquota)
+        if decision == RateLimitDecision.DROP:
+            self._api_counter.notify_dropped_call(device_uuid=device_uuid, namespace=namespace, method=method)
+            _LOGGER.warning("API rate limit exceeded: dropping %s %s command for device %s", method, namespace,
+                            device_uuid)
+            raise RateLimitExceeded(device_uuid=device_uuid, namespace=namespace)
+        if decision == RateLimitDecision.DELAY:
+            self._api_counter.notify_delayed_call(device_uuid=device_uuid, namespace=namespace, method=method)
+            _LOGGER.debug("API rate limit exceeded: delaying %s %s command for device %s by %.3f seconds", method,
+                          namespace, device_uuid, delay)
+            await asyncio.sleep(delay)
+
     async def _async_execute_cmd_http(self,
                                       device_ip: str,
                                       destination_device_uuid: str,
@@ -863,8 +1758,15 @@ class MerossManager(object):
         message, message_id = self._build_mqtt_message(method, namespace, payload, destination_device_uuid)
 
         async with ClientSession() as session:
-            async with session.post(f"http://{device_ip}/config", json=json.loads(message.decode()), timeout=timeout) as response:
-                data = await response.json()
+            start = time.monotonic()
+            async with session.post(f"http://{device_ip}/config", data=message, headers=_LAN_HTTP_HEADERS,
+                                    timeout=timeout) as response:
+                body = await response.read()
+                self._latency_recorder.record(transport=LatencyTransport.LAN_HTTP,
+                                              namespace=namespace.value if isinstance(namespace, Namespace) else namespace,
+                                              latency=time.monotonic() - start,
+                                              device_uuid=destination_device_uuid)
+                data = json_loads(body)
                 return data.get("payload")
 
     async def async_execute_cmd_client(self,
@@ -875,53 +1777,112 @@ class MerossManager(object):
                                        payload: dict,
                                        timeout: float = 10.0):
         # Send the message over the network
-        # Build the mqtt message we will send to the broker
-        message, message_id = self._build_mqtt_message(method, namespace, payload, destination_device_uuid)
+        # Build the mqtt message we will send to the broker. ACKs are expected on the response topic of the
+        # connection the message is sent over.
+        connection = self._mqtt_connections_by_client.get(client)
+        message_builder = connection.message_builder if connection is not None else self._message_builder
+        message, message_id = self._build_mqtt_message(method, namespace, payload, destination_device_uuid,
+                                                       message_builder=message_builder)
 
         # Create a future and perform the send/waiting to a task
         fut = self._loop.create_future()
-        self._pending_messages_futures[message_id] = fut
-        response = await self._async_send_and_wait_ack(
-            client=client,
-            future=fut,
-            target_device_uuid=destination_device_uuid,
-            message=message,
-            timeout=timeout
-        )
+        namespace_val = namespace.value if isinstance(namespace, Namespace) else namespace
+        self._pending_commands.register(message_id=message_id, future=fut, device_uuid=destination_device_uuid,
+                                        namespace=namespace_val)
+        if connection is not None:
+            connection.sent += 1
+            connection.in_flight += 1
+        self._api_counter.notify_api_call(device_uuid=destination_device_uuid, namespace=namespace_val, method=method)
+        start = time.monotonic()
+        try:
+            response = await self._async_send_and_wait_ack(
+                client=client,
+                future=fut,
+                target_device_uuid=destination_device_uuid,
+                message=message,
+                timeout=timeout
+            )
+            self._record_mqtt_latency(destination_device_uuid, namespace_val, start)
+        except CommandError:
+            # The device answered anyway
+            self._record_mqtt_latency(destination_device_uuid, namespace_val, start)
+            raise
+        finally:
+            # Whatever happened (ACK, timeout, cancellation) we are no more waiting for this message
+            self._pending_commands.discard(message_id)
+            if connection is not None:
+                connection.in_flight -= 1
         return response.get("payload")
 
+    def _record_mqtt_latency(self, device_uuid: str, namespace: str, start: float) -> None:
+        self._latency_recorder.record(transport=LatencyTransport.MQTT,
+                                      namespace=namespace,
+                                      latency=time.monotonic() - start,
+                                      device_uuid=device_uuid)
+
     async def _async_send_and_wait_ack(
             self, client: mqtt.Client, future: Future, target_device_uuid: str, message: bytes, timeout: float,
     ):
-        if not client.is_connected():
-            raise Exception("MQTT client not connected.")
+        with trace_span(SPAN_SEND_AND_WAIT_ACK, {"meross.device_uuid": target_device_uuid}):
+            if not client.is_connected():
+                raise Exception("MQTT client not connected.")
 
-        client.publish(
-            topic=build_device_request_topic(target_device_uuid), payload=message
-        )
-        try:
-            return await asyncio.wait_for(future, timeout)
-        except TimeoutError as e:
-            domain, port = self._get_client_from_domain_port(client=client)
-            _LOGGER.error(
-                "Timeout occurred while waiting a response for message %s sent to device uuid "
-                "%s. Timeout was: %f seconds. Mqtt Host: %s:%d.",
-                str(message), str(target_device_uuid), timeout, domain, port)
-            raise CommandTimeoutError(message=str(message), target_device_uuid=target_device_uuid, timeout=timeout)
-        except CommandError as e:
-            domain, port = self._get_client_from_domain_port(client=client)
-            _LOGGER.error(
-                "Error occurred while waiting a response for message %s sent to device uuid "
-                "%s. Mqtt Host: %s:%d. Returned error: %s",
-                str(message), str(target_device_uuid), domain, port, e.error_payload)
-            raise
+            client.publish(
+                topic=build_device_request_topic(target_device_uuid), payload=message
+            )
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except TimeoutError as e:
+                domain, port = self._get_client_from_domain_port(client=client)
+                _LOGGER.error(
+                    "Timeout occurred while waiting a response for message %s sent to device uuid "
+                    "%s. Timeout was: %f seconds. Mqtt Host: %s:%d.",
+                    str(message), str(target_device_uuid), timeout, domain, port)
+                raise CommandTimeoutError(message=str(message), target_device_uuid=target_device_uuid, timeout=timeout)
+            except CommandError as e:
+                domain, port = self._get_client_from_domain_port(client=client)
+                _LOGGER.error(
+                    "Error occurred while waiting a response for message %s sent to device uuid "
+                    "%s. Mqtt Host: %s:%d. Returned error: %s",
+                    str(message), str(target_device_uuid), domain, port, e.error_payload)
+                raise
 
-    async def _notify_connection_drop(self):
-        for d in self._device_registry.find_all_by():
-            pushn = OnlinePushNotification(originating_device_uuid=d.uuid, raw_data={'online': {'status': -1}})
-            await self._handle_and_dispatch_push_notification(pushn)
+    def _broker_of(self, device: BaseDevice) -> str:
+        """Returns the key of the broker serving the given device"""
+        if self._override_mqtt_server is not None:
+            return _mqtt_key_from_domain_port(*self._override_mqtt_server)
+        return _mqtt_key_from_domain_port(device.mqtt_host, device.mqtt_port)
 
-    def _build_mqtt_message(self, method: str, namespace: Union[Namespace, str], payload: dict, destination_device_uuid: str):
+    async def _notify_connection_drop(self, broker: str):
+        """
+        Marks all the devices served by the given broker as unavailable, in a single pass over the registry.
+        Every device receives its own ONLINE push notification, queued behind the push notifications it has already
+        received, so that the push notification handlers observe them in order. Once those have been dispatched,
+        the connection drop handlers receive a single `ConnectionDropPushNotification`, together with all the
+        affected devices (subdevices included).
+        """
+        base_devices = [d for d in self._device_registry.find_all_by(exclude_classes=(GenericSubDevice,))
+                        if self._broker_of(d) == broker]
+        if not base_devices:
+            return
+        _LOGGER.info("Marking %d devices served by %s as unavailable", len(base_devices), broker)
+        device_uuids = {d.uuid for d in base_devices}
+        for uuid in device_uuids:
+            push_notification = OnlinePushNotification(originating_device_uuid=uuid,
+                                                       raw_data={'online': {'status': OnlineStatus.UNKNOWN.value}})
+            # Generated by the manager: never dropped, even when the push backlog is full
+            self._push_dispatcher.submit(uuid, push_notification, force=True)
+
+        if not self._connection_drop_coros:
+            return
+        await self._push_dispatcher.async_join()
+        affected_devices = self._device_registry.find_all_by(device_uuids=device_uuids)
+        push_notification = ConnectionDropPushNotification(broker=broker, device_uuids=list(device_uuids))
+        await self._push_dispatcher.async_invoke_handlers(self._connection_drop_coros, push_notification,
+                                                          affected_devices, self)
+
+    def _build_mqtt_message(self, method: str, namespace: Union[Namespace, str], payload: dict,
+                            destination_device_uuid: str, message_builder: Optional[MqttMessageBuilder] = None):
         """
         Sends a message to the Meross MQTT broker, respecting the protocol payload.
 
@@ -929,49 +1890,19 @@ class MerossManager(object):
         :param namespace:
         :param payload:
         :param destination_device_uuid:
+        :param message_builder: builder of the connection the message is sent over (defaults to the manager one)
 
         :return:
         """
-
-        # Generate a random 16 byte string
-        randomstring = "".join(
-            random.SystemRandom().choice(string.ascii_uppercase + string.digits)
-            for _ in range(16)
-        )
-
-        # Hash it as md5
-        md5_hash = md5()
-        md5_hash.update(randomstring.encode("utf8"))
-        messageId = md5_hash.hexdigest().lower()
-        timestamp = int(round(time()))
-
-        # Hash the messageId, the key and the timestamp
-        md5_hash = md5()
-        strtohash = "%s%s%s" % (messageId, self._cloud_creds.key, timestamp)
-        md5_hash.update(strtohash.encode("utf8"))
-        signature = md5_hash.hexdigest().lower()
-
         if not isinstance(namespace, Namespace) and not isinstance(namespace, str):
             raise ValueError("Namespace parameter must be a Namespace enum or a string.")
         namespace_val = namespace.value if isinstance(namespace, Namespace) else namespace
-
-        data = {
-            "header": {
-                "from": self._client_response_topic,
-                "messageId": messageId,  # Example: "122e3e47835fefcd8aaf22d13ce21859"
-                "method": method,  # Example: "GET",
-                "namespace": namespace_val,  # Example: "Appliance.System.All",
-                "payloadVersion": 1,
-                "sign": signature,  # Example: "b4236ac6fb399e70c3d61e98fcb68b74",
-                "timestamp": timestamp,
-                "triggerSrc": "Android",
-                "uuid": destination_device_uuid
-            },
-            "payload": payload,
-        }
-
-        strdata = json.dumps(data,separators=(',', ':'))
-        return strdata.encode("utf-8"), messageId
+        if message_builder is None:
+            message_builder = self._message_builder
+        return message_builder.build(method=method,
+                                     namespace=namespace_val,
+                                     payload=payload,
+                                     destination_device_uuid=destination_device_uuid)
 
     def set_proxy(self, proxy_type, proxy_addr, proxy_port):
         self._enable_proxy = True
@@ -979,28 +1910,197 @@ class MerossManager(object):
         self._proxy_addr = proxy_addr
         self._proxy_port = proxy_port
 
-        for k, client in self._mqtt_clients.items():
-            _LOGGER.info("Setting proxy configuration for client %s...", k)
+        for client, connection in self._mqtt_connections_by_client.items():
+            _LOGGER.info("Setting proxy configuration for client %s...", connection)
             client.proxy_set(proxy_type=self._proxy_type, proxy_addr=self._proxy_addr, proxy_port=self._proxy_port)
             client.reconnect()
 
     def dump_device_registry(self, filename):
         """
-        Save the current list of devices into a file so that you can later re-load it without issuing
-        a discovery. **Note**: the stored information might become out-of-date or unvalidated. For instance,
-        a device name might change over time, as its online status or any other info that is not immutable (as the UUID).
-        Use this with caution!
+        Save the current list of devices, along with their subdevices and their cached state, into a snapshot file
+        so that you can later re-load it without issuing a discovery. **Note**: the stored information might become
+        out-of-date or unvalidated. For instance, a device name might change over time, as its online status or any
+        other info that is not immutable (as the UUID). The restored state is marked as stale until confirmed by the
+        devices. Use this with caution!
+        The snapshot is written before returning: use `async_dump_device_registry()` to write it off the event loop.
         """
+        # Snapshots requested earlier are written first, so that they do not overwrite this one
+        self._wait_snapshot_writes()
         self._device_registry.dump_to_file(filename)
 
+    async def async_dump_device_registry(self, filename):
+        """
+        Same as `dump_device_registry()`, but the snapshot is compressed and written off the event loop.
+        The state is captured right away; the coroutine completes once the file has been written.
+        """
+        snapshot = snapshot_devices(self._device_registry.find_all_by())
+        if self._snapshot_executor is None:
+            self._snapshot_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                            thread_name_prefix="meross-snapshot")
+        future = self._snapshot_executor.submit(lambda: write_snapshot(filename, encode_snapshot(snapshot)))
+        self._last_snapshot_write = future
+        await asyncio.wrap_future(future, loop=self._loop)
+
+    def _wait_snapshot_writes(self) -> None:
+        if self._last_snapshot_write is not None:
+            concurrent.futures.wait([self._last_snapshot_write])
+
     def load_devices_from_dump(self, filename):
         """Reload the registry info from a dump. **Note**: this will override all the currently discovered devices."""
+        # Dumps still being written are completed first
+        self._wait_snapshot_writes()
         self._device_registry.load_from_dump(filename, manager=self)
 
 
+DeviceViewCallbackType = Callable[[BaseDevice], Union[None, Awaitable]]
+
+
+class DeviceView(object):
+    """
+    Live set of the registered devices matching a set of filters (the same ones supported by
+    `MerossManager.find_devices()`). The registry keeps the view up to date as devices are enrolled, relinquished
+    or change their online status, so reading it costs nothing. Callbacks (plain functions or coroutine functions)
+    can be registered to be notified when devices enter or leave the view.
+    """
+
+    def __init__(self,
+                 device_uuids: Optional[Iterable[str]] = None,
+                 internal_ids: Optional[Iterable[str]] = None,
+                 device_type: Optional[str] = None,
+                 device_class: Optional[Union[type, Iterable[type]]] = None,
+                 device_name: Optional[str] = None,
+                 online_status: Optional[OnlineStatus] = None,
+                 exclude_classes: Optional[Iterable[type]] = None):
+        self._device_uuids = set(device_uuids) if device_uuids is not None else None
+        self._internal_ids = set(internal_ids) if internal_ids is not None else None
+        self._device_type = device_type
+        if device_class is not None:
+            device_class = (device_class,) if isinstance(device_class, type) else tuple(device_class)
+        self._device_classes = device_class
+        self._device_name = device_name
+        self._online_status = online_status
+        self._exclude_classes = tuple(exclude_classes) if exclude_classes is not None else None
+        self._devices: Dict[str, BaseDevice] = {}
+        self._added_callbacks: List[DeviceViewCallbackType] = []
+        self._removed_callbacks: List[DeviceViewCallbackType] = []
+        self._registry: Optional[DeviceRegistry] = None
+
+    @property
+    def filters(self) -> Dict[str, Any]:
+        return {k: v for k, v in (("device_uuids", self._device_uuids),
+                                  ("internal_ids", self._internal_ids),
+                                  ("device_type", self._device_type),
+                                  ("device_class", self._device_classes),
+                                  ("device_name", self._device_name),
+                                  ("online_status", self._online_status),
+                                  ("exclude_classes", self._exclude_classes)) if v is not None}
+
+    def matches(self, device: BaseDevice) -> bool:
+        """
+        Tells whether the given device satisfies the filters of this view
+        """
+        if self._internal_ids is not None and device.internal_id not in self._internal_ids:
+            return False
+        if self._device_uuids is not None and device.uuid not in self._device_uuids:
+            return False
+        if self._device_type is not None and device.type != self._device_type:
+            return False
+        if self._online_status is not None and device.online_status != self._online_status:
+            return False
+        if self._device_classes is not None and not isinstance(device, self._device_classes):
+            return False
+        if self._device_name is not None and device.name != self._device_name:
+            return False
+        if self._exclude_classes is not None and isinstance(device, self._exclude_classes):
+            return False
+        return True
+
+    def register_added_callback(self, callback: DeviceViewCallbackType) -> None:
+        """
+        Registers a callback invoked, with the device as argument, whenever a device enters the view
+        """
+        self._added_callbacks.append(callback)
+
+    def unregister_added_callback(self, callback: DeviceViewCallbackType) -> None:
+        if callback in self._added_callbacks:
+            self._added_callbacks.remove(callback)
+
+    def register_removed_callback(self, callback: DeviceViewCallbackType) -> None:
+        """
+        Registers a callback invoked, with the device as argument, whenever a device leaves the view
+        """
+        self._removed_callbacks.append(callback)
+
+    def unregister_removed_callback(self, callback: DeviceViewCallbackType) -> None:
+        if callback in self._removed_callbacks:
+            self._removed_callbacks.remove(callback)
+
+    @staticmethod
+    def _fire(callbacks: List[DeviceViewCallbackType], device: BaseDevice) -> None:
+        for callback in list(callbacks):
+            try:
+                res = callback(device)
+                if asyncio.iscoroutine(res):
+                    asyncio.ensure_future(res)
+            except Exception:
+                _LOGGER.exception(f"Error occurred while invoking device view callback {callback} for {device}")
+
+    def _update(self, device: BaseDevice, relinquished: bool = False) -> None:
+        internal_id = device.internal_id
+        member = internal_id in self._devices
+        should_be_member = not relinquished and self.matches(device)
+        if should_be_member and not member:
+            self._devices[internal_id] = device
+            self._fire(self._added_callbacks, device)
+        elif member and not should_be_member:
+            del self._devices[internal_id]
+            self._fire(self._removed_callbacks, device)
+
+    def close(self) -> None:
+        """
+        Detaches the view from the registry: it won't be updated any longer
+        """
+        if self._registry is not None:
+            self._registry._detach_view(self)
+            self._registry = None
+
+    @property
+    def devices(self) -> List[BaseDevice]:
+        return list(self._devices.values())
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __iter__(self) -> Iterator[BaseDevice]:
+        return iter(list(self._devices.values()))
+
+    def __contains__(self, device: BaseDevice) -> bool:
+        return device.internal_id in self._devices
+
+    def __repr__(self):
+        return f"DeviceView({self.filters}): {len(self)} devices"
+
+
 class DeviceRegistry(object):
+    """
+    Registry of the devices handled by the manager. Besides the devices by internal id, the registry maintains
+    secondary indexes (by UUID, type, class/mixin and online status), which are kept consistent as devices are
+    enrolled, relinquished or change their online status.
+    """
     def __init__(self):
-        self._devices_by_internal_id = {}
+        self._devices_by_internal_id: Dict[str, BaseDevice] = {}
+        self._enroll_order: Dict[str, int] = {}
+        self._enroll_counter = 0
+        self._base_by_uuid: Dict[str, BaseDevice] = {}
+        self._by_uuid: Dict[str, Dict[str, BaseDevice]] = {}
+        self._by_type: Dict[str, Dict[str, BaseDevice]] = {}
+        self._by_class: Dict[type, Dict[str, BaseDevice]] = {}
+        self._by_online_status: Dict[OnlineStatus, Dict[str, BaseDevice]] = {}
+        # Keys under which every device is currently indexed, by internal id
+        self._indexed_type: Dict[str, str] = {}
+        self._indexed_online_status: Dict[str, OnlineStatus] = {}
+        # Views are not kept alive by the registry: dropping all the references to a view detaches it
+        self._views: "weakref.WeakSet[DeviceView]" = weakref.WeakSet()
 
     def clear(self) -> None:
         """Clear all the registered devices"""
@@ -1008,23 +2108,89 @@ class DeviceRegistry(object):
         for devid in ids:
             self.relinquish_device(devid)
 
-    def dump_to_file(self, filename: str)->None:
-        """Dump the current device list to a file"""
-        dumped_base_devices = [{'abilities': x.abilities, 'info': x.cached_http_info.to_dict()} for x in self._devices_by_internal_id.values() if not isinstance(x, GenericSubDevice)]
-        with open(filename, "wt") as f:
-            json.dump(dumped_base_devices, f, default=lambda x: x.isoformat() if isinstance(x, datetime) else x.value if(isinstance(x,OnlineStatus)) else 'Not-Serializable')
+    def dump_to_file(self, filename: str) -> None:
+        """Dump the current devices, subdevices included, and their cached state to a snapshot file"""
+        write_snapshot(filename, encode_snapshot(snapshot_devices(self._devices_by_internal_id.values())))
 
     def load_from_dump(self, filename: str, manager: MerossManager) -> None:
-        """Load the device registry from a file"""
-        dumped_json_data = []
-        with open(filename, "rt") as f:
-            dumped_json_data = json.load(f)
-
-        for deviced in dumped_json_data:
-            device_abilities = deviced['abilities']
-            device_info = HttpDeviceInfo.from_dict(deviced['info'])
-            device = build_meross_device_from_abilities(http_device_info=device_info, device_abilities=device_abilities, manager=manager)
+        """
+        Load the device registry from a snapshot file (or from a legacy registry dump). The restored state
+        is marked as stale until the devices report it again.
+        """
+        self.load_from_snapshot(read_snapshot(filename), manager=manager)
+
+    def load_from_snapshot(self, snapshot: dict, manager: MerossManager) -> None:
+        for entry in snapshot["devices"]:
+            device = build_meross_device_from_abilities(http_device_info=parse_device_info(entry),
+                                                        device_abilities=entry['abilities'],
+                                                        manager=manager)
+            restore_state(device, entry)
             self.enroll_device(device)
+            if not isinstance(device, HubDevice):
+                continue
+            for subentry in entry.get('subdevices', []):
+                subdevice = build_meross_subdevice(http_subdevice_info=parse_subdevice_info(subentry),
+                                                   hub_uuid=device.uuid,
+                                                   hub_reported_abilities=device.abilities,
+                                                   manager=manager)
+                restore_state(subdevice, subentry)
+                device.register_subdevice(subdevice)
+                self.enroll_device(subdevice)
+
+    @staticmethod
+    def _index_add(index: Dict[Any, Dict[str, BaseDevice]], key: Any, device: BaseDevice) -> None:
+        bucket = index.get(key)
+        if bucket is None:
+            bucket = {}
+            index[key] = bucket
+        bucket[device.internal_id] = device
+
+    @staticmethod
+    def _index_remove(index: Dict[Any, Dict[str, BaseDevice]], key: Any, device: BaseDevice) -> None:
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(device.internal_id, None)
+            if not bucket:
+                del index[key]
+
+    def _reindex(self, device: BaseDevice) -> None:
+        internal_id = device.internal_id
+        indexed_type = self._indexed_type.get(internal_id)
+        if indexed_type != device.type:
+            self._index_remove(self._by_type, indexed_type, device)
+            self._index_add(self._by_type, device.type, device)
+            self._indexed_type[internal_id] = device.type
+
+        indexed_status = self._indexed_online_status.get(internal_id)
+        online_status = device.online_status
+        if indexed_status != online_status:
+            self._index_remove(self._by_online_status, indexed_status, device)
+            self._index_add(self._by_online_status, online_status, device)
+            self._indexed_online_status[internal_id] = online_status
+
+    def _on_device_state_changed(self, device: BaseDevice) -> None:
+        # The online status of subdevices depends on the one of their hub, which shares their UUID
+        for dev in list(self._by_uuid.get(device.uuid, {}).values()):
+            self._reindex(dev)
+            self._update_views(dev)
+
+    def _update_views(self, device: BaseDevice, relinquished: bool = False) -> None:
+        for view in list(self._views):
+            view._update(device, relinquished=relinquished)
+
+    def create_view(self, **filters) -> DeviceView:
+        """
+        Creates a live view of the devices matching the given filters (see `find_all_by()`)
+        """
+        view = DeviceView(**filters)
+        view._registry = self
+        for device in self.find_all_by(**filters):
+            view._devices[device.internal_id] = device
+        self._views.add(view)
+        return view
+
+    def _detach_view(self, view: DeviceView) -> None:
+        self._views.discard(view)
 
     def relinquish_device(self, device_internal_id: str):
         dev = self._devices_by_internal_id.get(device_internal_id)
@@ -1036,7 +2202,17 @@ class DeviceRegistry(object):
         # Dismiss the device
         _LOGGER.debug(f"Disposing resources for {dev.name} ({dev.uuid})")
         dev.dismiss()
+        dev._state_listener = None
         del self._devices_by_internal_id[device_internal_id]
+        del self._enroll_order[device_internal_id]
+        if self._base_by_uuid.get(dev.uuid) is dev:
+            del self._base_by_uuid[dev.uuid]
+        self._index_remove(self._by_uuid, dev.uuid, dev)
+        for clazz in type(dev).__mro__:
+            self._index_remove(self._by_class, clazz, dev)
+        self._index_remove(self._by_type, self._indexed_type.pop(device_internal_id, None), dev)
+        self._index_remove(self._by_online_status, self._indexed_online_status.pop(device_internal_id, None), dev)
+        self._update_views(dev, relinquished=True)
         _LOGGER.info(f"Device {dev.name} ({dev.uuid}) removed from registry")
 
     def enroll_device(self, device: BaseDevice):
@@ -1050,23 +2226,33 @@ class DeviceRegistry(object):
                 f"Adding device {device.name} ({device.internal_id}) to registry."
             )
             self._devices_by_internal_id[device.internal_id] = device
+            self._enroll_order[device.internal_id] = self._enroll_counter
+            self._enroll_counter += 1
+            if not isinstance(device, GenericSubDevice):
+                self._base_by_uuid[device.uuid] = device
+            self._index_add(self._by_uuid, device.uuid, device)
+            for clazz in type(device).__mro__:
+                self._index_add(self._by_class, clazz, device)
+            self._reindex(device)
+            device._state_listener = self._on_device_state_changed
+            self._update_views(device)
 
     def lookup_by_id(self, device_id: str) -> Optional[BaseDevice]:
         return self._devices_by_internal_id.get(device_id)
 
     def lookup_base_by_uuid(self, device_uuid: str) -> Optional[BaseDevice]:
-        res = list(
-            filter(
-                lambda d: d.uuid == device_uuid and not isinstance(d, GenericSubDevice),
-                self._devices_by_internal_id.values(),
-            )
-        )
-        if len(res) > 1:
-            raise ValueError(f"Multiple devices found for device_uuid {device_uuid}")
-        elif len(res) == 1:
-            return res[0]
-        else:
-            return None
+        return self._base_by_uuid.get(device_uuid)
+
+    @staticmethod
+    def _candidates_by(index: Dict[Any, Dict[str, BaseDevice]], keys: Iterable[Any]) -> Iterable[BaseDevice]:
+        buckets = [index[key] for key in keys if key in index]
+        if len(buckets) == 1:
+            return buckets[0].values()
+        # The same device might be indexed under more than one of the keys (e.g. a class and its mixins)
+        res = {}
+        for bucket in buckets:
+            res.update(bucket)
+        return res.values()
 
     def find_all_by(
             self,
@@ -1078,45 +2264,73 @@ class DeviceRegistry(object):
             online_status: Optional[OnlineStatus] = None,
             exclude_classes: Optional[Iterable[type]] = None
     ) -> List[BaseDevice]:
-
-        def filter_by_type(dev: Any):
-            for t in device_class:
-                if isinstance(dev, t):
-                    return True
-            return False
-
-        def filter_by_excluded_type(dev: Any):
-            for t in exclude_classes:
-                if isinstance(dev, t):
-                    return False
-            return True
-
-        # Look by Internal UUIDs
+        # A single id passed as a plain string would otherwise be split into its characters
+        if isinstance(internal_ids, str):
+            internal_ids = (internal_ids,)
+        if isinstance(device_uuids, str):
+            device_uuids = (device_uuids,)
         if internal_ids is not None:
-            res = filter(
-                lambda d: d.internal_id in internal_ids,
-                self._devices_by_internal_id.values(),
-            )
-        else:
-            res = self._devices_by_internal_id.values()
+            internal_ids = set(internal_ids)
+        if device_uuids is not None:
+            device_uuids = set(device_uuids)
+        if device_class is not None:
+            device_classes = (device_class,) if isinstance(device_class, type) else tuple(device_class)
+        if exclude_classes is not None:
+            exclude_classes = tuple(exclude_classes)
 
+        # Pick the candidates from the most selective index, then check all the other filters on them only.
+        # Sources are (size, filter satisfied by the index, candidates factory, whether enrollment order is kept)
+        sources = []
+        if internal_ids is not None:
+            sources.append((len(internal_ids), "internal_ids",
+                            lambda: [self._devices_by_internal_id[i] for i in internal_ids
+                                     if i in self._devices_by_internal_id], False))
         if device_uuids is not None:
-            res = filter(lambda d: d.uuid in device_uuids, res)
+            sources.append((sum(len(self._by_uuid.get(u, ())) for u in device_uuids), "device_uuids",
+                            lambda: self._candidates_by(self._by_uuid, device_uuids), len(device_uuids) == 1))
         if device_type is not None:
-            res = filter(lambda d: d.type == device_type, res)
-        if online_status is not None:
-            res = filter(lambda d: d.online_status == online_status, res)
+            sources.append((len(self._by_type.get(device_type, ())), "device_type",
+                            lambda: self._candidates_by(self._by_type, (device_type,)), True))
         if device_class is not None:
-            if isinstance(device_class, type):
-                res = filter(lambda d: isinstance(d, device_class), res)
-            elif isinstance(device_class, Iterable):
-                res = filter(filter_by_type, res)
+            sources.append((sum(len(self._by_class.get(c, ())) for c in device_classes), "device_class",
+                            lambda: self._candidates_by(self._by_class, device_classes), len(device_classes) == 1))
+        if online_status is not None:
+            # Online status changes move devices across the buckets, so they are not kept in enrollment order
+            sources.append((len(self._by_online_status.get(online_status, ())), "online_status",
+                            lambda: self._candidates_by(self._by_online_status, (online_status,)), False))
+
+        if sources:
+            _, indexed_filter, candidates_factory, ordered = min(sources, key=lambda source: source[0])
+            candidates = candidates_factory()
+        else:
+            indexed_filter, candidates, ordered = None, self._devices_by_internal_id.values(), True
+
+        predicates = []
+        if internal_ids is not None and indexed_filter != "internal_ids":
+            predicates.append(lambda d: d.internal_id in internal_ids)
+        if device_uuids is not None and indexed_filter != "device_uuids":
+            predicates.append(lambda d: d.uuid in device_uuids)
+        if device_type is not None and indexed_filter != "device_type":
+            predicates.append(lambda d: d.type == device_type)
+        if online_status is not None and indexed_filter != "online_status":
+            predicates.append(lambda d: d.online_status == online_status)
+        if device_class is not None and indexed_filter != "device_class":
+            predicates.append(lambda d: isinstance(d, device_classes))
         if device_name is not None:
-            res = filter(lambda d: d.name == device_name, res)
+            predicates.append(lambda d: d.name == device_name)
         if exclude_classes is not None:
-            res = filter(filter_by_excluded_type, res)
+            predicates.append(lambda d: not isinstance(d, exclude_classes))
 
-        return list(res)
+        if len(predicates) == 1:
+            predicate = predicates[0]
+            res = [d for d in candidates if predicate(d)]
+        elif predicates:
+            res = [d for d in candidates if all(p(d) for p in predicates)]
+        else:
+            res = list(candidates)
+        if not ordered and len(res) > 1:
+            res.sort(key=lambda d: self._enroll_order[d.internal_id])
+        return res
 
 
 def _handle_future(future: Future, result: object, exception: Exception):
@@ -1137,14 +2351,3 @@ def _handle_future(future: Future, result: object, exception: Exception):
 def set_future_done(future):
     if future in _PENDING_FUTURES:
         _PENDING_FUTURES.remove(future)
-
-
-def _schedule_later(coroutine, start_delay, loop):
-    async def delayed_execution(coro, delay, loop):
-        await asyncio.sleep(delay=delay)
-        await coro
-
-    future = asyncio.run_coroutine_threadsafe(coro=delayed_execution(coro=coroutine, delay=start_delay, loop=loop),
-                                              loop=loop)
-    _PENDING_FUTURES.append(future)
-    future.add_done_callback(set_future_done)
@@ -22,4 +22,17 @@ class CommandError(Exception):
 
 
 class UnknownDeviceType(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class TooManyPendingCommandsError(Exception):
+    def __init__(self, max_pending: int):
+        super().__init__(f"Too many commands are waiting for a response (limit: {max_pending})")
+        self.max_pending = max_pending
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, device_uuid: str, namespace: str):
+        super().__init__(f"API rate limit exceeded: {namespace} command for device {device_uuid} was not sent")
+        self.device_uuid = device_uuid
+        self.namespace = namespace
@@ -29,7 +29,7 @@ def parse_push_notification(namespace: Union[str, Namespace],
     :param originating_device_uuid:
     :return:
     """
-    _LOGGER.debug(f"Parsing push notification {namespace}, payload: {message_payload}")
+    _LOGGER.debug("Parsing push notification %s, payload: %s", namespace, message_payload)
 
     # Parse the namespace
     try:
@@ -12,3 +12,5 @@ class GenericPushNotification(object):
         self.namespace = namespace
         self.originating_device_uuid = originating_device_uuid
         self.raw_data = raw_data
+        self.received_at: Optional[float] = None
+        """Monotonic time the notification was received at, when received from an MQTT broker"""
@@ -1,3 +1,5 @@
+from typing import List
+
 from meross_iot.model.enums import Namespace, OnlineStatus
 from meross_iot.model.push.generic import GenericPushNotification
 
@@ -11,3 +13,14 @@ class OnlinePushNotification(GenericPushNotification):
     @property
     def status(self) -> OnlineStatus:
         return self.raw_data.get('online', {}).get('status', None)
+
+
+class ConnectionDropPushNotification(OnlinePushNotification):
+    """
+    Aggregated notification, generated by the manager itself, when the connection to an MQTT broker drops:
+    all the devices served by that broker are marked as unavailable at once.
+    """
+    def __init__(self, broker: str, device_uuids: List[str]):
+        super().__init__(originating_device_uuid=None, raw_data={'online': {'status': OnlineStatus.UNKNOWN.value}})
+        self.broker = broker
+        self.device_uuids = device_uuids
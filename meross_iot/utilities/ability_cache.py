@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from meross_iot.model.http.device import HttpDeviceInfo
+
+_LOGGER = logging.getLogger(__name__)
+
+ABILITY_CACHE_FORMAT_VERSION = 1
+DEFAULT_ABILITY_CACHE_MAX_AGE = 7 * 24 * 3600
+
+
+def _type_key(device_type: str, hardware_version: str, firmware_version: str) -> str:
+    return f"{device_type}|{hardware_version}|{firmware_version}"
+
+
+class AbilityCache(object):
+    """
+    Persistent cache of the abilities reported by the devices, keyed by device type, hardware and firmware version,
+    so that devices can be built without querying them for their abilities.
+    A device whose abilities differ from the ones of the other devices of the same kind gets a per-UUID override,
+    which takes precedence. Entries older than `max_age` seconds are still served, but reported as stale so that
+    they can be refreshed in background.
+    The cache is loaded from `path` when created and written back by `save()`/`async_save()`, atomically.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_age: Optional[float] = DEFAULT_ABILITY_CACHE_MAX_AGE):
+        self._path = path
+        self._max_age = max_age
+        self._types: Dict[str, dict] = {}
+        self._overrides: Dict[str, dict] = {}
+        self._dirty = False
+        self._hits = 0
+        self._misses = 0
+        # Serializes the writes of the file, which are performed off the event loop
+        self._save_lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @property
+    def path(self) -> Optional[str]:
+        return self._path
+
+    @property
+    def hits(self) -> int:
+        """Number of lookups served by the cache"""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Number of lookups the cache had no abilities for"""
+        return self._misses
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the cache changed since it was last loaded or saved"""
+        return self._dirty
+
+    def __len__(self) -> int:
+        return len(self._types) + len(self._overrides)
+
+    def _lookup(self, device_info: HttpDeviceInfo) -> Optional[dict]:
+        entry = self._overrides.get(device_info.uuid)
+        if entry is None:
+            entry = self._types.get(_type_key(device_info.device_type,
+                                              device_info.hdware_version,
+                                              device_info.fmware_version))
+        return entry
+
+    def get(self, device_info: HttpDeviceInfo) -> Optional[dict]:
+        """
+        Returns the abilities cached for the given device (its per-UUID override first), if any
+        """
+        entry = self._lookup(device_info)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return entry["abilities"]
+
+    def is_stale(self, device_info: HttpDeviceInfo) -> bool:
+        """
+        Tells whether the abilities cached for the given device are missing or older than `max_age`
+        """
+        entry = self._lookup(device_info)
+        if entry is None:
+            return True
+        return self._max_age is not None and time.time() - entry["updated_at"] > self._max_age
+
+    def put(self, device_info: HttpDeviceInfo, abilities: dict) -> None:
+        """
+        Stores the abilities reported by the given device. When they differ from the ones cached for the other
+        devices of the same kind, they are stored as a per-UUID override.
+        """
+        entry = {"abilities": abilities, "updated_at": time.time()}
+        key = _type_key(device_info.device_type, device_info.hdware_version, device_info.fmware_version)
+        type_entry = self._types.get(key)
+        if type_entry is None or type_entry["abilities"] == abilities:
+            self._types[key] = entry
+            self._overrides.pop(device_info.uuid, None)
+        else:
+            self._overrides[device_info.uuid] = entry
+        self._dirty = True
+
+    def set_override(self, device_uuid: str, abilities: dict) -> None:
+        """
+        Forces the abilities of the device with the given UUID, regardless of its type and versions
+        """
+        self._overrides[device_uuid] = {"abilities": abilities, "updated_at": time.time()}
+        self._dirty = True
+
+    def invalidate_device(self, device_uuid: str) -> None:
+        """
+        Drops the per-UUID override of the given device, if any
+        """
+        if self._overrides.pop(device_uuid, None) is not None:
+            self._dirty = True
+
+    def invalidate_type(self, device_type: str, hardware_version: str, firmware_version: str) -> None:
+        """
+        Drops the abilities cached for the given device kind
+        """
+        if self._types.pop(_type_key(device_type, hardware_version, firmware_version), None) is not None:
+            self._dirty = True
+
+    def clear(self) -> None:
+        self._types.clear()
+        self._overrides.clear()
+        self._dirty = True
+
+    def load(self) -> None:
+        """
+        Loads the cache from its file. Unreadable files and files written by an incompatible version are ignored.
+        """
+        try:
+            with open(self._path, "rt") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            _LOGGER.exception(f"Could not load the ability cache from {self._path}, ignoring it")
+            return
+        if data.get("version") != ABILITY_CACHE_FORMAT_VERSION:
+            _LOGGER.warning(f"Ignoring the ability cache {self._path}: unsupported version {data.get('version')}")
+            return
+        self._types = data.get("types", {})
+        self._overrides = data.get("devices", {})
+        self._dirty = False
+
+    def _snapshot(self) -> Tuple[dict, bool]:
+        data = {"version": ABILITY_CACHE_FORMAT_VERSION,
+                "types": dict(self._types),
+                "devices": dict(self._overrides)}
+        dirty = self._dirty
+        self._dirty = False
+        return data, dirty
+
+    def _write(self, data: dict) -> None:
+        with self._save_lock:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".abilities-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wt") as f:
+                    json.dump(data, f)
+                # Readers either see the previous file or the new one, never a partially written one
+                os.replace(tmp_path, self._path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def save(self) -> None:
+        """
+        Writes the cache to its file, if it changed
+        """
+        if self._path is None:
+            return
+        data, dirty = self._snapshot()
+        if dirty:
+            try:
+                self._write(data)
+            except Exception:
+                self._dirty = True
+                raise
+
+    async def async_save(self) -> None:
+        """
+        Writes the cache to its file, if it changed, without blocking the event loop
+        """
+        if self._path is None:
+            return
+        data, dirty = self._snapshot()
+        if dirty:
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self._write, data)
+            except Exception:
+                self._dirty = True
+                raise
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import ssl
+from asyncio import AbstractEventLoop
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+_LOGGER = logging.getLogger(__name__)
+
+# Maximum number of inbound packets processed every time the socket becomes readable.
+_MAX_PACKETS_PER_READ = 100
+_MIN_RECONNECT_DELAY = 1
+_MAX_RECONNECT_DELAY = 120
+
+
+class AsyncioMqttSocketDriver(object):
+    """
+    Drives the network IO of a paho mqtt client from an asyncio event loop, instead of relying on the
+    background network thread started by `loop_start()`.
+    The socket is registered to the loop via `add_reader()`/`add_writer()`, so every paho callback
+    (on_connect, on_message, on_subscribe, on_disconnect) is invoked within the event loop thread.
+    """
+
+    def __init__(self, client: mqtt.Client, loop: AbstractEventLoop, auto_reconnect: bool = True):
+        self._client = client
+        self._loop = loop
+        self._auto_reconnect = auto_reconnect
+        self._misc_task = None  # type: Optional[asyncio.Task]
+        self._reconnect_handle = None  # type: Optional[asyncio.TimerHandle]
+        self._reconnect_delay = _MIN_RECONNECT_DELAY
+        self._stopped = False
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def notify_connected(self) -> None:
+        """Resets the reconnection back-off: should be invoked once the connection has been established."""
+        self._reconnect_delay = _MIN_RECONNECT_DELAY
+
+    def notify_disconnected(self, rc: int) -> None:
+        """
+        Schedules a reconnection attempt, unless the disconnection was explicitly requested (rc == 0)
+        or the driver has been stopped.
+        """
+        if rc == mqtt.MQTT_ERR_SUCCESS or self._stopped or not self._auto_reconnect:
+            return
+        self._schedule_reconnect()
+
+    def stop(self) -> None:
+        """Stops any pending reconnection attempt and the housekeeping task."""
+        self._stopped = True
+        if self._reconnect_handle is not None:
+            self._reconnect_handle.cancel()
+            self._reconnect_handle = None
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    def _schedule_reconnect(self) -> None:
+        if self._reconnect_handle is not None:
+            return
+        _LOGGER.info("Scheduling mqtt reconnection in %d seconds", self._reconnect_delay)
+        self._reconnect_handle = self._loop.call_later(self._reconnect_delay, self._reconnect)
+        self._reconnect_delay = min(self._reconnect_delay * 2, _MAX_RECONNECT_DELAY)
+
+    def _reconnect(self) -> None:
+        self._reconnect_handle = None
+        if self._stopped:
+            return
+        try:
+            self._client.reconnect()
+        except (OSError, ssl.SSLError, mqtt.WebsocketConnectionError) as e:
+            _LOGGER.warning("MQTT reconnection attempt failed: %s", str(e))
+            self._schedule_reconnect()
+
+    def _on_socket_open(self, client: mqtt.Client, userdata, sock) -> None:
+        self._loop.add_reader(sock, self._on_readable, sock)
+        if self._misc_task is None or self._misc_task.done():
+            self._misc_task = self._loop.create_task(self._async_misc_loop())
+
+    def _on_socket_close(self, client: mqtt.Client, userdata, sock) -> None:
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+    def _on_socket_register_write(self, client: mqtt.Client, userdata, sock) -> None:
+        self._loop.add_writer(sock, self._client.loop_write)
+
+    def _on_socket_unregister_write(self, client: mqtt.Client, userdata, sock) -> None:
+        self._loop.remove_writer(sock)
+
+    def _on_readable(self, sock) -> None:
+        self._client.loop_read(max_packets=_MAX_PACKETS_PER_READ)
+        # TLS sockets might hold already-decrypted data that the selector won't report as readable.
+        if isinstance(sock, ssl.SSLSocket) and self._client.socket() is sock and sock.pending() > 0:
+            self._loop.call_soon(self._on_readable, sock)
+
+    async def _async_misc_loop(self) -> None:
+        # Handles keep-alive pings and retries, as paho's network thread would do.
+        try:
+            while not self._stopped:
+                rc = self._client.loop_misc()
+                if rc != mqtt.MQTT_ERR_SUCCESS and rc != mqtt.MQTT_ERR_NO_CONN:
+                    _LOGGER.debug("MQTT housekeeping returned %d", rc)
+                await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            pass
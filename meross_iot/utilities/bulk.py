@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Union, Callable, Awaitable
+
+from meross_iot.model.enums import Namespace
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BULK_MAX_CONCURRENCY = 32
+DEFAULT_BULK_MAX_CONCURRENCY_PER_BROKER = 16
+DEFAULT_BULK_MAX_CONCURRENCY_PER_DEVICE = 1
+
+
+class BulkCommandResult(object):
+    """
+    Outcome of a single command executed via `MerossManager.async_execute_many()`
+    """
+
+    def __init__(self,
+                 index: int,
+                 device: Any,
+                 method: str,
+                 namespace: Union[Namespace, str],
+                 payload: dict,
+                 result: Optional[dict] = None,
+                 error: Optional[Exception] = None):
+        self._index = index
+        self._device = device
+        self._method = method
+        self._namespace = namespace
+        self._payload = payload
+        self._result = result
+        self._error = error
+
+    @property
+    def index(self) -> int:
+        """
+        Position of the command within the iterable passed to `async_execute_many()`
+        """
+        return self._index
+
+    @property
+    def device(self) -> Any:
+        """
+        Device the command was sent to
+        """
+        return self._device
+
+    @property
+    def method(self) -> str:
+        return self._method
+
+    @property
+    def namespace(self) -> Union[Namespace, str]:
+        return self._namespace
+
+    @property
+    def payload(self) -> dict:
+        return self._payload
+
+    @property
+    def result(self) -> Optional[dict]:
+        """
+        Payload returned by the device, when the command succeeded
+        """
+        return self._result
+
+    @property
+    def error(self) -> Optional[Exception]:
+        """
+        Error raised while executing the command, if any
+        """
+        return self._error
+
+    @property
+    def succeeded(self) -> bool:
+        return self._error is None
+
+    def __repr__(self):
+        outcome = "OK" if self.succeeded else f"error: {self._error!r}"
+        return f"#{self._index} {self._method} {self._namespace} -> {self._device}: {outcome}"
+
+
+class BulkConcurrencyLimiter(object):
+    """
+    Bounds the number of commands executed at the same time: globally, per broker and per device.
+    Slots are always acquired in the same order (device, broker, global) so that waiters cannot deadlock.
+    """
+
+    def __init__(self, max_concurrency: int, max_concurrency_per_broker: int, max_concurrency_per_device: int):
+        if min(max_concurrency, max_concurrency_per_broker, max_concurrency_per_device) < 1:
+            raise ValueError("Concurrency limits must be greater than zero")
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._max_per_broker = max_concurrency_per_broker
+        self._max_per_device = max_concurrency_per_device
+        self._brokers: Dict[str, asyncio.Semaphore] = {}
+        self._devices: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, semaphores: Dict[str, asyncio.Semaphore], key: str, limit: int) -> asyncio.Semaphore:
+        sem = semaphores.get(key)
+        if sem is None:
+            sem = asyncio.Semaphore(limit)
+            semaphores[key] = sem
+        return sem
+
+    async def async_run(self, broker: str, device_uuid: str, command_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Waits for a free slot on the given broker and device, then executes the command built by `command_factory`
+        """
+        async with self._semaphore(self._devices, device_uuid, self._max_per_device):
+            async with self._semaphore(self._brokers, broker, self._max_per_broker):
+                async with self._global:
+                    return await command_factory()
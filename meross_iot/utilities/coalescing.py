@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+from asyncio import Future
+from typing import Dict, Tuple, Callable, Awaitable, Any
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _InFlightCommand(object):
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future: Future):
+        self.future = future
+        self.waiters = 0
+
+
+class CommandCoalescer(object):
+    """
+    Single-flight helper for GET commands: while a command for a given (device uuid, namespace, payload) is in
+    flight, identical commands are attached to it instead of being sent again.
+    The command is cancelled only when all the callers waiting for it have been cancelled.
+    Must be used from within the event loop.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Tuple[str, str, str], _InFlightCommand] = {}
+        self._saved_by_namespace: Dict[str, int] = {}
+
+    @staticmethod
+    def _command_key(device_uuid: str, namespace: str, payload: dict) -> Tuple[str, str, str]:
+        return device_uuid, namespace, json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+    async def async_execute(self,
+                            device_uuid: str,
+                            namespace: str,
+                            payload: dict,
+                            command_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executes the command built by `command_factory`, unless an identical command is already in flight:
+        in that case, waits for its result.
+        """
+        key = self._command_key(device_uuid, namespace, payload)
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            in_flight = _InFlightCommand(asyncio.ensure_future(command_factory()))
+            self._in_flight[key] = in_flight
+            in_flight.future.add_done_callback(lambda f: self._on_done(key, f))
+        else:
+            _LOGGER.debug("Attaching to the in-flight %s command for device %s", namespace, device_uuid)
+            self._saved_by_namespace[namespace] = self._saved_by_namespace.get(namespace, 0) + 1
+
+        in_flight.waiters += 1
+        try:
+            return await asyncio.shield(in_flight.future)
+        except asyncio.CancelledError:
+            if in_flight.waiters == 1 and not in_flight.future.done():
+                in_flight.future.cancel()
+            raise
+        finally:
+            in_flight.waiters -= 1
+
+    def _on_done(self, key: Tuple[str, str, str], future: Future) -> None:
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight.future is future:
+            del self._in_flight[key]
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of commands currently in flight
+        """
+        return len(self._in_flight)
+
+    @property
+    def saved_requests(self) -> int:
+        """
+        Total number of commands that were not sent because an identical one was already in flight
+        """
+        return sum(self._saved_by_namespace.values())
+
+    def saved_requests_by_namespace(self) -> Dict[str, int]:
+        """
+        Number of commands that were not sent because an identical one was already in flight, by namespace
+        """
+        return dict(self._saved_by_namespace)
@@ -0,0 +1,104 @@
+import json
+import logging
+from typing import Any, Union
+
+_LOGGER = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec(object):
+    """
+    Base JSON codec used by the library on the MQTT, LAN and HTTP API paths.
+    Implementations parse bytes directly and serialize to compact (no whitespace) bytes.
+    """
+    name = "abstract"
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        raise NotImplementedError()
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError()
+
+
+class StdlibJsonCodec(JsonCodec):
+    """
+    JSON codec relying on the python standard library
+    """
+    name = "json"
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode("utf-8")
+
+
+class OrjsonCodec(StdlibJsonCodec):
+    """
+    JSON codec relying on orjson. Whenever orjson would emit non-ASCII characters (that the stdlib escapes) or it
+    cannot serialize the given object (e.g. non-string dict keys), the stdlib serializer is used instead.
+    The output still differs from the stdlib codec for floats: exponents are written in their shortest form
+    (`1e-7` and `1e20` rather than `1e-07` and `1e+20`) and non-finite values become `null` (rather than the
+    non-standard `NaN` and `Infinity`).
+    """
+    name = "orjson"
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            res = orjson.dumps(obj)
+        except TypeError:
+            return super().dumps(obj)
+        if not res.isascii():
+            return super().dumps(obj)
+        return res
+
+
+def _default_codec() -> JsonCodec:
+    if orjson is not None:
+        return OrjsonCodec()
+    return StdlibJsonCodec()
+
+
+_codec: JsonCodec = _default_codec()
+
+
+def get_json_codec() -> JsonCodec:
+    """
+    Returns the JSON codec currently in use
+    """
+    return _codec
+
+
+def set_json_codec(codec: JsonCodec) -> None:
+    """
+    Overrides the JSON codec used by the library. By default, orjson is used when installed, falling back
+    to the python standard library otherwise.
+    """
+    global _codec
+    if not isinstance(codec, JsonCodec):
+        raise ValueError("The codec parameter must be a JsonCodec instance")
+    _LOGGER.debug("Using %s JSON codec", codec.name)
+    _codec = codec
+
+
+def json_loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    Parses the given JSON document (bytes are parsed directly, with no intermediate string)
+    """
+    return _codec.loads(data)
+
+
+def json_dumps(obj: Any) -> bytes:
+    """
+    Serializes the given object to compact JSON bytes
+    """
+    return _codec.dumps(obj)
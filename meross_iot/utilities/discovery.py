@@ -0,0 +1,90 @@
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_DISCOVERY_MAX_CONCURRENCY = 20
+DEFAULT_DISCOVERY_ABILITY_TIMEOUT = 3.0
+DEFAULT_DISCOVERY_ABILITY_RETRIES = 3
+DEFAULT_DISCOVERY_ABILITY_RETRY_DELAY = 10.0
+
+# Discovery phases
+PHASE_LIST_DEVICES = "list_devices"
+PHASE_ENROLL_NEW_DEVICES = "enroll_new_devices"
+PHASE_UPDATE_KNOWN_DEVICES = "update_known_devices"
+PHASE_LIST_HUB_SUBDEVICES = "list_hub_subdevices"
+PHASE_UPDATE_HUBS = "update_hubs"
+
+
+class DiscoveryStats(object):
+    """
+    Timings and counters of a device discovery run
+    """
+
+    def __init__(self):
+        self._started_at = time.monotonic()
+        self._finished_at: Optional[float] = None
+        # First start and last end of the operations of every phase
+        self._phase_spans: Dict[str, List[float]] = {}
+        self.new_devices = 0
+        """Number of devices enrolled for the first time"""
+        self.known_devices = 0
+        """Number of already known devices, updated with the HTTP information"""
+        self.subdevices = 0
+        """Number of hub subdevices enrolled"""
+        self.cached_abilities = 0
+        """Number of new devices built from the ability cache, without querying them"""
+        self.ability_timeouts = 0
+        """Number of devices that did not report their abilities in time, whose fetch is retried in background"""
+        self.failed_devices = 0
+        """Number of devices that could not be enrolled or updated"""
+
+    def phase(self, name: str) -> "_PhaseTimer":
+        """
+        Context manager that accounts the enclosed operation to the given discovery phase
+        """
+        return _PhaseTimer(self, name)
+
+    def finish(self) -> None:
+        """
+        Marks the discovery as finished, freezing its total time
+        """
+        self._finished_at = time.monotonic()
+
+    @property
+    def phase_timings(self) -> Dict[str, float]:
+        """
+        Seconds spent in every phase of the discovery, from the start of its first operation to the end of its
+        last one. Operations start once they get a concurrency slot, so the time spent waiting for the first slot
+        is not accounted. Phases overlap, as every device goes through them on its own.
+        """
+        return {name: end - start for name, (start, end) in self._phase_spans.items()}
+
+    @property
+    def total_time(self) -> float:
+        """
+        Seconds elapsed since the discovery started (until it finished, when done)
+        """
+        end = self._finished_at if self._finished_at is not None else time.monotonic()
+        return end - self._started_at
+
+    def __repr__(self):
+        phases = ", ".join(f"{name}: {elapsed:.2f}s" for name, elapsed in self.phase_timings.items())
+        return f"{self.new_devices} new devices, {self.known_devices} known devices, {self.subdevices} subdevices " \
+               f"({self.cached_abilities} from the ability cache, {self.ability_timeouts} ability timeouts, {self.failed_devices} failures) " \
+               f"in {self.total_time:.2f}s [{phases}]"
+
+
+class _PhaseTimer(object):
+    def __init__(self, stats: DiscoveryStats, name: str):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        now = time.monotonic()
+        span = self._stats._phase_spans.get(self._name)
+        if span is None:
+            self._stats._phase_spans[self._name] = [now, now]
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        span = self._stats._phase_spans[self._name]
+        span[1] = max(span[1], time.monotonic())
@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from meross_iot.model.enums import Namespace
+from meross_iot.utilities.tracing import trace_span, SPAN_PUSH_HANDLER
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PUSH_DISPATCH_MAX_CONCURRENCY = 50
+
+
+class PushCoalescingPolicy(Enum):
+    LATEST_WINS = "LATEST_WINS"
+    """Under overload, a queued push notification is replaced by a newer one for the same device/namespace/channel"""
+    KEEP_ALL = "KEEP_ALL"
+    """Every push notification is dispatched, unless the backlog is full"""
+
+
+# Namespaces whose push notifications carry the full state of a channel: only the latest one matters
+DEFAULT_LATEST_WINS_NAMESPACES = (
+    Namespace.SYSTEM_ONLINE,
+    Namespace.CONTROL_TOGGLE,
+    Namespace.CONTROL_TOGGLEX,
+    Namespace.CONTROL_ELECTRICITY,
+    Namespace.CONTROL_LIGHT,
+    Namespace.CONTROL_SPRAY,
+    Namespace.DIFFUSER_LIGHT,
+    Namespace.DIFFUSER_SPRAY,
+    Namespace.ROLLER_SHUTTER_POSITION,
+    Namespace.HUB_ONLINE,
+    Namespace.HUB_BATTERY,
+    Namespace.HUB_TOGGLEX,
+    Namespace.HUB_SENSOR_TEMPHUM,
+    Namespace.HUB_MTS100_TEMPERATURE,
+    Namespace.HUB_MTS100_MODE,
+    Namespace.CONTROL_THERMOSTAT_MODE,
+)
+
+
+def push_payload_channels(data: dict) -> Tuple:
+    """
+    Returns the channels (or subdevice ids, for hub push notifications) a push notification payload refers to,
+    so that only push notifications updating the very same channels are coalesced
+    """
+    channels = []
+    for value in data.values():
+        entries = value if isinstance(value, list) else (value,)
+        for entry in entries:
+            if isinstance(entry, dict):
+                channels.append(entry.get("channel", entry.get("id")))
+            else:
+                channels.append(None)
+    return tuple(channels)
+
+
+def _handler_name(handler: Callable) -> str:
+    return getattr(handler, "__qualname__", str(handler))
+
+
+class PushHandlerStats(object):
+    """
+    Execution counters of a push notification handler
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._calls = 0
+        self._errors = 0
+        self._timeouts = 0
+        self._total_time = 0.0
+        self._max_time = 0.0
+
+    def _notify_call(self, elapsed: float, error: bool = False, timeout: bool = False) -> None:
+        self._calls += 1
+        self._total_time += elapsed
+        if elapsed > self._max_time:
+            self._max_time = elapsed
+        if error:
+            self._errors += 1
+        if timeout:
+            self._timeouts += 1
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def calls(self) -> int:
+        """
+        Number of times the handler has been invoked
+        """
+        return self._calls
+
+    @property
+    def errors(self) -> int:
+        """
+        Number of invocations that raised an exception (timeouts excluded)
+        """
+        return self._errors
+
+    @property
+    def timeouts(self) -> int:
+        """
+        Number of invocations cancelled because they exceeded the handler timeout
+        """
+        return self._timeouts
+
+    @property
+    def avg_time(self) -> float:
+        """
+        Average execution time of the handler, in seconds
+        """
+        return self._total_time / self._calls if self._calls > 0 else 0.0
+
+    @property
+    def max_time(self) -> float:
+        """
+        Longest execution time of the handler, in seconds
+        """
+        return self._max_time
+
+    def __repr__(self):
+        return f"{self.name}: {self.calls} calls ({self.errors} errors, {self.timeouts} timeouts), " \
+               f"avg {self.avg_time * 1000:.1f}ms, max {self.max_time * 1000:.1f}ms"
+
+
+class PushDispatcher(object):
+    """
+    Dispatches push notifications with a serial queue per key (the originating device UUID): items sharing a key are
+    processed one at a time, in submission order, while items of different keys are processed concurrently, up to
+    `max_concurrency` at once.
+    The dispatcher also runs the manager-level handlers concurrently, timing each of them and cancelling the
+    ones exceeding their timeout, so that a slow consumer only delays the device it is handling.
+    The backlog can optionally be bounded (overload mode): past the coalescing threshold, a new item supersedes the
+    queued item with the same key and coalescing key; once the backlog is full, items that cannot be coalesced
+    are dropped.
+    Must be used from within the event loop.
+    """
+
+    def __init__(self,
+                 process: Callable[[Any], Awaitable],
+                 max_concurrency: int = DEFAULT_PUSH_DISPATCH_MAX_CONCURRENCY,
+                 handler_timeout: Optional[float] = None,
+                 max_backlog: Optional[int] = None,
+                 coalescing_threshold: Optional[int] = None,
+                 coalescing_key: Optional[Callable[[Any], Optional[Hashable]]] = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than zero")
+        if max_backlog is not None and max_backlog < 1:
+            raise ValueError("max_backlog must be greater than zero")
+        if coalescing_threshold is None and max_backlog is not None:
+            coalescing_threshold = max_backlog // 2
+        self._process = process
+        self._max_backlog = max_backlog
+        self._coalescing_threshold = coalescing_threshold
+        self._coalescing_key = coalescing_key
+        self._max_concurrency = max_concurrency
+        self._handler_timeout = handler_timeout
+        self._handler_timeouts: Dict[Callable, Optional[float]] = {}
+        self._handler_stats: Dict[Callable, PushHandlerStats] = {}
+        # Queued items are stored along with their coalescing key, so that the latest item of every key can be tracked
+        self._queues: Dict[Hashable, Deque[Tuple[Optional[Hashable], Any]]] = {}
+        self._latest: Dict[Tuple[Hashable, Hashable], Any] = {}
+        self._backlog = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._max_observed_backlog = 0
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+        # Created lazily, so that it's bound to the running loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def handler_timeout(self) -> Optional[float]:
+        """
+        Default timeout, in seconds, of the handlers with no timeout of their own (None means no timeout)
+        """
+        return self._handler_timeout
+
+    @handler_timeout.setter
+    def handler_timeout(self, value: Optional[float]) -> None:
+        self._handler_timeout = value
+
+    @property
+    def backlog(self) -> int:
+        """
+        Number of items waiting to be processed, across all the keys
+        """
+        return self._backlog
+
+    @property
+    def max_observed_backlog(self) -> int:
+        """
+        Highest number of items observed waiting to be processed
+        """
+        return self._max_observed_backlog
+
+    @property
+    def max_backlog(self) -> Optional[int]:
+        """
+        Maximum number of items waiting to be processed: when reached, items that cannot be coalesced are dropped.
+        None means unbounded (overload mode disabled).
+        """
+        return self._max_backlog
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of items discarded because the backlog was full
+        """
+        return self._dropped
+
+    @property
+    def coalesced(self) -> int:
+        """
+        Number of queued items superseded by a newer item with the same coalescing key
+        """
+        return self._coalesced
+
+    @property
+    def active_keys(self) -> int:
+        """
+        Number of keys with items being processed or waiting to be processed
+        """
+        return len(self._workers)
+
+    def set_handler_timeout(self, handler: Callable, timeout: Optional[float]) -> None:
+        """
+        Overrides the timeout of the given handler (None means no timeout)
+        """
+        self._handler_timeouts[handler] = timeout
+
+    def remove_handler(self, handler: Callable) -> None:
+        """
+        Forgets the timeout override of the given handler. Its counters are kept.
+        """
+        self._handler_timeouts.pop(handler, None)
+
+    def handler_stats(self) -> List[PushHandlerStats]:
+        """
+        Execution counters of all the handlers invoked so far
+        """
+        return list(self._handler_stats.values())
+
+    def submit(self, key: Hashable, item: Any, force: bool = False) -> bool:
+        """
+        Enqueues the given item: it is processed after all the items previously submitted with the same key.
+        When the backlog exceeds the coalescing threshold, a queued item with the same key and coalescing key is
+        discarded in favour of the new one. When the backlog is full, the item is dropped and False is returned,
+        unless `force` is set: forced items are always queued, even past `max_backlog`.
+        """
+        coalescing_key = None
+        if self._coalescing_threshold is not None and self._backlog >= self._coalescing_threshold \
+                and self._coalescing_key is not None:
+            coalescing_key = self._coalescing_key(item)
+            if coalescing_key is not None:
+                superseded = self._latest.get((key, coalescing_key))
+                if superseded is not None:
+                    # The superseded entry is removed and the new one appended, as if the former never arrived
+                    self._queues[key].remove(superseded)
+                    self._backlog -= 1
+                    self._coalesced += 1
+
+        if not force and self._max_backlog is not None and self._backlog >= self._max_backlog:
+            self._dropped += 1
+            _LOGGER.debug(f"Push backlog full ({self._backlog} items), dropping {item}")
+            return False
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = deque()
+            self._queues[key] = queue
+            if self._idle is not None:
+                self._idle.clear()
+            self._workers[key] = asyncio.ensure_future(self._async_drain_key(key, queue))
+        entry = (coalescing_key, item)
+        queue.append(entry)
+        if coalescing_key is not None:
+            self._latest[(key, coalescing_key)] = entry
+        self._backlog += 1
+        if self._backlog > self._max_observed_backlog:
+            self._max_observed_backlog = self._backlog
+        return True
+
+    async def _async_drain_key(self, key: Hashable, queue: Deque[Any]) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        try:
+            while queue:
+                # Items waiting for a slot stay in the backlog, where they can still be coalesced
+                async with self._semaphore:
+                    if not queue:
+                        break
+                    entry = queue.popleft()
+                    coalescing_key, item = entry
+                    self._backlog -= 1
+                    if coalescing_key is not None and self._latest.get((key, coalescing_key)) is entry:
+                        del self._latest[(key, coalescing_key)]
+                    try:
+                        await self._process(item)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:
+                        _LOGGER.exception(f"Uncaught error occurred while dispatching {item}")
+        finally:
+            # No await between the emptiness check and the removal: items submitted meanwhile find no queue
+            # and start a new worker
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+                del self._workers[key]
+            if not self._workers and self._idle is not None:
+                self._idle.set()
+
+    async def _async_invoke_handler(self, handler: Callable, args: tuple) -> None:
+        stats = self._handler_stats.get(handler)
+        if stats is None:
+            stats = PushHandlerStats(_handler_name(handler))
+            self._handler_stats[handler] = stats
+        timeout = self._handler_timeouts.get(handler, self._handler_timeout)
+        start = time.perf_counter()
+        try:
+            with trace_span(SPAN_PUSH_HANDLER, {"meross.handler": stats.name}):
+                if timeout is None:
+                    await handler(*args)
+                else:
+                    await asyncio.wait_for(handler(*args), timeout=timeout)
+        except asyncio.TimeoutError:
+            stats._notify_call(time.perf_counter() - start, timeout=True)
+            _LOGGER.warning(f"Push notification handler {stats.name} timed out after {timeout}s and was cancelled")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats._notify_call(time.perf_counter() - start, error=True)
+            _LOGGER.exception(f"Uncaught error occurred while executing push notification handler {stats.name}")
+        else:
+            stats._notify_call(time.perf_counter() - start)
+
+    async def async_invoke_handlers(self, handlers: Iterable[Callable], *args) -> None:
+        """
+        Invokes the given handlers concurrently with the given arguments, and waits for all of them to complete
+        (or to time out). Errors are logged and accounted, but never propagated.
+        """
+        handlers = list(handlers)
+        if len(handlers) == 1:
+            await self._async_invoke_handler(handlers[0], args)
+        elif handlers:
+            await asyncio.gather(*(self._async_invoke_handler(h, args) for h in handlers))
+
+    async def async_join(self) -> None:
+        """
+        Waits until all the submitted items have been processed
+        """
+        if not self._workers:
+            return
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        await self._idle.wait()
+
+    def close(self) -> None:
+        """
+        Drops all the queued items and cancels the ones being processed
+        """
+        for queue in self._queues.values():
+            queue.clear()
+        self._latest.clear()
+        self._backlog = 0
+        for worker in self._workers.values():
+            worker.cancel()
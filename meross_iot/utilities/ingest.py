@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Any, Deque, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INGEST_MAX_BATCH_SIZE = 256
+
+
+class IngestQueueStats(object):
+    """
+    Helper class that holds the counters of a `BatchedIngestQueue`
+    """
+    def __init__(self):
+        self._enqueued = 0
+        self._drained = 0
+        self._batches = 0
+        self._max_queue_depth = 0
+        self._total_drain_latency = 0.0
+        self._last_drain_latency = 0.0
+        self._max_drain_latency = 0.0
+
+    def _notify_enqueued(self, depth: int) -> None:
+        self._enqueued += 1
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+
+    def _notify_batch(self, size: int, latency: float) -> None:
+        self._drained += size
+        self._batches += 1
+        self._total_drain_latency += latency
+        self._last_drain_latency = latency
+        if latency > self._max_drain_latency:
+            self._max_drain_latency = latency
+
+    @property
+    def enqueued(self) -> int:
+        """
+        Total number of messages appended to the queue
+        """
+        return self._enqueued
+
+    @property
+    def drained(self) -> int:
+        """
+        Total number of messages consumed by the event loop
+        """
+        return self._drained
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of messages currently waiting to be consumed
+        """
+        return self._enqueued - self._drained
+
+    @property
+    def max_queue_depth(self) -> int:
+        """
+        Highest number of messages observed within the queue
+        """
+        return self._max_queue_depth
+
+    @property
+    def batches(self) -> int:
+        """
+        Number of batches drained so far
+        """
+        return self._batches
+
+    @property
+    def last_drain_latency(self) -> float:
+        """
+        Seconds elapsed between the loop wake-up request and the drain of the last batch
+        """
+        return self._last_drain_latency
+
+    @property
+    def max_drain_latency(self) -> float:
+        """
+        Highest drain latency observed, in seconds
+        """
+        return self._max_drain_latency
+
+    @property
+    def avg_drain_latency(self) -> float:
+        """
+        Average drain latency, in seconds
+        """
+        if self._batches == 0:
+            return 0.0
+        return self._total_drain_latency / self._batches
+
+    def __repr__(self):
+        return f"enqueued: {self.enqueued}, drained: {self.drained}, depth: {self.queue_depth} " \
+               f"(max {self.max_queue_depth}), batches: {self.batches}, " \
+               f"drain latency: avg {self.avg_drain_latency * 1000:.3f}ms, max {self.max_drain_latency * 1000:.3f}ms"
+
+
+class BatchedIngestQueue(object):
+    """
+    Thread-safe queue that moves messages from the MQTT network thread to the event loop in batches.
+    Producers append items from any thread: the event loop is woken up only once per burst, then drains the
+    queue in batches of at most `max_batch_size` items, handing every batch to the consumer callback.
+    """
+
+    def __init__(self,
+                 consumer: Callable[[List[Any]], None],
+                 wake: Callable[[Callable], None],
+                 reschedule: Callable[[Callable], Any],
+                 max_batch_size: int = DEFAULT_INGEST_MAX_BATCH_SIZE):
+        """
+        :param consumer: callable invoked within the event loop with the list of drained items
+        :param wake: callable used by producers to schedule the drain within the event loop
+                     (e.g. `loop.call_soon_threadsafe`)
+        :param reschedule: callable used within the event loop to schedule the drain of the next batch
+                           (e.g. `loop.call_soon`)
+        :param max_batch_size: maximum number of items handed to the consumer at once
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive number")
+        self._consumer = consumer
+        self._wake = wake
+        self._reschedule = reschedule
+        self._max_batch_size = max_batch_size
+        self._items: Deque[Any] = deque()
+        self._lock = threading.Lock()
+        self._drain_scheduled = False
+        self._wake_ts: Optional[float] = None
+        self._stats = IngestQueueStats()
+
+    @property
+    def stats(self) -> IngestQueueStats:
+        return self._stats
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    @max_batch_size.setter
+    def max_batch_size(self, value: int) -> None:
+        if value < 1:
+            raise ValueError("max_batch_size must be a positive number")
+        self._max_batch_size = value
+
+    def put(self, item: Any) -> None:
+        """
+        Appends an item to the queue. Safe to be called from any thread.
+        """
+        with self._lock:
+            self._items.append(item)
+            self._stats._notify_enqueued(len(self._items))
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+            self._wake_ts = time.monotonic()
+        self._wake(self._drain)
+
+    def _drain(self) -> None:
+        with self._lock:
+            batch_size = min(len(self._items), self._max_batch_size)
+            batch = [self._items.popleft() for _ in range(batch_size)]
+            has_more = len(self._items) > 0
+            if not has_more:
+                self._drain_scheduled = False
+            now = time.monotonic()
+            latency = now - self._wake_ts
+            self._stats._notify_batch(batch_size, latency)
+            if has_more:
+                self._wake_ts = now
+
+        try:
+            if batch:
+                self._consumer(batch)
+        except Exception:
+            _LOGGER.exception("Uncaught error occurred while consuming ingested messages")
+        finally:
+            # Leave room to other callbacks before draining the next batch
+            if has_more:
+                self._reschedule(self._drain)
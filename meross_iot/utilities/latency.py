@@ -0,0 +1,299 @@
+import math
+import threading
+import time
+from datetime import timedelta
+from enum import Enum
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence, Tuple, List
+
+_MIN_LATENCY = 1e-5
+"""Smallest latency (seconds) tracked with full precision: lower values fall in the first bucket"""
+_MAX_LATENCY = 3600.0
+"""Highest latency (seconds) tracked with full precision: higher values fall in the last bucket"""
+_GROWTH_FACTOR = 1.05
+"""Ratio between the bounds of a bucket: values are reported with a relative error lower than 2.5%"""
+_LOG_GROWTH = math.log(_GROWTH_FACTOR)
+_BUCKET_COUNT = int(math.ceil(math.log(_MAX_LATENCY / _MIN_LATENCY) / _LOG_GROWTH)) + 1
+
+DEFAULT_LATENCY_SLOT_SECONDS = 10
+DEFAULT_LATENCY_SLOTS = 60
+
+DEFAULT_LATENCY_HISTOGRAM_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""Upper bounds (seconds) of the cumulative latency histogram buckets, as exported to monitoring systems"""
+
+
+class LatencyTransport(Enum):
+    MQTT = "MQTT"
+    """Commands sent to the devices via the Meross MQTT brokers"""
+    LAN_HTTP = "LAN_HTTP"
+    """Commands sent to the devices via the local network"""
+    HTTP_API = "HTTP_API"
+    """Requests to the Meross HTTP API"""
+
+
+def _bucket_of(value: float) -> int:
+    if value <= _MIN_LATENCY:
+        return 0
+    return min(_BUCKET_COUNT - 1, int(math.log(value / _MIN_LATENCY) / _LOG_GROWTH) + 1)
+
+
+def _bucket_value(bucket: int) -> float:
+    """Representative value of a bucket (geometric midpoint of its bounds)"""
+    if bucket == 0:
+        return _MIN_LATENCY
+    return _MIN_LATENCY * (_GROWTH_FACTOR ** (bucket - 0.5))
+
+
+class LatencyStats(object):
+    """
+    Latency percentiles (in seconds) computed over a time window
+    """
+
+    def __init__(self, count: int = 0, p50: float = 0.0, p90: float = 0.0, p99: float = 0.0, max: float = 0.0):
+        self._count = count
+        self._p50 = p50
+        self._p90 = p90
+        self._p99 = p99
+        self._max = max
+
+    @property
+    def count(self) -> int:
+        """
+        Number of samples within the time window
+        """
+        return self._count
+
+    @property
+    def p50(self) -> float:
+        return self._p50
+
+    @property
+    def p90(self) -> float:
+        return self._p90
+
+    @property
+    def p99(self) -> float:
+        return self._p99
+
+    @property
+    def max(self) -> float:
+        return self._max
+
+    def __repr__(self):
+        return f"count: {self.count}, p50: {self.p50 * 1000:.1f}ms, p90: {self.p90 * 1000:.1f}ms, " \
+               f"p99: {self.p99 * 1000:.1f}ms, max: {self.max * 1000:.1f}ms"
+
+
+class _LatencySlot(object):
+    __slots__ = ("epoch", "buckets", "max")
+
+    def __init__(self):
+        self.epoch = -1
+        self.buckets: Dict[int, int] = {}
+        self.max = 0.0
+
+
+class WindowedLatencyHistogram(object):
+    """
+    Log-bucketed latency histogram (HDR-like) split in a ring of time slots, so that percentiles can be
+    queried over a recent time window. Memory is bounded by the number of slots and buckets, regardless of the
+    number of recorded samples.
+    """
+
+    def __init__(self, slot_seconds: int = DEFAULT_LATENCY_SLOT_SECONDS, slots: int = DEFAULT_LATENCY_SLOTS):
+        self._slot_seconds = slot_seconds
+        self._slots = [_LatencySlot() for _ in range(slots)]
+        self._last_epoch = -1
+
+    def is_idle(self, now: float) -> bool:
+        """
+        Tells whether all the samples recorded so far fall out of the longest queryable time window
+        """
+        return int(now // self._slot_seconds) - self._last_epoch >= len(self._slots)
+
+    def record(self, latency: float, now: float) -> None:
+        epoch = int(now // self._slot_seconds)
+        if epoch > self._last_epoch:
+            self._last_epoch = epoch
+        slot = self._slots[epoch % len(self._slots)]
+        if slot.epoch != epoch:
+            slot.epoch = epoch
+            slot.buckets.clear()
+            slot.max = 0.0
+        bucket = _bucket_of(latency)
+        slot.buckets[bucket] = slot.buckets.get(bucket, 0) + 1
+        if latency > slot.max:
+            slot.max = latency
+
+    def merge_into(self, buckets: Dict[int, int], time_window: timedelta, now: float) -> float:
+        """
+        Adds the samples recorded within the time window to the given buckets and returns their max value
+        """
+        current = int(now // self._slot_seconds)
+        first = current - min(len(self._slots), int(math.ceil(time_window.total_seconds() / self._slot_seconds))) + 1
+        max_value = 0.0
+        for slot in self._slots:
+            if first <= slot.epoch <= current:
+                for bucket, count in slot.buckets.items():
+                    buckets[bucket] = buckets.get(bucket, 0) + count
+                if slot.max > max_value:
+                    max_value = slot.max
+        return max_value
+
+
+class LatencyTotals(object):
+    """
+    Cumulative latency histogram, counting all the samples recorded since its creation into fixed buckets
+    """
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds = tuple(bounds)
+        # The last bucket counts the samples higher than the highest bound
+        self._buckets = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def _record(self, latency: float) -> None:
+        self._buckets[bisect_left(self._bounds, latency)] += 1
+        self._sum += latency
+        self._count += 1
+
+    def _copy(self) -> "LatencyTotals":
+        copy = LatencyTotals(self._bounds)
+        copy._buckets = list(self._buckets)
+        copy._sum = self._sum
+        copy._count = self._count
+        return copy
+
+    @property
+    def bounds(self) -> Tuple[float, ...]:
+        """
+        Upper bounds (inclusive) of the buckets, in seconds
+        """
+        return self._bounds
+
+    @property
+    def cumulative_counts(self) -> List[int]:
+        """
+        Number of samples lower than or equal to every bound, followed by the total number of samples
+        """
+        counts = []
+        total = 0
+        for count in self._buckets:
+            total += count
+            counts.append(total)
+        return counts
+
+    @property
+    def sum(self) -> float:
+        """
+        Sum of all the recorded latencies, in seconds
+        """
+        return self._sum
+
+    @property
+    def count(self) -> int:
+        """
+        Number of recorded samples
+        """
+        return self._count
+
+
+class LatencyRecorder(object):
+    """
+    Keeps track of the round-trip latencies, keyed by device UUID, namespace and transport.
+    The resolution of the time window is `slot_seconds`, while the longest queryable window
+    is `slot_seconds * slots`. Memory is bounded per key: the histograms of the keys with no samples within the
+    longest window are discarded.
+    Next to the windowed histograms, cumulative histograms with the given bounds are kept by namespace and
+    transport, to be exported to monitoring systems. Those are never discarded, as they back monotonic counters:
+    their number grows with the distinct namespaces (and HTTP API URLs) only.
+    """
+
+    def __init__(self, slot_seconds: int = DEFAULT_LATENCY_SLOT_SECONDS, slots: int = DEFAULT_LATENCY_SLOTS,
+                 histogram_bounds: Sequence[float] = DEFAULT_LATENCY_HISTOGRAM_BOUNDS):
+        self._slot_seconds = slot_seconds
+        self._slots = slots
+        self._histogram_bounds = tuple(sorted(histogram_bounds))
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[Optional[str], str, LatencyTransport], WindowedLatencyHistogram] = {}
+        self._totals: Dict[Tuple[LatencyTransport, str], LatencyTotals] = {}
+        self._next_eviction = 0.0
+
+    def record(self, transport: LatencyTransport, namespace: str, latency: float,
+               device_uuid: Optional[str] = None) -> None:
+        """
+        Records a round-trip latency, in seconds
+        """
+        key = (device_uuid, namespace, transport)
+        now = time.time()
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = WindowedLatencyHistogram(slot_seconds=self._slot_seconds, slots=self._slots)
+                self._histograms[key] = histogram
+            histogram.record(latency, now)
+            totals = self._totals.get((transport, namespace))
+            if totals is None:
+                totals = LatencyTotals(self._histogram_bounds)
+                self._totals[(transport, namespace)] = totals
+            totals._record(latency)
+            # Idle keys are looked for once per slot
+            if now >= self._next_eviction:
+                self._next_eviction = now + self._slot_seconds
+                self._evict_idle_histograms(now)
+
+    def _evict_idle_histograms(self, now: float) -> None:
+        idle = [key for key, histogram in self._histograms.items() if histogram.is_idle(now)]
+        for key in idle:
+            del self._histograms[key]
+
+    def keys(self) -> List[Tuple[Optional[str], str, LatencyTransport]]:
+        """
+        (device uuid, namespace, transport) combinations for which latencies have been recorded
+        """
+        with self._lock:
+            return list(self._histograms.keys())
+
+    def get_totals(self) -> Dict[Tuple[LatencyTransport, str], LatencyTotals]:
+        """
+        Cumulative histograms of all the latencies recorded so far, by transport and namespace
+        """
+        with self._lock:
+            return {key: totals._copy() for key, totals in self._totals.items()}
+
+    def get_stats(self,
+                  device_uuid: Optional[str] = None,
+                  namespace: Optional[str] = None,
+                  transport: Optional[LatencyTransport] = None,
+                  time_window: timedelta = timedelta(minutes=1)) -> LatencyStats:
+        """
+        Returns the latency percentiles over the given time window. Samples are aggregated across all the
+        device UUIDs, namespaces and transports matching the given filters (None matches everything).
+        """
+        buckets: Dict[int, int] = {}
+        max_value = 0.0
+        now = time.time()
+        with self._lock:
+            for (uuid, ns, tr), histogram in self._histograms.items():
+                if device_uuid is not None and uuid != device_uuid:
+                    continue
+                if namespace is not None and ns != namespace:
+                    continue
+                if transport is not None and tr != transport:
+                    continue
+                max_value = max(max_value, histogram.merge_into(buckets, time_window, now))
+
+        total = sum(buckets.values())
+        if total == 0:
+            return LatencyStats()
+
+        targets = [(0.5, None), (0.9, None), (0.99, None)]
+        seen = 0
+        for bucket in sorted(buckets):
+            seen += buckets[bucket]
+            for i, (quantile, value) in enumerate(targets):
+                if value is None and seen >= quantile * total:
+                    # Never report a percentile higher than the max observed value
+                    targets[i] = (quantile, min(_bucket_value(bucket), max_value))
+        return LatencyStats(count=total, p50=targets[0][1], p90=targets[1][1], p99=targets[2][1], max=max_value)
@@ -0,0 +1,125 @@
+import logging
+import time
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_GLOBAL_RATE_PER_SECOND = 4.0
+DEFAULT_GLOBAL_BURST = 40
+DEFAULT_DEVICE_RATE_PER_SECOND = 1.0
+DEFAULT_DEVICE_BURST = 5
+
+
+class RateLimitPolicy(Enum):
+    DELAY = "DELAY"
+    """Over-quota commands wait until enough budget is available"""
+    DROP = "DROP"
+    """Over-quota commands are dropped (`RateLimitExceeded` is raised), unless invoked with drop_on_overquota=False:
+    in that case they are delayed"""
+    RAISE = "RAISE"
+    """Over-quota commands always fail right away with `RateLimitExceeded`"""
+
+
+class RateLimitDecision(Enum):
+    SEND = "SEND"
+    DELAY = "DELAY"
+    DROP = "DROP"
+
+
+class TokenBucket(object):
+    """
+    Token bucket holding up to `burst` tokens, refilled at `rate` tokens per second.
+    Tokens can be reserved in advance: in that case the bucket goes in debt and the caller is told how long
+    to wait before its token becomes available.
+    """
+    __slots__ = ("rate", "burst", "_tokens", "_last")
+
+    def __init__(self, rate: float, burst: int, now: Optional[float] = None):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive and burst must be greater than zero")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        Seconds to wait before a token becomes available
+        """
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        """
+        Takes a token from the bucket, going in debt if none is currently available
+        """
+        self._refill(now)
+        self._tokens -= 1
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+class ApiRateLimiter(object):
+    """
+    Token-bucket rate limiter applied to the commands sent to the Meross MQTT brokers.
+    Every command must fit both the account-wide (global) budget and the budget of its target device.
+    Must be used from within the event loop.
+    """
+
+    def __init__(self,
+                 global_rate: float = DEFAULT_GLOBAL_RATE_PER_SECOND,
+                 global_burst: int = DEFAULT_GLOBAL_BURST,
+                 device_rate: float = DEFAULT_DEVICE_RATE_PER_SECOND,
+                 device_burst: int = DEFAULT_DEVICE_BURST,
+                 over_limit_policy: RateLimitPolicy = RateLimitPolicy.DELAY):
+        """
+        :param global_rate: commands per second allowed for the whole account
+        :param global_burst: maximum number of commands that can be sent at once for the whole account
+        :param device_rate: commands per second allowed for every device
+        :param device_burst: maximum number of commands that can be sent at once to every device
+        :param over_limit_policy: what to do with the commands exceeding the budget
+        """
+        self._global = TokenBucket(rate=global_rate, burst=global_burst)
+        self._device_rate = device_rate
+        self._device_burst = device_burst
+        self._devices: Dict[str, TokenBucket] = {}
+        self.over_limit_policy = over_limit_policy
+
+    def _device_bucket(self, device_uuid: str, now: float) -> TokenBucket:
+        bucket = self._devices.get(device_uuid)
+        if bucket is None:
+            bucket = TokenBucket(rate=self._device_rate, burst=self._device_burst, now=now)
+            self._devices[device_uuid] = bucket
+        return bucket
+
+    def acquire(self, device_uuid: str, drop_on_overquota: bool = True) -> Tuple[RateLimitDecision, float]:
+        """
+        Checks the budget for a command targeting the given device.
+        Returns the decision taken and, when the command has to be delayed, the number of seconds to wait.
+        The budget is consumed (reserved, in case of delay) unless the command is dropped.
+        """
+        now = time.monotonic()
+        device_bucket = self._device_bucket(device_uuid, now)
+        wait = max(self._global.wait_time(now), device_bucket.wait_time(now))
+
+        if wait > 0:
+            policy = self.over_limit_policy
+            if policy == RateLimitPolicy.RAISE or (policy == RateLimitPolicy.DROP and drop_on_overquota):
+                return RateLimitDecision.DROP, 0.0
+
+        self._global.consume(now)
+        device_bucket.consume(now)
+        if wait > 0:
+            return RateLimitDecision.DELAY, wait
+        return RateLimitDecision.SEND, 0.0
@@ -0,0 +1,174 @@
+import logging
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from aiohttp import web
+
+if TYPE_CHECKING:
+    from meross_iot.http_api import MerossHttpClient
+    from meross_iot.manager import MerossManager
+    from meross_iot.utilities.latency import LatencyTotals
+
+_LOGGER = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DEFAULT_METRICS_PREFIX = "meross"
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class OpenMetricsExporter(object):
+    """
+    Renders the counters tracked by a `MerossManager` (and, optionally, by its `MerossHttpClient`) in the
+    Prometheus text exposition format or in the OpenMetrics one.
+    All the exported counters are cumulative since the manager was created, so that rendering only walks
+    already aggregated values. Label sets are formatted once and cached across renders.
+    """
+
+    def __init__(self,
+                 manager: "MerossManager",
+                 http_client: Optional["MerossHttpClient"] = None,
+                 prefix: str = DEFAULT_METRICS_PREFIX):
+        self._manager = manager
+        self._http_client = http_client
+        self._prefix = prefix
+        self._label_cache: Dict[Tuple[Tuple[str, ...], Hashable], str] = {}
+
+    def _labels(self, names: Tuple[str, ...], values: tuple) -> str:
+        key = (names, values)
+        labels = self._label_cache.get(key)
+        if labels is None:
+            labels = "{" + ",".join(f"{name}=\"{_escape_label_value(value)}\"" for name, value in zip(names, values)) + "}"
+            self._label_cache[key] = labels
+        return labels
+
+    def _family(self,
+                lines: List[str],
+                name: str,
+                metric_type: str,
+                help_text: str,
+                openmetrics: bool,
+                samples: Sequence[Tuple[tuple, float]],
+                label_names: Tuple[str, ...] = ()) -> None:
+        family = f"{self._prefix}_{name}"
+        sample_name = f"{family}_total" if metric_type == "counter" else family
+        # The OpenMetrics format names the counter family without its _total suffix
+        described = family if openmetrics else sample_name
+        lines.append(f"# HELP {described} {help_text}")
+        lines.append(f"# TYPE {described} {metric_type}")
+        for label_values, value in samples:
+            if label_names:
+                lines.append(f"{sample_name}{self._labels(label_names, label_values)} {value}")
+            else:
+                lines.append(f"{sample_name} {value}")
+
+    def _histogram(self,
+                   lines: List[str],
+                   name: str,
+                   help_text: str,
+                   samples: Sequence[Tuple[tuple, "LatencyTotals"]],
+                   label_names: Tuple[str, ...]) -> None:
+        family = f"{self._prefix}_{name}"
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} histogram")
+        bucket_names = label_names + ("le",)
+        for label_values, totals in samples:
+            bounds = [repr(float(b)) for b in totals.bounds] + ["+Inf"]
+            for bound, count in zip(bounds, totals.cumulative_counts):
+                lines.append(f"{family}_bucket{self._labels(bucket_names, label_values + (bound,))} {count}")
+            labels = self._labels(label_names, label_values)
+            lines.append(f"{family}_sum{labels} {totals.sum}")
+            lines.append(f"{family}_count{labels} {totals.count}")
+
+    def render(self, openmetrics: bool = False) -> str:
+        """
+        Returns the current value of the metrics, in the Prometheus text format or in the OpenMetrics one
+        """
+        lines = []
+        manager = self._manager
+
+        api_calls, delayed_calls, dropped_calls = manager.api_stats.get_totals()
+        method_ns = ("method", "namespace")
+        self._family(lines, "api_calls", "counter", "Commands sent to the MQTT brokers", openmetrics,
+                     list(api_calls.items()), method_ns)
+        self._family(lines, "api_delayed_calls", "counter", "Commands delayed by the API rate limiter", openmetrics,
+                     list(delayed_calls.items()), method_ns)
+        self._family(lines, "api_dropped_calls", "counter", "Commands dropped by the API rate limiter", openmetrics,
+                     list(dropped_calls.items()), method_ns)
+
+        self._family(lines, "pending_commands", "gauge", "Commands waiting for an ACK", openmetrics,
+                     [((), len(manager.pending_commands))])
+        self._family(lines, "late_responses", "counter", "ACKs received after their command timed out",
+                     openmetrics, list(manager.pending_commands.late_responses().items()), ("device_uuid", "namespace"))
+
+        connection_stats = manager.mqtt_connection_stats
+        broker_connection = ("broker", "connection")
+        self._family(lines, "mqtt_connection_up", "gauge", "Whether the MQTT connection is established", openmetrics,
+                     [((s.broker, s.index), 1 if s.connected else 0) for s in connection_stats], broker_connection)
+        self._family(lines, "mqtt_connection_in_flight", "gauge", "Commands waiting for an ACK on the MQTT connection",
+                     openmetrics, [((s.broker, s.index), s.in_flight) for s in connection_stats], broker_connection)
+        self._family(lines, "mqtt_connection_sent", "counter", "Commands sent over the MQTT connection", openmetrics,
+                     [((s.broker, s.index), s.sent) for s in connection_stats], broker_connection)
+
+        self._family(lines, "push_notifications", "counter", "Push notifications received", openmetrics,
+                     [((namespace,), count) for namespace, count in manager.push_notification_stats.items()],
+                     ("namespace",))
+        self._family(lines, "push_notifications_backlog", "gauge", "Push notifications waiting to be dispatched",
+                     openmetrics, [((), manager.push_dispatch_backlog)])
+        self._family(lines, "push_notifications_coalesced", "counter",
+                     "Push notifications superseded by a newer one while waiting to be dispatched", openmetrics,
+                     [((), manager.push_coalesced)])
+        self._family(lines, "push_notifications_dropped", "counter",
+                     "Push notifications dropped because the backlog was full", openmetrics,
+                     [((), manager.push_dropped)])
+
+        self._histogram(lines, "command_latency_seconds", "Round-trip latency of the commands and HTTP API requests",
+                        [((transport.value, namespace), totals)
+                         for (transport, namespace), totals in manager.latency_stats.get_totals().items()],
+                        ("transport", "namespace"))
+
+        error_budget = manager.error_budget
+        self._family(lines, "lan_error_budget_max", "gauge", "LAN errors tolerated per device within the time window",
+                     openmetrics, [((), error_budget.max_errors)])
+        self._family(lines, "lan_error_budget_remaining", "gauge",
+                     "LAN errors still tolerated within the current time window, for the devices that reported errors",
+                     openmetrics, [((uuid,), budget) for uuid, budget in error_budget.get_budgets().items()],
+                     ("device_uuid",))
+
+        if self._http_client is not None:
+            self._family(lines, "http_requests", "counter", "Requests sent to the Meross HTTP API", openmetrics,
+                         [((url, http_code, api_code.name if api_code is not None else ""), count)
+                          for (url, http_code, api_code), count in self._http_client.stats.get_totals().items()],
+                         ("url", "http_code", "api_code"))
+
+        if openmetrics:
+            lines.append("# EOF")
+        lines.append("")
+        return "\n".join(lines)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """
+        aiohttp handler serving the metrics. The OpenMetrics format is used when the scraper accepts it.
+        """
+        openmetrics = "application/openmetrics-text" in request.headers.get("Accept", "")
+        body = self.render(openmetrics=openmetrics)
+        return web.Response(body=body.encode("utf8"),
+                            headers={"Content-Type": OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE})
+
+    async def async_start_http_server(self, host: str = "0.0.0.0", port: int = 9090,
+                                      path: str = "/metrics") -> web.AppRunner:
+        """
+        Starts an HTTP server exposing the metrics on the given path.
+        The returned runner must be cleaned up (`await runner.cleanup()`) to stop the server.
+        """
+        app = web.Application()
+        app.router.add_get(path, self.handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        _LOGGER.info("Serving metrics on http://%s:%d%s", host, port, path)
+        return runner
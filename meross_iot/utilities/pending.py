@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from asyncio import Future
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, List
+
+from meross_iot.model.exception import TooManyPendingCommandsError
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING_COMMANDS = 10000
+_DEFAULT_MAX_ABANDONED_TRACKED = 10000
+
+
+class PendingCommand(object):
+    """
+    Helper class that holds a command waiting for its ACK
+    """
+    __slots__ = ("future", "device_uuid", "namespace", "timestamp")
+
+    def __init__(self, future: Future, device_uuid: str, namespace: str, timestamp: float):
+        self.future = future
+        self.device_uuid = device_uuid
+        self.namespace = namespace
+        self.timestamp = timestamp
+
+
+class PendingCommandTable(object):
+    """
+    Bounded table of the commands waiting for an ACK, indexed by message id.
+    Entries are removed as soon as the ACK is received or when the caller gives up waiting (timeout or
+    cancellation). ACKs received after the caller gave up are accounted as late responses, per device and namespace.
+    The table is safe to be accessed concurrently by the mqtt network thread and the event loop.
+    """
+
+    def __init__(self,
+                 max_pending: int = DEFAULT_MAX_PENDING_COMMANDS,
+                 max_abandoned_tracked: int = _DEFAULT_MAX_ABANDONED_TRACKED):
+        self._max_pending = max_pending
+        self._max_abandoned = max_abandoned_tracked
+        self._lock = threading.Lock()
+        self._pending: Dict[str, PendingCommand] = {}
+        self._abandoned: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._late_responses: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def max_pending(self) -> int:
+        """
+        Maximum number of commands that can wait for an ACK at the same time
+        """
+        return self._max_pending
+
+    def register(self, message_id: str, future: Future, device_uuid: str, namespace: str) -> None:
+        """
+        Registers a command waiting for its ACK.
+        Raises `TooManyPendingCommandsError` when the table is full.
+        """
+        with self._lock:
+            if len(self._pending) >= self._max_pending:
+                raise TooManyPendingCommandsError(max_pending=self._max_pending)
+            self._pending[message_id] = PendingCommand(future=future,
+                                                       device_uuid=device_uuid,
+                                                       namespace=namespace,
+                                                       timestamp=time.monotonic())
+
+    def pop(self, message_id: str) -> Optional[PendingCommand]:
+        """
+        Removes and returns the command waiting for the given message id, if any.
+        When the caller already gave up waiting for it, the response is accounted as late.
+        """
+        with self._lock:
+            pending = self._pending.pop(message_id, None)
+            if pending is not None:
+                return pending
+            abandoned = self._abandoned.pop(message_id, None)
+            if abandoned is not None:
+                self._late_responses[abandoned] = self._late_responses.get(abandoned, 0) + 1
+            return None
+
+    def discard(self, message_id: str) -> None:
+        """
+        Removes the command from the table, if still waiting. This is invoked whenever the caller stops waiting
+        for the ACK: if the command was still pending, it is tracked so that a later ACK can be recognized as late.
+        """
+        with self._lock:
+            pending = self._pending.pop(message_id, None)
+            if pending is None:
+                return
+            self._abandoned[message_id] = (pending.device_uuid, pending.namespace)
+            if len(self._abandoned) > self._max_abandoned:
+                self._abandoned.popitem(last=False)
+
+    def cancel_all(self) -> None:
+        """
+        Cancels all the futures waiting for an ACK and clears the table. Must be invoked within the event loop.
+        """
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for p in pending:
+            if not p.future.done():
+                p.future.cancel()
+
+    def late_responses(self) -> Dict[Tuple[str, str], int]:
+        """
+        Number of responses received after the caller gave up, aggregated by (device uuid, namespace)
+        """
+        with self._lock:
+            return dict(self._late_responses)
+
+    def late_responses_by_device(self, device_uuid: str) -> List[Tuple[str, int]]:
+        """
+        Number of responses received after the caller gave up for the given device, by namespace
+        """
+        with self._lock:
+            return [(ns, count) for (uuid, ns), count in self._late_responses.items() if uuid == device_uuid]
+
+    @property
+    def total_late_responses(self) -> int:
+        """
+        Total number of responses received after the caller gave up
+        """
+        with self._lock:
+            return sum(self._late_responses.values())
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, message_id):
+        return message_id in self._pending
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import zlib
+from typing import List, Optional
+
+import paho.mqtt.client as mqtt
+
+from meross_iot.utilities.mqtt import MqttMessageBuilder
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MQTT_CONNECTIONS_PER_BROKER = 1
+
+
+class MqttConnection(object):
+    """
+    Helper class that holds a single MQTT connection against a broker, together with the identity
+    (app id, client id and response topic) the manager uses on it.
+    The connection with index 0 is also in charge of receiving the push notifications of the user.
+    """
+
+    def __init__(self,
+                 broker: str,
+                 index: int,
+                 client: mqtt.Client,
+                 app_id: str,
+                 client_id: str,
+                 response_topic: str,
+                 message_builder: MqttMessageBuilder):
+        self.broker = broker
+        self.index = index
+        self.client = client
+        self.app_id = app_id
+        self.client_id = client_id
+        self.response_topic = response_topic
+        self.message_builder = message_builder
+        self.connected_and_subscribed: Optional[asyncio.Event] = None
+        self.driver = None
+        self.in_flight = 0
+        self.sent = 0
+
+    @property
+    def receives_push_notifications(self) -> bool:
+        return self.index == 0
+
+    def __repr__(self):
+        return f"{self.broker}#{self.index} ({self.client_id})"
+
+
+class MqttConnectionStats(object):
+    """
+    Snapshot of the counters of a pooled MQTT connection
+    """
+
+    def __init__(self, broker: str, index: int, client_id: str, connected: bool, in_flight: int, sent: int):
+        self._broker = broker
+        self._index = index
+        self._client_id = client_id
+        self._connected = connected
+        self._in_flight = in_flight
+        self._sent = sent
+
+    @property
+    def broker(self) -> str:
+        """
+        Broker the connection is established against, as domain:port
+        """
+        return self._broker
+
+    @property
+    def index(self) -> int:
+        """
+        Index of the connection within the broker pool
+        """
+        return self._index
+
+    @property
+    def client_id(self) -> str:
+        """
+        MQTT client id used by the connection
+        """
+        return self._client_id
+
+    @property
+    def connected(self) -> bool:
+        """
+        Whether the connection is currently established
+        """
+        return self._connected
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of commands sent over this connection that are still waiting for their ACK
+        """
+        return self._in_flight
+
+    @property
+    def sent(self) -> int:
+        """
+        Total number of commands sent over this connection
+        """
+        return self._sent
+
+    def __repr__(self):
+        return f"{self.broker}#{self.index} ({self.client_id}): " \
+               f"{'connected' if self.connected else 'disconnected'}, in-flight: {self.in_flight}, sent: {self.sent}"
+
+
+class MqttConnectionPool(object):
+    """
+    Fixed-size pool of MQTT connections against a single broker.
+    Devices are assigned to a connection by a stable hash of their UUID, so that commands targeting the same
+    device (and their ACKs) always travel over the same connection.
+    """
+
+    def __init__(self, broker: str, connections: List[MqttConnection]):
+        if len(connections) < 1:
+            raise ValueError("A connection pool requires at least one connection")
+        self._broker = broker
+        self._connections = connections
+
+    @property
+    def broker(self) -> str:
+        return self._broker
+
+    @property
+    def connections(self) -> List[MqttConnection]:
+        return list(self._connections)
+
+    @property
+    def push_connection(self) -> MqttConnection:
+        """
+        Connection subscribed to the user topic, receiving push notifications
+        """
+        return self._connections[0]
+
+    def connection_for(self, device_uuid: Optional[str]) -> MqttConnection:
+        """
+        Returns the connection the given device is assigned to. When no device is specified, the push
+        connection is returned.
+        """
+        if device_uuid is None or len(self._connections) == 1:
+            return self._connections[0]
+        return self._connections[zlib.crc32(device_uuid.encode("utf8")) % len(self._connections)]
+
+    def stats(self) -> List[MqttConnectionStats]:
+        return [MqttConnectionStats(broker=self._broker,
+                                    index=c.index,
+                                    client_id=c.client_id,
+                                    connected=c.client.is_connected(),
+                                    in_flight=c.in_flight,
+                                    sent=c.sent) for c in self._connections]
+
+    def __len__(self):
+        return len(self._connections)
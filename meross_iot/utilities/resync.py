@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_RESYNC_MAX_CONCURRENCY = 20
+
+
+class ResyncProgress(object):
+    """
+    Snapshot of the progress of a `DeviceResyncJob`
+    """
+
+    def __init__(self, total: int, completed: int, failed: int, cancelled: bool, done: bool, elapsed: float):
+        self._total = total
+        self._completed = completed
+        self._failed = failed
+        self._cancelled = cancelled
+        self._done = done
+        self._elapsed = elapsed
+
+    @property
+    def total(self) -> int:
+        """
+        Number of devices to refresh (zero until the device list is known)
+        """
+        return self._total
+
+    @property
+    def completed(self) -> int:
+        """
+        Number of devices refreshed so far, including the ones whose refresh failed
+        """
+        return self._completed
+
+    @property
+    def failed(self) -> int:
+        """
+        Number of devices whose refresh failed
+        """
+        return self._failed
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the job gave up before refreshing all the devices (e.g. because of a new disconnection)
+        """
+        return self._cancelled
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Seconds elapsed since the job started (until it finished, when done)
+        """
+        return self._elapsed
+
+    def __repr__(self):
+        state = "cancelled" if self.cancelled else "done" if self.done else "running"
+        return f"{state}: {self.completed}/{self.total} devices refreshed ({self.failed} failed) in {self.elapsed:.1f}s"
+
+
+class DeviceResyncJob(object):
+    """
+    Refreshes the state of a set of devices after a reconnection, with bounded concurrency.
+    Devices are refreshed in the given order, so callers are expected to put the most relevant ones first.
+    The job can be awaited (it returns its final `ResyncProgress`) and cancelled at any time.
+    Must be used from within the event loop.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_RESYNC_MAX_CONCURRENCY):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than zero")
+        self._max_concurrency = max_concurrency
+        self._done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._total = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = False
+        self._started_at = time.monotonic()
+        self._finished_at: Optional[float] = None
+
+    def start(self, coro: Awaitable) -> None:
+        """
+        Runs the given coroutine, which is expected to call `async_refresh()`, as the body of the job
+        """
+        self._task = asyncio.ensure_future(self._async_run(coro))
+
+    async def _async_run(self, coro: Awaitable) -> None:
+        try:
+            await coro
+        except asyncio.CancelledError:
+            self._cancelled = True
+            _LOGGER.info("Device resync cancelled: %s", self.progress)
+        except Exception:
+            _LOGGER.exception("Error occurred while resyncing devices")
+        finally:
+            self._finished_at = time.monotonic()
+            self._done.set()
+
+    async def async_refresh(self, refreshes: List[Tuple[str, Callable[[], Awaitable]]]) -> None:
+        """
+        Invokes the given (device uuid, refresh coroutine function) pairs in order, keeping at most
+        `max_concurrency` of them in flight. Failures are logged and accounted, but do not stop the job.
+        """
+        self._total = len(refreshes)
+        queue = deque(refreshes)
+
+        async def _worker():
+            while queue:
+                device_uuid, refresh = queue.popleft()
+                try:
+                    await refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self._failed += 1
+                    _LOGGER.exception("Error occurred while refreshing device %s", device_uuid)
+                self._completed += 1
+
+        workers = [asyncio.ensure_future(_worker()) for _ in range(min(self._max_concurrency, len(refreshes)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                if not w.done():
+                    w.cancel()
+
+    def cancel(self) -> None:
+        """
+        Stops the job: devices not refreshed yet are skipped
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def progress(self) -> ResyncProgress:
+        end = self._finished_at if self._finished_at is not None else time.monotonic()
+        return ResyncProgress(total=self._total,
+                              completed=self._completed,
+                              failed=self._failed,
+                              cancelled=self._cancelled,
+                              done=self.done,
+                              elapsed=end - self._started_at)
+
+    async def async_wait(self) -> ResyncProgress:
+        """
+        Waits for the job to complete (or to be cancelled) and returns its final progress
+        """
+        await self._done.wait()
+        return self.progress
+
+    def __await__(self):
+        return self.async_wait().__await__()
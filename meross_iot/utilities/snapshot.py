@@ -0,0 +1,262 @@
+import gzip
+import logging
+import os
+import stat
+import tempfile
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Union
+
+from meross_iot.controller.device import BaseDevice, GenericSubDevice, HubDevice, get_state_fields
+from meross_iot.controller.mixins.thermostat import ThermostatState
+from meross_iot.model import enums
+from meross_iot.model.enums import OnlineStatus
+from meross_iot.model.http.device import HttpDeviceInfo
+from meross_iot.model.http.subdevice import HttpSubdeviceInfo
+from meross_iot.model.plugin.light import LightInfo
+from meross_iot.utilities.codec import json_dumps, json_loads
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+_GZIP_MAGIC = b"\x1f\x8b"
+# Markers of the values that JSON cannot represent natively
+_TUPLE = "__tuple__"
+_MAPPING = "__mapping__"
+_ENUM = "__enum__"
+_DATETIME = "__datetime__"
+_OBJECT = "__object__"
+_MARKERS = frozenset((_TUPLE, _MAPPING, _ENUM, _DATETIME, _OBJECT))
+
+
+def _qualified_name(clazz: type) -> str:
+    return f"{clazz.__module__}:{clazz.__qualname__}"
+
+
+def _encode_light_info(info: LightInfo) -> dict:
+    return {"rgb": info.rgb_tuple, "luminance": info.luminance, "temperature": info.temperature,
+            "capacity": info._capacity, "onoff": info._onoff}
+
+
+def _encode_thermostat_state(state: ThermostatState) -> dict:
+    return {"state": getattr(state, "_state", None)}
+
+
+# Objects held by the device state that can be captured, along with the function returning the keyword arguments
+# that rebuild them via their constructor. No other object is ever restored from a snapshot.
+_STATE_TYPES: Dict[type, Callable[[Any], dict]] = {
+    LightInfo: _encode_light_info,
+    ThermostatState: _encode_thermostat_state,
+}
+_STATE_TYPES_BY_NAME = {_qualified_name(clazz): clazz for clazz in _STATE_TYPES}
+_ENUM_TYPES_BY_NAME = {_qualified_name(clazz): clazz for clazz in vars(enums).values()
+                       if isinstance(clazz, type) and issubclass(clazz, Enum) and clazz.__module__ == enums.__name__}
+
+
+def _resolve(types_by_name: Dict[str, type], qualified_name: str) -> type:
+    clazz = types_by_name.get(qualified_name)
+    if clazz is None:
+        raise ValueError(f"Refusing to restore an instance of {qualified_name}")
+    return clazz
+
+
+def encode_value(value: Any) -> Any:
+    """
+    Encodes a state value into a JSON-serializable structure, preserving what JSON cannot represent:
+    tuples, non-string dictionary keys (e.g. channel indexes), enums, datetimes and the library state objects
+    """
+    if isinstance(value, Enum) and type(value).__module__ == enums.__name__:
+        return {_ENUM: _qualified_name(type(value)), "value": encode_value(value.value)}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, datetime):
+        return {_DATETIME: value.isoformat()}
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    if isinstance(value, tuple):
+        return {_TUPLE: [encode_value(v) for v in value]}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and k not in _MARKERS for k in value):
+            return {k: encode_value(v) for k, v in value.items()}
+        return {_MAPPING: [[encode_value(k), encode_value(v)] for k, v in value.items()]}
+    encoder = _STATE_TYPES.get(type(value))
+    if encoder is not None:
+        return {_OBJECT: _qualified_name(type(value)), "state": encode_value(encoder(value))}
+    raise TypeError(f"Cannot encode values of type {type(value)}")
+
+
+def decode_value(value: Any) -> Any:
+    """
+    Decodes a structure produced by `encode_value()`
+    """
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if _TUPLE in value:
+        return tuple(decode_value(v) for v in value[_TUPLE])
+    if _MAPPING in value:
+        return {decode_value(k): decode_value(v) for k, v in value[_MAPPING]}
+    if _ENUM in value:
+        return _resolve(_ENUM_TYPES_BY_NAME, value[_ENUM])(decode_value(value["value"]))
+    if _DATETIME in value:
+        return datetime.fromisoformat(value[_DATETIME])
+    if _OBJECT in value:
+        clazz = _resolve(_STATE_TYPES_BY_NAME, value[_OBJECT])
+        return clazz(**decode_value(value["state"]))
+    return {k: decode_value(v) for k, v in value.items()}
+
+
+def _encode_info(info: Union[HttpDeviceInfo, HttpSubdeviceInfo]) -> dict:
+    # Same representation of the legacy registry dumps, which HttpDeviceInfo.from_dict() parses back
+    res = {}
+    for k, v in info.to_dict().items():
+        if isinstance(v, datetime):
+            v = v.strftime("%Y-%m-%dT%H:%M:%S")
+        elif isinstance(v, OnlineStatus):
+            v = v.value
+        res[k] = v
+    return res
+
+
+def _snapshot_state(device: BaseDevice) -> Dict[str, dict]:
+    state = {}
+    for field in get_state_fields(type(device)):
+        if not hasattr(device, field):
+            continue
+        try:
+            value = encode_value(getattr(device, field))
+        except TypeError:
+            _LOGGER.debug("Skipping state field %s of device %s: it cannot be encoded", field, device.internal_id)
+            continue
+        state[field] = {"value": value, "updated_at": device._state_timestamps.get(field)}
+    return state
+
+
+def snapshot_device(device: BaseDevice) -> dict:
+    """
+    Captures the abilities, the HTTP information and the cached state of the given device and of its subdevices
+    """
+    data = {
+        "abilities": device.abilities,
+        "info": _encode_info(device.cached_http_info),
+        "last_full_update": device.last_full_update_timestamp,
+        "state": _snapshot_state(device),
+    }
+    if isinstance(device, HubDevice):
+        data["subdevices"] = [{
+            "info": _encode_info(sd.cached_http_subdevice_info),
+            "last_full_update": sd.last_full_update_timestamp,
+            "state": _snapshot_state(sd),
+        } for sd in device.get_subdevices()]
+    return data
+
+
+def snapshot_devices(devices: Iterable[BaseDevice]) -> dict:
+    """
+    Builds a snapshot of the given devices. Subdevices are captured along with their hub.
+    """
+    return {
+        "version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": time.time(),
+        "devices": [snapshot_device(d) for d in devices
+                    if not isinstance(d, GenericSubDevice) and d.cached_http_info is not None],
+    }
+
+
+def restore_state(device: BaseDevice, entry: dict) -> None:
+    """
+    Restores the cached state captured by `snapshot_device()` into the given device. The restored fields are marked
+    as stale until the device reports them again.
+    """
+    fields = get_state_fields(type(device))
+    for field, field_state in entry.get("state", {}).items():
+        # Fields the device class no longer declares are ignored
+        if field not in fields:
+            continue
+        try:
+            value = decode_value(field_state["value"])
+        except (ValueError, TypeError, AttributeError, ImportError, KeyError):
+            _LOGGER.warning("Could not restore state field %s of device %s", field, device.internal_id)
+            continue
+        setattr(device, field, value)
+        if field_state.get("updated_at") is not None:
+            device._state_timestamps[field] = field_state["updated_at"]
+        device._stale_state_fields.add(field)
+    if entry.get("last_full_update") is not None:
+        device._last_full_update_ts = entry["last_full_update"]
+
+
+def parse_device_info(entry: dict) -> HttpDeviceInfo:
+    return HttpDeviceInfo.from_dict(entry["info"])
+
+
+def parse_subdevice_info(entry: dict) -> HttpSubdeviceInfo:
+    return HttpSubdeviceInfo.from_dict(entry["info"])
+
+
+def encode_snapshot(data: dict) -> bytes:
+    return gzip.compress(json_dumps(data))
+
+
+def decode_snapshot(raw: bytes) -> dict:
+    """
+    Decodes a snapshot. Legacy registry dumps (plain JSON lists of abilities and HTTP information) are converted
+    into a snapshot without state.
+    """
+    if raw[:2] == _GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    data = json_loads(raw)
+    if isinstance(data, list):
+        return {"version": SNAPSHOT_FORMAT_VERSION, "created_at": None, "devices": data}
+    if data.get("version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {data.get('version')}")
+    return data
+
+
+def _default_file_mode() -> int:
+    # os.umask() can only be read by setting it: do it once, while importing
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+_DEFAULT_FILE_MODE = _default_file_mode()
+
+
+def write_snapshot(filename: str, raw: bytes) -> None:
+    """
+    Writes the encoded snapshot to the given file, atomically: readers either see the previous file or the new one.
+    The file keeps the permissions of the one it replaces (or the ones granted by the umask, when new) and is
+    flushed to disk before replacing it.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        mode = _DEFAULT_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    if os.name != 'nt':
+        # Persist the rename as well
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def read_snapshot(filename: str) -> dict:
+    with open(filename, "rb") as f:
+        return decode_snapshot(f.read())
@@ -1,10 +1,14 @@
+import math
 import time
 from collections import deque
 from datetime import timedelta
-from typing import Optional, Deque, Dict, ItemsView
+from typing import Optional, Deque, Dict, ItemsView, List, Tuple, Hashable, Iterator
 
 from meross_iot.model.http.error_codes import ErrorCodes
 
+_LEGACY_MAX_SAMPLES = 1000
+"""Samples returned by the legacy sample views, when no max_samples is set (the former default)"""
+
 
 class HttpRequestSample:
     """
@@ -118,19 +122,18 @@ class HttpStat:
         self._by_api_response_code: Dict[ErrorCodes, int] = {}
 
     def add(self, sample: HttpRequestSample) -> None:
-        self._total_api_calls += 1
+        self._add_count(http_response_code=sample.http_response_code,
+                        api_response_code=sample.api_response_code,
+                        count=1)
+
+    def _add_count(self, http_response_code: int, api_response_code: Optional[ErrorCodes], count: int) -> None:
+        self._total_api_calls += count
 
         # Aggregate by HTTP response code
-        if sample.http_response_code not in self._by_http_response_code:
-            self._by_http_response_code[sample.http_response_code] = 1
-        else:
-            self._by_http_response_code[sample.http_response_code] += 1
+        self._by_http_response_code[http_response_code] = self._by_http_response_code.get(http_response_code, 0) + count
 
         # Aggregate by API response code
-        if sample.api_response_code not in self._by_api_response_code:
-            self._by_api_response_code[sample.api_response_code] = 1
-        else:
-            self._by_api_response_code[sample.api_response_code] += 1
+        self._by_api_response_code[api_response_code] = self._by_api_response_code.get(api_response_code, 0) + count
 
     @property
     def total_calls(self) -> int:
@@ -154,7 +157,7 @@ class HttpStat:
     def __repr__(self):
         http_reponses = sorted(self._by_http_response_code.items(), key=lambda item: item[1], reverse=True)
         http_details = ", ".join([f"{code}: {calls}" for code, calls in http_reponses])
-        api_statuses = sorted(self._by_http_response_code.items(), key=lambda item: item[1], reverse=True)
+        api_statuses = sorted(self._by_api_response_code.items(), key=lambda item: item[1], reverse=True)
         api_details = ", ".join([f"{code}: {calls}" for code, calls in api_statuses])
         return f"{self.total_calls} ({http_details}; {api_details})"
 
@@ -168,13 +171,11 @@ class ApiStat:
         self._by_method_namespace: Dict[str, int] = {}
 
     def add(self, sample: ApiCallSample) -> None:
-        self._total_api_calls += 1
+        self._add_count(method_ns=f"{sample.method} {sample.namespace}", count=1)
 
-        method_ns = f"{sample.method} {sample.namespace}"
-        if method_ns not in self._by_method_namespace:
-            self._by_method_namespace[method_ns] = 1
-        else:
-            self._by_method_namespace[method_ns] += 1
+    def _add_count(self, method_ns: str, count: int) -> None:
+        self._total_api_calls += count
+        self._by_method_namespace[method_ns] = self._by_method_namespace.get(method_ns, 0) + count
 
     @property
     def total_calls(self) -> int:
@@ -204,12 +205,18 @@ class HttpStatsResult:
         self._by_url: Dict[str, HttpStat] = {}
 
     def add(self, sample: HttpRequestSample):
-        self._global.add(sample)
-        byurl = self._by_url.get(sample.url)
+        self._add_count(url=sample.url,
+                        http_response_code=sample.http_response_code,
+                        api_response_code=sample.api_response_code,
+                        count=1)
+
+    def _add_count(self, url: str, http_response_code: int, api_response_code: Optional[ErrorCodes], count: int):
+        self._global._add_count(http_response_code, api_response_code, count)
+        byurl = self._by_url.get(url)
         if byurl is None:
             byurl = HttpStat()
-            self._by_url[sample.url] = byurl
-        byurl.add(sample)
+            self._by_url[url] = byurl
+        byurl._add_count(http_response_code, api_response_code, count)
 
     @property
     def global_stats(self) -> HttpStat:
@@ -231,7 +238,7 @@ class HttpStatsResult:
         return self._by_url.items()
 
     def __repr__(self):
-        top_urls = sorted(self._by_url.items(), key=lambda item: item[1].global_stats, reverse=True)
+        top_urls = sorted(self._by_url.items(), key=lambda item: item[1].total_calls, reverse=True)
         url_rerp = ",\n".join([f"{url}: {stats}" for url, stats in top_urls])
         return f"--------\n" \
                f"Global Calls: {self._global.total_calls}\n" \
@@ -248,12 +255,17 @@ class ApiStatsResult:
         self._by_uuid: Dict[str, ApiStat] = {}
 
     def add(self, sample: ApiCallSample):
-        self._global.add(sample)
-        byuuid = self._by_uuid.get(sample.device_uuid)
+        self._add_count(device_uuid=sample.device_uuid,
+                        method_ns=f"{sample.method} {sample.namespace}",
+                        count=1)
+
+    def _add_count(self, device_uuid: str, method_ns: str, count: int):
+        self._global._add_count(method_ns, count)
+        byuuid = self._by_uuid.get(device_uuid)
         if byuuid is None:
             byuuid = ApiStat()
-            self._by_uuid[sample.device_uuid] = byuuid
-        byuuid.add(sample)
+            self._by_uuid[device_uuid] = byuuid
+        byuuid._add_count(method_ns, count)
 
     @property
     def global_stats(self) -> ApiStat:
@@ -275,7 +287,7 @@ class ApiStatsResult:
         return self._by_uuid.items()
 
     def __repr__(self):
-        top_devices = sorted(self._by_uuid.items(), key=lambda item: item[1].global_stats, reverse=True)
+        top_devices = sorted(self._by_uuid.items(), key=lambda item: item[1].total_calls, reverse=True)
         device_rerp = ",\n".join([f"{uuid}: {stats}" for uuid, stats in top_devices])
         return f"--------\n" \
                f"Global Calls: {self._global.total_calls}\n" \
@@ -283,111 +295,221 @@ class ApiStatsResult:
                f"--------\n"
 
 
+class TimeBucketedCounter:
+    """
+    Ring of time buckets, each one holding pre-aggregated counters by key.
+    Memory only depends on the number of buckets and on the number of distinct keys within every bucket,
+    regardless of the call rate. Window queries just merge the buckets falling within the window.
+    """
+    def __init__(self, bucket_seconds: int = 1, buckets: int = 3600):
+        if bucket_seconds < 1 or buckets < 1:
+            raise ValueError("Bucket duration and number of buckets must be greater than zero")
+        self._bucket_seconds = bucket_seconds
+        self._epochs: List[int] = [-1] * buckets
+        self._counters: List[Optional[Dict[Hashable, int]]] = [None] * buckets
+
+    @property
+    def max_time_window(self) -> timedelta:
+        """
+        Longest time window that can be queried
+        """
+        return timedelta(seconds=self._bucket_seconds * len(self._epochs))
+
+    def increment(self, key: Hashable, timestamp: Optional[float] = None) -> None:
+        now = time.time() if timestamp is None else timestamp
+        epoch = int(now // self._bucket_seconds)
+        index = epoch % len(self._epochs)
+        counters = self._counters[index]
+        if self._epochs[index] != epoch or counters is None:
+            counters = {}
+            self._epochs[index] = epoch
+            self._counters[index] = counters
+        counters[key] = counters.get(key, 0) + 1
+
+    def iter_timed_window(self, time_window: timedelta, timestamp: Optional[float] = None,
+                          max_samples: Optional[int] = None) -> Iterator[Tuple[float, Dict[Hashable, int]]]:
+        """
+        Yields the start timestamp and the counters of the buckets falling within the given time window, oldest
+        first. When max_samples is set, only the most recent max_samples counts are reported: the oldest bucket
+        may then be truncated.
+        """
+        now = time.time() if timestamp is None else timestamp
+        current = int(now // self._bucket_seconds)
+        span = min(len(self._epochs), max(1, int(math.ceil(time_window.total_seconds() / self._bucket_seconds))))
+        buckets = []
+        for epoch in range(current - span + 1, current + 1):
+            index = epoch % len(self._epochs)
+            if self._epochs[index] == epoch:
+                buckets.append((float(epoch * self._bucket_seconds), self._counters[index]))
+
+        if max_samples is not None:
+            remaining = max_samples
+            for i in range(len(buckets) - 1, -1, -1):
+                start, counters = buckets[i]
+                total = sum(counters.values())
+                if total < remaining:
+                    remaining -= total
+                    continue
+                truncated = {}
+                for key, count in counters.items():
+                    if remaining <= 0:
+                        break
+                    truncated[key] = min(count, remaining)
+                    remaining -= truncated[key]
+                buckets = [(start, truncated)] + buckets[i + 1:]
+                break
+        return iter(buckets)
+
+    def iter_window(self, time_window: timedelta, timestamp: Optional[float] = None,
+                    max_samples: Optional[int] = None) -> Iterator[Dict[Hashable, int]]:
+        """
+        Yields the counters of the buckets falling within the given time window
+        """
+        for _, counters in self.iter_timed_window(time_window, timestamp=timestamp, max_samples=max_samples):
+            yield counters
+
+
 class HttpStatsCounter:
     """
-    Helper class to keep track and calculate statistics for sent HTTP requests
+    Helper class to keep track and calculate statistics for sent HTTP requests.
+    When max_samples is set, statistics only account for the most recent max_samples requests within the
+    requested time window, as when the requests were kept in a bounded list of samples.
     """
-    def __init__(self, max_samples=1000):
-        self._samples: Deque[HttpRequestSample] = deque([], maxlen=max_samples)
+    def __init__(self, max_samples: Optional[int] = None, bucket_seconds: int = 1, buckets: int = 3600):
+        self._max_samples = max_samples
+        self._requests = TimeBucketedCounter(bucket_seconds=bucket_seconds, buckets=buckets)
+        self._totals: Dict[Tuple[str, int, Optional[ErrorCodes]], int] = {}
 
     def notify_http_request(self, request_url: str, method: str, http_response_code: int, api_response_code: Optional[ErrorCodes]):
-        sample = HttpRequestSample(
-            url=request_url,
-            method=method,
-            http_response_code=http_response_code,
-            api_response_code=api_response_code,
-            timestamp=time.time()
-        )
-        self._samples.append(sample)
-
-    def _get_stats(self, samples: Deque[HttpRequestSample], time_window: timedelta = timedelta(minutes=1)) -> HttpStatsResult:
-        result = HttpStatsResult()
-        lower_limit = time.time() - time_window.total_seconds()
-        for sample in reversed(samples):
-            if sample.timestamp > lower_limit:
-                result.add(sample)
+        key = (request_url, http_response_code, api_response_code)
+        self._requests.increment(key)
+        self._totals[key] = self._totals.get(key, 0) + 1
 
-        return result
+    def get_totals(self) -> Dict[Tuple[str, int, Optional[ErrorCodes]], int]:
+        """
+        Returns the number of HTTP requests sent since the counter was created,
+        by (url, http response code, api response code)
+        """
+        return dict(self._totals)
 
     def get_stats(self, time_window: timedelta = timedelta(minutes=1)) -> HttpStatsResult:
         """
-        Returns the statistics of sent MQTT messages to the MQTT broker
+        Returns the statistics of sent HTTP requests
         """
-        return self._get_stats(samples=self._samples, time_window=time_window)
+        result = HttpStatsResult()
+        for counters in self._requests.iter_window(time_window, max_samples=self._max_samples):
+            for (url, http_response_code, api_response_code), count in counters.items():
+                result._add_count(url, http_response_code, api_response_code, count)
+        return result
 
 
 class ApiCounter:
     """
-    Helper class to keep track and calculate statistics for sent MQTT message
+    Helper class to keep track and calculate statistics for sent MQTT message.
+    When max_samples is set, statistics only account for the most recent max_samples messages within the
+    requested time window, as when the messages were kept in a bounded list of samples.
     """
-    def __init__(self, max_samples=1000):
-        self.api_calls: Deque[ApiCallSample] = deque([], maxlen=max_samples)
-        self.delayed_calls: Deque[ApiCallSample] = deque([], maxlen=max_samples)
-        self.dropped_calls: Deque[ApiCallSample] = deque([], maxlen=max_samples)
+    def __init__(self, max_samples: Optional[int] = None, bucket_seconds: int = 1, buckets: int = 3600):
+        self._max_samples = max_samples
+        self._api_calls = TimeBucketedCounter(bucket_seconds=bucket_seconds, buckets=buckets)
+        self._delayed_calls = TimeBucketedCounter(bucket_seconds=bucket_seconds, buckets=buckets)
+        self._dropped_calls = TimeBucketedCounter(bucket_seconds=bucket_seconds, buckets=buckets)
+        self._api_call_totals: Dict[Tuple[str, str], int] = {}
+        self._delayed_call_totals: Dict[Tuple[str, str], int] = {}
+        self._dropped_call_totals: Dict[Tuple[str, str], int] = {}
 
     def notify_api_call(self, device_uuid: str, namespace: str, method: str):
         """
         Method called internally by the manager itself, whenever a message is sent to the
         MQTT broker.
         """
-        sample = ApiCallSample(
-            device_uuid=device_uuid,
-            namespace=namespace,
-            method=method,
-            timestamp=time.time()
-        )
-        self.api_calls.append(sample)
+        self._api_calls.increment((device_uuid, method, namespace))
+        self._api_call_totals[(method, namespace)] = self._api_call_totals.get((method, namespace), 0) + 1
 
     def notify_delayed_call(self, device_uuid: str, namespace: str, method: str):
         """
         Method called internally by the manager itself, whenever a message is delayed instead of being sent to the
         MQTT broker.
         """
-        sample = ApiCallSample(
-            device_uuid=device_uuid,
-            namespace=namespace,
-            method=method,
-            timestamp=time.time()
-        )
-        self.delayed_calls.append(sample)
+        self._delayed_calls.increment((device_uuid, method, namespace))
+        self._delayed_call_totals[(method, namespace)] = self._delayed_call_totals.get((method, namespace), 0) + 1
 
     def notify_dropped_call(self, device_uuid: str, namespace: str, method: str):
         """
         Method called internally by the manager itself, whenever a message is dropped instead of being sent to the
         MQTT broker.
         """
-        sample = ApiCallSample(
-            device_uuid=device_uuid,
-            namespace=namespace,
-            method=method,
-            timestamp=time.time()
-        )
-        self.dropped_calls.append(sample)
+        self._dropped_calls.increment((device_uuid, method, namespace))
+        self._dropped_call_totals[(method, namespace)] = self._dropped_call_totals.get((method, namespace), 0) + 1
 
-    def _get_stats(self, api_samples: Deque[ApiCallSample], time_window: timedelta = timedelta(minutes=1)) -> ApiStatsResult:
-        result = ApiStatsResult()
-        lower_limit = time.time() - time_window.total_seconds()
-        for sample in reversed(api_samples):
-            if sample.timestamp > lower_limit:
-                result.add(sample)
+    def _get_stats(self, calls: TimeBucketedCounter, time_window: timedelta = timedelta(minutes=1)) -> ApiStatsResult:
+        # Merge the per-bucket counters first, so that the method/namespace label is built once per key
+        merged: Dict[Tuple[str, str, str], int] = {}
+        for counters in calls.iter_window(time_window, max_samples=self._max_samples):
+            for key, count in counters.items():
+                merged[key] = merged.get(key, 0) + count
 
+        result = ApiStatsResult()
+        for (device_uuid, method, namespace), count in merged.items():
+            result._add_count(device_uuid, f"{method} {namespace}", count)
         return result
 
+    def _get_samples(self, calls: TimeBucketedCounter) -> Deque[ApiCallSample]:
+        # Samples are rebuilt from the buckets: their timestamp is the start of the bucket they were counted in
+        max_samples = self._max_samples if self._max_samples is not None else _LEGACY_MAX_SAMPLES
+        samples: Deque[ApiCallSample] = deque([], maxlen=max_samples)
+        for start, counters in calls.iter_timed_window(calls.max_time_window, max_samples=max_samples):
+            for (device_uuid, method, namespace), count in counters.items():
+                for _ in range(count):
+                    samples.append(ApiCallSample(device_uuid=device_uuid, namespace=namespace, method=method,
+                                                 timestamp=start))
+        return samples
+
+    @property
+    def api_calls(self) -> Deque[ApiCallSample]:
+        """
+        Most recent MQTT messages sent (up to max_samples, 1000 by default) within the longest tracked time window.
+        Read-only, kept for backward compatibility: prefer `get_api_stats()`.
+        """
+        return self._get_samples(self._api_calls)
+
+    @property
+    def delayed_calls(self) -> Deque[ApiCallSample]:
+        """
+        Most recent MQTT messages delayed (up to max_samples, 1000 by default) within the longest tracked time window.
+        Read-only, kept for backward compatibility: prefer `get_delayed_api_stats()`.
+        """
+        return self._get_samples(self._delayed_calls)
+
+    @property
+    def dropped_calls(self) -> Deque[ApiCallSample]:
+        """
+        Most recent MQTT messages dropped (up to max_samples, 1000 by default) within the longest tracked time window.
+        Read-only, kept for backward compatibility: prefer `get_dropped_api_stats()`.
+        """
+        return self._get_samples(self._dropped_calls)
+
     def get_api_stats(self, time_window: timedelta = timedelta(minutes=1)) -> ApiStatsResult:
         """
         Returns the statistics of sent MQTT messages to the MQTT broker
         """
-        return self._get_stats(api_samples=self.api_calls, time_window=time_window)
+        return self._get_stats(calls=self._api_calls, time_window=time_window)
 
     def get_delayed_api_stats(self, time_window: timedelta = timedelta(minutes=1)) -> ApiStatsResult:
         """
         Returns the statistics of delayed MQTT messages to the MQTT broker
         """
-        return self._get_stats(api_samples=self.delayed_calls, time_window=time_window)
+        return self._get_stats(calls=self._delayed_calls, time_window=time_window)
 
     def get_dropped_api_stats(self, time_window: timedelta = timedelta(minutes=1)) -> ApiStatsResult:
         """
         Returns the statistics of dropped MQTT messages to the MQTT broker
         """
-        return self._get_stats(api_samples=self.dropped_calls, time_window=time_window)
+        return self._get_stats(calls=self._dropped_calls, time_window=time_window)
 
+    def get_totals(self) -> Tuple[Dict[Tuple[str, str], int], Dict[Tuple[str, str], int], Dict[Tuple[str, str], int]]:
+        """
+        Returns the number of MQTT messages sent, delayed and dropped since the counter was created,
+        by (method, namespace)
+        """
+        return dict(self._api_call_totals), dict(self._delayed_call_totals), dict(self._dropped_call_totals)
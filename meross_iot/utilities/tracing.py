@@ -0,0 +1,177 @@
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import context as otel_context
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_context = None
+    otel_trace = None
+
+SPAN_EXECUTE_COMMAND = "meross.execute_cmd"
+SPAN_SEND_AND_WAIT_ACK = "meross.send_and_wait_ack"
+SPAN_MQTT_MESSAGE = "meross.mqtt.on_message"
+SPAN_DISPATCH_PUSH_NOTIFICATION = "meross.push.dispatch"
+SPAN_FIRE_PUSH_NOTIFICATION_EVENT = "meross.push.fire_event"
+SPAN_PUSH_HANDLER = "meross.push.handler"
+
+
+class Span(object):
+    """
+    Timed operation reported to the registered span callbacks.
+    Callbacks may keep their own state in the `context` dictionary, keyed by themselves.
+    """
+    __slots__ = ("name", "attributes", "start_time", "end_time", "error", "context")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = attributes if attributes is not None else {}
+        self.start_time = time.perf_counter()
+        self.end_time: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.context: Dict[Any, Any] = {}
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Duration of the span in seconds, or None when the span has not ended yet
+        """
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_val is not None:
+            self.error = exc_val
+        self.end_time = time.perf_counter()
+        for callback in _span_callbacks:
+            try:
+                callback.on_span_end(self)
+            except Exception:
+                _LOGGER.exception("Span callback %s failed while ending span %s", callback, self.name)
+
+    def __repr__(self):
+        return f"{self.name} {self.attributes}: {self.duration}"
+
+
+class _NoopSpan(object):
+    """
+    Span returned when no callback is registered: it does nothing
+    """
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SpanCallback(object):
+    """
+    Base class of the span callbacks: subclasses override the events they are interested in.
+    Callbacks are invoked synchronously by the thread running the traced operation (that can be the paho
+    network thread for `meross.mqtt.on_message` spans), so they must be fast and thread safe.
+    """
+
+    def on_span_start(self, span: Span) -> None:
+        pass
+
+    def on_span_end(self, span: Span) -> None:
+        pass
+
+
+_span_callbacks: Tuple[SpanCallback, ...] = ()
+
+
+def register_span_callback(callback: SpanCallback) -> None:
+    """
+    Registers a callback that is notified whenever a traced operation starts and ends
+    """
+    global _span_callbacks
+    if callback not in _span_callbacks:
+        # Swap the whole tuple, so that threads iterating over the callbacks are not affected
+        _span_callbacks = _span_callbacks + (callback,)
+
+
+def unregister_span_callback(callback: SpanCallback) -> None:
+    """
+    Unregisters a previously registered span callback
+    """
+    global _span_callbacks
+    _span_callbacks = tuple(c for c in _span_callbacks if c is not callback)
+
+
+def is_tracing_enabled() -> bool:
+    return len(_span_callbacks) > 0
+
+
+def trace_span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """
+    Starts a span, to be used as a context manager. When no callback is registered a shared no-op span is
+    returned, so that tracing adds no measurable overhead.
+    """
+    if not _span_callbacks:
+        return _NOOP_SPAN
+    span = Span(name, attributes)
+    for callback in _span_callbacks:
+        try:
+            callback.on_span_start(span)
+        except Exception:
+            _LOGGER.exception("Span callback %s failed while starting span %s", callback, name)
+    return span
+
+
+class OpenTelemetrySpanCallback(SpanCallback):
+    """
+    Span callback reporting the spans to OpenTelemetry. Spans started while another span is open in the same
+    context (e.g. `meross.send_and_wait_ack` within `meross.execute_cmd`) are reported as its children.
+    Requires the `opentelemetry-api` package.
+    """
+
+    def __init__(self, tracer=None):
+        if otel_trace is None:
+            raise ImportError("The opentelemetry-api package is required in order to use the OpenTelemetry adapter.")
+        self._tracer = tracer if tracer is not None else otel_trace.get_tracer("meross_iot")
+
+    @staticmethod
+    def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+        # OpenTelemetry only accepts primitive attribute values
+        return {k: v if isinstance(v, (str, bool, int, float)) else str(v)
+                for k, v in attributes.items() if v is not None}
+
+    def on_span_start(self, span: Span) -> None:
+        otel_span = self._tracer.start_span(span.name, attributes=self._otel_attributes(span.attributes))
+        token = otel_context.attach(otel_trace.set_span_in_context(otel_span))
+        span.context[self] = (otel_span, token)
+
+    def on_span_end(self, span: Span) -> None:
+        state = span.context.pop(self, None)
+        if state is None:
+            return
+        otel_span, token = state
+        otel_span.set_attributes(self._otel_attributes(span.attributes))
+        if span.error is not None:
+            otel_span.record_exception(span.error)
+            otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(span.error)))
+        otel_span.end()
+        try:
+            otel_context.detach(token)
+        except Exception:
+            # The span ended in a different context than the one it started in
+            pass
@@ -13,7 +13,7 @@ with open(path.join(here, 'README.md'), encoding='utf-8') as f:
 setup(
     name='meross_iot',
     version=TARGET_VERSION,
-    packages=find_packages(exclude=('tests',)),
+    packages=find_packages(exclude=('tests', 'benchmarks')),
     url='https://github.com/albertogeniola/MerossIot',
     license='MIT',
     author='Alberto Geniola',
@@ -43,6 +43,10 @@ setup(
         'requests>=2.19.1,<3.0.0',
         'aiohttp[speedups]>=3.7.4.post0,<4.0.0'
     ],
+    extras_require={
+        'speedups': ['orjson>=3.6.0'],
+        'tracing': ['opentelemetry-api>=1.0.0']
+    },
     python_requires='>=3.7',
     test_suite='tests',
     entry_points={
@@ -2,10 +2,14 @@ import base64
 import logging
 import os
 import sys
-from typing import Tuple
+from datetime import datetime
+from typing import Tuple, List, Optional
 
 from meross_iot.http_api import MerossHttpClient
+from meross_iot.manager import MerossManager
 from meross_iot.model.credentials import MerossCloudCreds
+from meross_iot.model.enums import OnlineStatus
+from meross_iot.model.http.device import HttpDeviceInfo
 
 _TEST_API_BASE_URL = os.environ.get('MEROSS_API_URL', "https://iotx-us.meross.com")
 _TEST_EMAIL = os.environ.get('MEROSS_EMAIL')
@@ -35,3 +39,32 @@ async def async_get_client() -> Tuple[MerossHttpClient, bool]:
     else:
         _LOGGER.info("Using username-password credentials")
         return await MerossHttpClient.async_from_user_password(api_base_url=api_base_url, email=_TEST_EMAIL, password=_TEST_PASSWORD, **opt_params), True
+
+
+def build_offline_manager(key: str = "key", **kwargs) -> MerossManager:
+    """
+    Builds a manager with fake credentials, for the tests that do not talk to the Meross cloud.
+    Additional keyword arguments are passed to the `MerossManager` constructor.
+    """
+    creds = MerossCloudCreds(token="token", key=key, user_id="1234", user_email="test@localhost",
+                             issued_on=datetime.utcnow(), domain="localhost", mqtt_domain="localhost",
+                             mfa_lock_expire=0)
+    return MerossManager(http_client=MerossHttpClient(cloud_credentials=creds), auto_discovery_on_connection=False,
+                         **kwargs)
+
+
+def build_http_device_info(uuid: str,
+                           device_type: str = "test-plug",
+                           hardware_version: str = "test",
+                           firmware_version: str = "1.0.0",
+                           online_status: OnlineStatus = OnlineStatus.ONLINE,
+                           domain: str = "mqtt-eu.meross.com",
+                           channels: Optional[List[dict]] = None,
+                           **kwargs) -> HttpDeviceInfo:
+    """
+    Builds the HTTP information of a fake device, named after its UUID.
+    Additional keyword arguments are passed to the `HttpDeviceInfo` constructor.
+    """
+    return HttpDeviceInfo(uuid=uuid, online_status=online_status, dev_name=uuid, device_type=device_type,
+                          channels=channels if channels is not None else [], fmware_version=firmware_version,
+                          hdware_version=hardware_version, domain=domain, reserved_domain=domain, **kwargs)
@@ -0,0 +1,163 @@
+import functools
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.controller.mixins.electricity import ElectricityMixin
+from meross_iot.controller.mixins.toggle import ToggleXMixin
+from meross_iot.manager import MerossManager
+from meross_iot.model.enums import Namespace, OnlineStatus
+from meross_iot.utilities.ability_cache import AbilityCache
+from tests import build_http_device_info, build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_PLUG_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                   Namespace.CONTROL_TOGGLEX.value: {}}
+_METERED_PLUG_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                           Namespace.CONTROL_TOGGLEX.value: {}, Namespace.CONTROL_ELECTRICITY.value: {}}
+
+
+_http_info = functools.partial(build_http_device_info, device_type="cache-plug", hardware_version="abilitycache")
+
+
+class TestAbilityCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "abilities.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookup_and_overrides(self):
+        cache = AbilityCache()
+        self.assertIsNone(cache.get(_http_info("plug1")))
+        cache.put(_http_info("plug1"), _PLUG_ABILITIES)
+        # Devices of the same kind share the abilities
+        self.assertEqual(cache.get(_http_info("plug2")), _PLUG_ABILITIES)
+        # ... unless they report different ones
+        cache.put(_http_info("plug3"), _METERED_PLUG_ABILITIES)
+        self.assertEqual(cache.get(_http_info("plug3")), _METERED_PLUG_ABILITIES)
+        self.assertEqual(cache.get(_http_info("plug2")), _PLUG_ABILITIES)
+        # Other firmware versions are different kinds
+        self.assertIsNone(cache.get(_http_info("plug1", firmware_version="2.0.0")))
+        cache.invalidate_device("plug3")
+        self.assertEqual(cache.get(_http_info("plug3")), _PLUG_ABILITIES)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 2)
+
+    def test_staleness(self):
+        cache = AbilityCache(max_age=0)
+        cache.put(_http_info("plug1"), _PLUG_ABILITIES)
+        self.assertTrue(cache.is_stale(_http_info("plug1")))
+        # Missing abilities are stale as well
+        self.assertTrue(AbilityCache(max_age=None).is_stale(_http_info("plug1")))
+        cache = AbilityCache(max_age=60)
+        cache.put(_http_info("plug1"), _PLUG_ABILITIES)
+        self.assertFalse(cache.is_stale(_http_info("plug1")))
+
+    def test_persistence(self):
+        cache = AbilityCache(path=self.path)
+        cache.put(_http_info("plug1"), _PLUG_ABILITIES)
+        cache.set_override("plug2", _METERED_PLUG_ABILITIES)
+        cache.save()
+        self.assertFalse(cache.dirty)
+        self.assertEqual(os.listdir(self.directory), ["abilities.json"])
+
+        reloaded = AbilityCache(path=self.path)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.get(_http_info("plug1")), _PLUG_ABILITIES)
+        self.assertEqual(reloaded.get(_http_info("plug2")), _METERED_PLUG_ABILITIES)
+
+        # Files written by other versions are ignored
+        with open(self.path, "wt") as f:
+            json.dump({"version": -1, "types": {}}, f)
+        self.assertEqual(len(AbilityCache(path=self.path)), 0)
+
+
+class TestManagerAbilityCache(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "abilities.json")
+        self.fetches = []
+        self.managers = []
+
+    async def tearDownAsync(self):
+        for m in self.managers:
+            m.close()
+        shutil.rmtree(self.directory)
+
+    def _new_manager(self, cache: AbilityCache) -> MerossManager:
+        manager = build_offline_manager(ability_cache=cache)
+
+        async def fetch_abilities(device_info, timeout):
+            self.fetches.append(device_info.uuid)
+            if device_info.fmware_version == "2.0.0":
+                return _METERED_PLUG_ABILITIES
+            return _PLUG_ABILITIES
+
+        manager._async_fetch_abilities = fetch_abilities
+        self.managers.append(manager)
+        return manager
+
+    @unittest_run_loop
+    async def test_restart_without_ability_round_trips(self):
+        http_devices = [_http_info(f"plug{i}") for i in range(10)] + \
+                       [_http_info("offline", online_status=OnlineStatus.OFFLINE)]
+        manager = self._new_manager(AbilityCache(path=self.path))
+        await manager.async_device_discovery(cached_http_device_list=http_devices)
+        # Devices enrolled after the first plug reported its abilities are built from the cache already
+        self.assertGreaterEqual(len(self.fetches), 1)
+        # The offline device is built from the abilities reported by the other devices of the same kind
+        self.assertEqual(len(manager.find_devices()), 11)
+        self.assertTrue(os.path.exists(self.path))
+
+        self.fetches.clear()
+        restarted = self._new_manager(AbilityCache(path=self.path))
+        await restarted.async_device_discovery(cached_http_device_list=http_devices)
+        self.assertEqual(self.fetches, [])
+        self.assertEqual(len(restarted.find_devices(device_class=ToggleXMixin)), 11)
+        self.assertEqual(restarted.last_discovery_stats.cached_abilities, 11)
+        self.assertEqual(restarted._ability_refresh_tasks, {})
+
+    @unittest_run_loop
+    async def test_stale_abilities_are_refreshed_in_background(self):
+        cache = AbilityCache(path=self.path, max_age=0)
+        cache.put(_http_info("plug0"), _PLUG_ABILITIES)
+        manager = self._new_manager(cache)
+        await manager.async_device_discovery(cached_http_device_list=[_http_info("plug0")])
+        self.assertEqual(manager.last_discovery_stats.cached_abilities, 1)
+        await asyncio.gather(*manager._ability_refresh_tasks.values())
+        self.assertEqual(self.fetches, ["plug0"])
+        # The refreshed abilities have been written back
+        self.assertFalse(cache.dirty)
+        self.assertIsInstance(manager.find_devices()[0], ToggleXMixin)
+
+    @unittest_run_loop
+    async def test_firmware_change_refreshes_abilities(self):
+        manager = self._new_manager(AbilityCache(path=self.path))
+        await manager.async_device_discovery(cached_http_device_list=[_http_info("plug0")])
+        plug = manager.find_devices()[0]
+        self.assertNotIsInstance(plug, ElectricityMixin)
+
+        await manager.async_device_discovery(cached_http_device_list=[_http_info("plug0", firmware_version="2.0.0")])
+        await asyncio.gather(*manager._ability_refresh_tasks.values())
+        self.assertEqual(self.fetches, ["plug0", "plug0"])
+        upgraded = manager.find_devices()
+        self.assertEqual(len(upgraded), 1)
+        self.assertIsInstance(upgraded[0], ElectricityMixin)
+        self.assertEqual(manager.ability_cache.get(_http_info("plug0", firmware_version="2.0.0")),
+                         _METERED_PLUG_ABILITIES)
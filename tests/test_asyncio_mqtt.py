@@ -0,0 +1,194 @@
+import os
+import socket
+
+import paho.mqtt.client as mqtt
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.manager import MerossManager, MqttLoopMode, _INGEST_ACK
+from meross_iot.utilities.asyncio_mqtt import AsyncioMqttSocketDriver
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class _RecordingClient(object):
+    """Stands for the paho client: records the network calls issued by the driver"""
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.misc = 0
+        self.reconnects = 0
+        self.reconnect_error = None
+
+    def loop_read(self, max_packets=1):
+        self.reads += 1
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_write(self, max_packets=1):
+        self.writes += 1
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_misc(self):
+        self.misc += 1
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        self.reconnects += 1
+        if self.reconnect_error is not None:
+            raise self.reconnect_error
+
+    def socket(self):
+        return None
+
+
+class TestAsyncioMqttSocketDriver(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.client = _RecordingClient()
+        self.driver = AsyncioMqttSocketDriver(client=self.client, loop=asyncio.get_event_loop())
+        self.sock, self.peer = socket.socketpair()
+        self.sock.setblocking(False)
+
+    async def tearDownAsync(self):
+        self.driver.stop()
+        self.sock.close()
+        self.peer.close()
+
+    @unittest_run_loop
+    async def test_socket_registration(self):
+        # The driver installs the paho socket callbacks
+        self.assertEqual(self.client.on_socket_open, self.driver._on_socket_open)
+        self.assertEqual(self.client.on_socket_register_write, self.driver._on_socket_register_write)
+
+        self.client.on_socket_open(self.client, None, self.sock)
+        self.peer.send(b"\x00")
+        await asyncio.sleep(0.05)
+        self.assertGreaterEqual(self.client.reads, 1)
+
+        # The writer is registered only while paho has data to send
+        self.client.on_socket_register_write(self.client, None, self.sock)
+        await asyncio.sleep(0.05)
+        self.assertGreaterEqual(self.client.writes, 1)
+        self.client.on_socket_unregister_write(self.client, None, self.sock)
+        writes = self.client.writes
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.client.writes, writes)
+
+    @unittest_run_loop
+    async def test_socket_close_removes_handlers(self):
+        self.client.on_socket_open(self.client, None, self.sock)
+        self.client.on_socket_register_write(self.client, None, self.sock)
+        self.client.on_socket_close(self.client, None, self.sock)
+        self.peer.send(b"\x00")
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.client.reads, 0)
+        self.assertEqual(self.client.writes, 0)
+        loop = asyncio.get_event_loop()
+        self.assertFalse(loop.remove_reader(self.sock))
+        self.assertFalse(loop.remove_writer(self.sock))
+
+    @unittest_run_loop
+    async def test_misc_loop(self):
+        self.client.on_socket_open(self.client, None, self.sock)
+        misc_task = self.driver._misc_task
+        self.assertIsNotNone(misc_task)
+        await asyncio.sleep(0)
+        self.assertEqual(self.client.misc, 1)
+
+        # Reopening the socket does not start a second timer
+        self.client.on_socket_open(self.client, None, self.sock)
+        self.assertIs(self.driver._misc_task, misc_task)
+
+        self.driver.stop()
+        await asyncio.sleep(0)
+        self.assertTrue(misc_task.done())
+        self.assertIsNone(self.driver._misc_task)
+
+    @unittest_run_loop
+    async def test_reconnection_back_off(self):
+        # Disconnections requested by the client are not retried
+        self.driver.notify_disconnected(mqtt.MQTT_ERR_SUCCESS)
+        self.assertIsNone(self.driver._reconnect_handle)
+
+        self.driver.notify_disconnected(mqtt.MQTT_ERR_CONN_LOST)
+        self.assertIsNotNone(self.driver._reconnect_handle)
+        self.client.reconnect_error = OSError("unreachable")
+        self.driver._reconnect_handle.cancel()
+        self.driver._reconnect()
+        self.assertEqual(self.client.reconnects, 1)
+        # The failed attempt is rescheduled with a longer delay
+        self.assertIsNotNone(self.driver._reconnect_handle)
+        self.assertEqual(self.driver._reconnect_delay, 4)
+        self.driver.notify_connected()
+        self.assertEqual(self.driver._reconnect_delay, 1)
+
+        handle = self.driver._reconnect_handle
+        self.driver.stop()
+        self.assertTrue(handle.cancelled())
+        self.driver.notify_disconnected(mqtt.MQTT_ERR_CONN_LOST)
+        self.assertIsNone(self.driver._reconnect_handle)
+
+
+class TestMqttLoopMode(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.managers = []
+
+    async def tearDownAsync(self):
+        for m in self.managers:
+            m.close()
+
+    def _new_manager(self, **kwargs) -> MerossManager:
+        manager = build_offline_manager(**kwargs)
+        self.managers.append(manager)
+        return manager
+
+    @unittest_run_loop
+    async def test_threaded_mode(self):
+        manager = self._new_manager()
+        self.assertEqual(manager.mqtt_loop_mode, MqttLoopMode.THREADED)
+        pool = manager._get_create_mqtt_pool(domain="localhost", port=2001)
+        self.assertTrue(all(c.driver is None for c in pool.connections))
+
+        # Callbacks coming from the network thread are moved to the event loop
+        calls = []
+        manager._call_in_loop(calls.append, 1)
+        self.assertEqual(calls, [])
+        await asyncio.sleep(0)
+        self.assertEqual(calls, [1])
+
+    @unittest_run_loop
+    async def test_asyncio_mode(self):
+        manager = self._new_manager(mqtt_loop_mode=MqttLoopMode.ASYNCIO, mqtt_connections_per_broker=2)
+        pool = manager._get_create_mqtt_pool(domain="localhost", port=2001)
+        self.assertEqual(len(pool.connections), 2)
+        for connection in pool.connections:
+            self.assertIsInstance(connection.driver, AsyncioMqttSocketDriver)
+            self.assertEqual(connection.client.on_socket_open, connection.driver._on_socket_open)
+
+        # Callbacks already run on the loop thread
+        calls = []
+        manager._call_in_loop(calls.append, 1)
+        self.assertEqual(calls, [1])
+
+        # Messages read within the same loop iteration are consumed as a single batch
+        futures = [asyncio.get_event_loop().create_future() for _ in range(3)]
+        for i, future in enumerate(futures):
+            manager._ingest_queue.put((_INGEST_ACK, future, i, None))
+        self.assertFalse(any(f.done() for f in futures))
+        await asyncio.sleep(0)
+        self.assertEqual([f.result() for f in futures], [0, 1, 2])
+        self.assertEqual(manager._ingest_queue.stats.batches, 1)
+
+        # Closing the manager stops the drivers
+        manager.close()
+        self.assertTrue(all(c.driver._stopped for c in pool.connections))
@@ -0,0 +1,76 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.model.exception import CommandTimeoutError
+from meross_iot.utilities.bulk import BulkConcurrencyLimiter
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class _Device(object):
+    def __init__(self, uuid: str, mqtt_host: str):
+        self.uuid = uuid
+        self.mqtt_host = mqtt_host
+        self.mqtt_port = 443
+
+
+class TestBulkExecution(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        await super().setUpAsync()
+        self.running = {}
+        self.max_running = {}
+
+    async def _track(self, *keys):
+        for k in keys:
+            self.running[k] = self.running.get(k, 0) + 1
+            self.max_running[k] = max(self.max_running.get(k, 0), self.running[k])
+        await asyncio.sleep(0.01)
+        for k in keys:
+            self.running[k] -= 1
+
+    @unittest_run_loop
+    async def test_limiter_caps(self):
+        limiter = BulkConcurrencyLimiter(max_concurrency=5, max_concurrency_per_broker=3, max_concurrency_per_device=1)
+        jobs = []
+        for i in range(40):
+            broker, device = f"broker{i % 3}", f"dev{i % 8}"
+            jobs.append(limiter.async_run(broker=broker, device_uuid=device,
+                                          command_factory=lambda b=broker, d=device: self._track("all", b, d)))
+        await asyncio.gather(*jobs)
+        self.assertEqual(self.max_running["all"], 5)
+        self.assertTrue(all(self.max_running[f"broker{i}"] <= 3 for i in range(3)))
+        self.assertTrue(all(self.max_running[f"dev{i}"] == 1 for i in range(8)))
+
+    @unittest_run_loop
+    async def test_execute_many(self):
+        manager = build_offline_manager()
+
+        async def execute_cmd(destination_device_uuid, **kwargs):
+            await self._track("all", destination_device_uuid)
+            if destination_device_uuid == "dev3":
+                raise CommandTimeoutError(message="", target_device_uuid=destination_device_uuid, timeout=1)
+            return {"uuid": destination_device_uuid}
+
+        manager.async_execute_cmd = execute_cmd
+        devices = [_Device(f"dev{i}", "mqtt-eu.meross.com") for i in range(10)]
+        commands = [(d, "GET", "Appliance.System.All", {}) for d in devices for _ in range(3)]
+
+        results = [r async for r in manager.async_execute_many(commands, max_concurrency=4)]
+        self.assertEqual(sorted(r.index for r in results), list(range(30)))
+        self.assertEqual(self.max_running["all"], 4)
+        self.assertEqual(self.max_running["dev0"], 1)
+        failed = [r for r in results if not r.succeeded]
+        self.assertEqual(len(failed), 3)
+        self.assertTrue(all(isinstance(r.error, CommandTimeoutError) and r.device.uuid == "dev3" for r in failed))
+        self.assertTrue(all(r.result == {"uuid": r.device.uuid} for r in results if r.succeeded))
+        manager.close()
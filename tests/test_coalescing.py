@@ -0,0 +1,83 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.utilities.coalescing import CommandCoalescer
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestCommandCoalescing(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        await super().setUpAsync()
+        self.sent = 0
+        self.release = asyncio.Event()
+        self.coalescer = CommandCoalescer()
+
+    async def _send(self):
+        self.sent += 1
+        await self.release.wait()
+        return {"sent": self.sent}
+
+    def _execute(self, payload=None):
+        return self.coalescer.async_execute(device_uuid="dev1",
+                                            namespace="Appliance.Control.Electricity",
+                                            payload={"electricity": {"channel": 0}} if payload is None else payload,
+                                            command_factory=self._send)
+
+    @unittest_run_loop
+    async def test_identical_commands_are_sent_once(self):
+        tasks = [asyncio.ensure_future(self._execute()) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(self.sent, 1)
+        self.assertEqual(results, [{"sent": 1}] * 5)
+        self.assertEqual(self.coalescer.saved_requests, 4)
+        self.assertEqual(self.coalescer.saved_requests_by_namespace(), {"Appliance.Control.Electricity": 4})
+        self.assertEqual(self.coalescer.in_flight, 0)
+
+        # Once completed, the command is sent again
+        await self._execute()
+        self.assertEqual(self.sent, 2)
+
+    @unittest_run_loop
+    async def test_different_payloads_are_not_coalesced(self):
+        tasks = [asyncio.ensure_future(self._execute({"electricity": {"channel": i}})) for i in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.sent, 3)
+        self.assertEqual(self.coalescer.saved_requests, 0)
+
+    @unittest_run_loop
+    async def test_cancellation(self):
+        first = asyncio.ensure_future(self._execute())
+        second = asyncio.ensure_future(self._execute())
+        await asyncio.sleep(0)
+
+        # Cancelling one of the callers does not affect the other one
+        first.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await second, {"sent": 1})
+        self.assertTrue(first.cancelled())
+
+    @unittest_run_loop
+    async def test_errors_are_shared(self):
+        async def failing():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        tasks = [asyncio.ensure_future(self.coalescer.async_execute(device_uuid="dev1", namespace="ns", payload={},
+                                                                    command_factory=failing)) for _ in range(2)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
@@ -0,0 +1,87 @@
+import json
+import unittest
+from unittest import mock
+
+from meross_iot.utilities import codec
+from meross_iot.utilities.codec import JsonCodec, OrjsonCodec, StdlibJsonCodec, get_json_codec, json_dumps, \
+    json_loads, set_json_codec
+
+_PAYLOADS = [
+    {"header": {"method": "SET", "namespace": "Appliance.Control.ToggleX"},
+     "payload": {"togglex": {"onoff": 1, "channel": 0}}},
+    {"payload": {"light": {"rgb": 16711680, "luminance": 50.5, "capacity": 5}}},
+    {"payload": {"all": [{"id": "01008BB8"}], "mode": None, "enabled": True}},
+]
+
+
+class _UpperCodec(StdlibJsonCodec):
+    name = "upper"
+
+    def dumps(self, obj):
+        return super().dumps(obj).upper()
+
+
+class TestJsonCodec(unittest.TestCase):
+    def setUp(self):
+        self._previous = get_json_codec()
+
+    def tearDown(self):
+        set_json_codec(self._previous)
+
+    def test_stdlib_codec(self):
+        stdlib = StdlibJsonCodec()
+        for payload in _PAYLOADS:
+            encoded = stdlib.dumps(payload)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(encoded, json.dumps(payload, separators=(',', ':')).encode("utf-8"))
+            # Bytes, strings and memory views are all accepted
+            self.assertEqual(stdlib.loads(encoded), payload)
+            self.assertEqual(stdlib.loads(encoded.decode("utf-8")), payload)
+            self.assertEqual(stdlib.loads(memoryview(encoded)), payload)
+        with self.assertRaises(ValueError):
+            stdlib.loads(b'{"header": ')
+
+    def test_orjson_codec(self):
+        if codec.orjson is None:
+            self.skipTest("orjson is not installed")
+        stdlib, fast = StdlibJsonCodec(), OrjsonCodec()
+        for payload in _PAYLOADS:
+            self.assertEqual(fast.dumps(payload), stdlib.dumps(payload))
+            self.assertEqual(fast.loads(stdlib.dumps(payload)), payload)
+        # Non-ASCII characters and non-string keys fall back to the stdlib serializer, byte by byte
+        self.assertEqual(fast.dumps({"spray": {"name": "Nöel"}}), b'{"spray":{"name":"N\\u00f6el"}}')
+        self.assertEqual(fast.dumps({0: "channel"}), stdlib.dumps({0: "channel"}))
+        with self.assertRaises(ValueError):
+            fast.loads(b'{"header": ')
+        # Floats with an exponent and non-finite floats are serialized differently
+        self.assertEqual(fast.dumps({"value": 1e-07}), b'{"value":1e-7}')
+        self.assertEqual(stdlib.dumps({"value": 1e-07}), b'{"value":1e-07}')
+        self.assertEqual(fast.dumps({"value": 1e+20}), b'{"value":1e20}')
+        self.assertEqual(stdlib.dumps({"value": 1e+20}), b'{"value":1e+20}')
+        self.assertEqual(fast.loads(fast.dumps({"value": 1e-07})), stdlib.loads(stdlib.dumps({"value": 1e-07})))
+        self.assertEqual(fast.dumps({"value": float("nan"), "max": float("inf")}), b'{"value":null,"max":null}')
+        self.assertEqual(stdlib.dumps({"value": float("nan")}), b'{"value":NaN}')
+        # Objects that none of the serializers support are still rejected
+        with self.assertRaises(TypeError):
+            fast.dumps({"value": object()})
+
+    def test_default_codec(self):
+        with mock.patch.object(codec, "orjson", None):
+            self.assertIsInstance(codec._default_codec(), StdlibJsonCodec)
+            self.assertNotIsInstance(codec._default_codec(), OrjsonCodec)
+        if codec.orjson is not None:
+            self.assertIsInstance(codec._default_codec(), OrjsonCodec)
+
+    def test_set_codec(self):
+        with self.assertRaises(ValueError):
+            set_json_codec(json)
+        # A failed override keeps the current codec
+        self.assertIs(get_json_codec(), self._previous)
+
+        set_json_codec(_UpperCodec())
+        self.assertEqual(get_json_codec().name, "upper")
+        self.assertEqual(json_dumps({"a": "b"}), b'{"A":"B"}')
+        self.assertEqual(json_loads(b'{"a":"b"}'), {"a": "b"})
+
+        with self.assertRaises(NotImplementedError):
+            JsonCodec().loads(b"{}")
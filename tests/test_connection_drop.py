@@ -0,0 +1,132 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.device_factory import build_meross_device_from_abilities
+from meross_iot.manager import MerossManager
+from meross_iot.model.enums import Namespace, OnlineStatus
+from meross_iot.model.push.online import ConnectionDropPushNotification, OnlinePushNotification
+from tests import build_http_device_info, build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {}}
+
+
+class TestConnectionDrop(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.managers = []
+        self.manager = self._new_manager()
+
+    async def tearDownAsync(self):
+        for m in self.managers:
+            m.close()
+
+    def _new_manager(self, **kwargs) -> MerossManager:
+        manager = build_offline_manager(**kwargs)
+        self.managers.append(manager)
+        for i in range(250):
+            domain = "mqtt-eu.meross.com" if i % 2 == 0 else "mqtt-us.meross.com"
+            info = build_http_device_info(f"dev{i}", device_type="mss310", domain=domain)
+            device = build_meross_device_from_abilities(http_device_info=info, device_abilities=_ABILITIES,
+                                                        manager=manager)
+            manager._device_registry.enroll_device(device)
+        return manager
+
+    @unittest_run_loop
+    async def test_only_broker_devices_go_offline(self):
+        manager_events = []
+        drop_events = []
+        device_events = []
+
+        async def manager_handler(push_notification, target_devices, manager):
+            manager_events.append((push_notification, target_devices))
+
+        async def drop_handler(push_notification, target_devices, manager):
+            # The per-device notifications have been dispatched already
+            self.assertEqual(len(manager_events), 125)
+            drop_events.append((push_notification, target_devices))
+
+        async def device_handler(namespace, data, device_internal_id):
+            device_events.append(device_internal_id)
+
+        self.manager.register_push_notification_handler_coroutine(manager_handler)
+        self.manager.register_connection_drop_handler_coroutine(drop_handler)
+        for d in self.manager.find_devices():
+            d.register_push_notification_handler_coroutine(device_handler)
+
+        await self.manager._notify_connection_drop("mqtt-eu.meross.com:443")
+
+        offline = self.manager.find_devices(online_status=OnlineStatus.UNKNOWN)
+        self.assertEqual(len(offline), 125)
+        self.assertTrue(all(d.mqtt_host == "mqtt-eu.meross.com" for d in offline))
+        self.assertEqual(len(self.manager.find_devices(online_status=OnlineStatus.ONLINE)), 125)
+
+        # Ordinary handlers receive one ONLINE notification per device, as for the ones coming from the broker
+        self.assertEqual(len(manager_events), 125)
+        self.assertEqual({type(p) for p, _ in manager_events}, {OnlinePushNotification})
+        self.assertEqual({p.originating_device_uuid for p, _ in manager_events}, {d.uuid for d in offline})
+        self.assertTrue(all(len(devices) == 1 for _, devices in manager_events))
+        self.assertEqual(len(device_events), 125)
+
+        # A single aggregated event for the handlers that opted in
+        self.assertEqual(len(drop_events), 1)
+        push_notification, target_devices = drop_events[0]
+        self.assertIsInstance(push_notification, ConnectionDropPushNotification)
+        self.assertEqual(push_notification.broker, "mqtt-eu.meross.com:443")
+        self.assertEqual(len(push_notification.device_uuids), 125)
+        self.assertEqual(len(target_devices), 125)
+
+    @unittest_run_loop
+    async def test_online_update_is_queued_behind_pending_pushes(self):
+        device = self.manager.find_devices(device_uuids=("dev0",))[0]
+        statuses = []
+
+        async def manager_handler(push_notification, target_devices, manager):
+            statuses.append(push_notification.status)
+
+        self.manager.register_push_notification_handler_coroutine(manager_handler)
+        # A push notification received right before the connection dropped
+        self.manager._push_dispatcher.submit("dev0", OnlinePushNotification(
+            originating_device_uuid="dev0", raw_data={'online': {'status': OnlineStatus.ONLINE.value}}))
+        await self.manager._notify_connection_drop("mqtt-eu.meross.com:443")
+        await self.manager.async_wait_push_dispatch()
+
+        self.assertEqual(statuses[0], OnlineStatus.ONLINE.value)
+        self.assertEqual(device.online_status, OnlineStatus.UNKNOWN)
+
+    @unittest_run_loop
+    async def test_online_updates_are_never_dropped(self):
+        manager = self._new_manager(push_backlog_limit=20)
+        gate = asyncio.Event()
+
+        async def manager_handler(push_notification, target_devices, manager):
+            await gate.wait()
+
+        manager.register_push_notification_handler_coroutine(manager_handler)
+        # The backlog is full of push notifications received right before the connection dropped
+        for i in range(1, 250, 2):
+            manager._push_dispatcher.submit(f"dev{i}", OnlinePushNotification(
+                originating_device_uuid=f"dev{i}", raw_data={'online': {'status': OnlineStatus.ONLINE.value}}))
+        self.assertGreater(manager.push_dropped, 0)
+        dropped = manager.push_dropped
+
+        await manager._notify_connection_drop("mqtt-eu.meross.com:443")
+        gate.set()
+        await manager.async_wait_push_dispatch()
+        self.assertEqual(manager.push_dropped, dropped)
+        self.assertEqual(len(manager.find_devices(online_status=OnlineStatus.UNKNOWN)), 125)
+
+    @unittest_run_loop
+    async def test_unknown_broker(self):
+        await self.manager._notify_connection_drop("unknown:443")
+        self.assertEqual(len(self.manager.find_devices(online_status=OnlineStatus.ONLINE)), 250)
@@ -0,0 +1,93 @@
+import functools
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.controller.device import HubDevice
+from meross_iot.controller.mixins.electricity import ElectricityMixin
+from meross_iot.controller.mixins.toggle import ToggleMixin, ToggleXMixin
+from meross_iot.device_factory import build_meross_device_from_abilities, get_device_type_cache_stats
+from meross_iot.model.enums import Namespace
+from meross_iot.model.http.device import HttpDeviceInfo
+from tests import build_http_device_info, build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_http_info = functools.partial(build_http_device_info, device_type="factory-plug", hardware_version="factory")
+
+
+def _abilities(*namespaces: Namespace, marker: str = "factory") -> dict:
+    # The marker makes the ability set unique to this test module
+    abilities = {Namespace.SYSTEM_ALL.value: {"marker": marker}, Namespace.SYSTEM_ONLINE.value: {}}
+    abilities.update({ns.value: {} for ns in namespaces})
+    return abilities
+
+
+class TestDeviceTypeCache(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.manager = build_offline_manager()
+
+    async def tearDownAsync(self):
+        self.manager.close()
+
+    def _build(self, http_info: HttpDeviceInfo, abilities: dict):
+        return build_meross_device_from_abilities(http_device_info=http_info, device_abilities=abilities,
+                                                  manager=self.manager)
+
+    @unittest_run_loop
+    async def test_identical_devices_share_one_type(self):
+        stats = get_device_type_cache_stats()
+        hits, misses, types = stats.hits, stats.misses, stats.types
+        abilities = _abilities(Namespace.CONTROL_TOGGLEX, marker="identical")
+        devices = [self._build(_http_info(f"plug{i}"), dict(abilities)) for i in range(200)]
+
+        self.assertEqual(len({type(d) for d in devices}), 1)
+        # The class is named after the first device it was built for, and keeps the fingerprint of its abilities
+        self.assertEqual(type(devices[0]).__name__, "factory-plug:factory:1.0.0")
+        self.assertEqual(len(type(devices[0])._abilities_fingerprint), 40)
+        self.assertEqual(stats.types - types, 1)
+        self.assertEqual(stats.misses - misses, 1)
+        self.assertEqual(stats.hits - hits, 199)
+        # The fingerprint does not depend on the order of the abilities
+        reordered = dict(reversed(list(abilities.items())))
+        self.assertIs(type(self._build(_http_info("reordered"), reordered)), type(devices[0]))
+
+    @unittest_run_loop
+    async def test_types_follow_abilities(self):
+        plug = self._build(_http_info("plug"), _abilities(Namespace.CONTROL_TOGGLEX, marker="follow"))
+        metered = self._build(_http_info("metered"),
+                              _abilities(Namespace.CONTROL_TOGGLEX, Namespace.CONTROL_ELECTRICITY, marker="follow"))
+        # Same type, hardware and firmware, but different abilities
+        self.assertNotIsInstance(plug, ElectricityMixin)
+        self.assertIsInstance(metered, ElectricityMixin)
+        self.assertEqual(type(plug).__name__, type(metered).__name__)
+        self.assertNotEqual(type(plug)._abilities_fingerprint, type(metered)._abilities_fingerprint)
+        self.assertEqual(metered.abilities[Namespace.SYSTEM_ALL.value], {"marker": "follow"})
+
+        # Devices that do not report their versions are cached as well
+        misses = get_device_type_cache_stats().misses
+        first = self._build(_http_info("nover1", hardware_version="", firmware_version=""),
+                            _abilities(Namespace.CONTROL_TOGGLEX, marker="noversion"))
+        second = self._build(_http_info("nover2", hardware_version="", firmware_version=""),
+                             _abilities(Namespace.CONTROL_TOGGLEX, marker="noversion"))
+        self.assertIs(type(first), type(second))
+        self.assertEqual(get_device_type_cache_stats().misses - misses, 1)
+
+    @unittest_run_loop
+    async def test_mixin_resolution(self):
+        device = self._build(_http_info("both"),
+                             _abilities(Namespace.CONTROL_TOGGLE, Namespace.CONTROL_TOGGLEX, marker="both"))
+        # The X version of an ability is preferred
+        self.assertIsInstance(device, ToggleXMixin)
+        self.assertNotIsInstance(device, ToggleMixin)
+        hub = self._build(_http_info("hub"), _abilities(Namespace.SYSTEM_DIGEST_HUB, marker="hub"))
+        self.assertIsInstance(hub, HubDevice)
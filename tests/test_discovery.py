@@ -0,0 +1,169 @@
+import functools
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.controller.device import HubDevice, GenericSubDevice
+from meross_iot.controller.mixins.toggle import ToggleXMixin
+from meross_iot.device_factory import build_meross_device_from_abilities
+from meross_iot.model.enums import Namespace
+from meross_iot.model.exception import CommandTimeoutError
+from meross_iot.model.http.subdevice import HttpSubdeviceInfo
+from meross_iot.utilities.discovery import PHASE_ENROLL_NEW_DEVICES, PHASE_LIST_HUB_SUBDEVICES, \
+    PHASE_UPDATE_KNOWN_DEVICES
+from tests import build_http_device_info, build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_PLUG_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                   Namespace.CONTROL_TOGGLEX.value: {}}
+_HUB_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                  Namespace.SYSTEM_DIGEST_HUB.value: {}}
+
+
+_http_info = functools.partial(build_http_device_info, device_type="discovery-plug", hardware_version="discovery")
+
+
+class TestParallelDiscovery(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.manager = build_offline_manager(discovery_max_concurrency=5, discovery_ability_timeout=0.2)
+        self.manager._discovery_ability_retry_delay = 0.01
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.slow_attempts = 0
+
+        async def fetch_abilities(device_info, timeout):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                if device_info.uuid == "slow":
+                    self.slow_attempts += 1
+                    # The device only answers to the background retry, which uses the default timeout
+                    if timeout < 1:
+                        await asyncio.sleep(timeout)
+                        raise CommandTimeoutError(message="", target_device_uuid=device_info.uuid, timeout=timeout)
+                await asyncio.sleep(0.05)
+                return _HUB_ABILITIES if device_info.device_type == "discovery-hub" else _PLUG_ABILITIES
+            finally:
+                self.in_flight -= 1
+
+        self.manager._async_fetch_abilities = fetch_abilities
+
+    async def tearDownAsync(self):
+        self.manager.close()
+
+    @unittest_run_loop
+    async def test_discovery_runs_concurrently(self):
+        known = build_meross_device_from_abilities(http_device_info=_http_info("known"),
+                                                   device_abilities=_PLUG_ABILITIES, manager=self.manager)
+        self.manager._device_registry.enroll_device(known)
+        http_devices = [_http_info(f"plug{i}") for i in range(20)] + [_http_info("known")]
+
+        start = asyncio.get_event_loop().time()
+        devices = await self.manager.async_device_discovery(cached_http_device_list=http_devices)
+        elapsed = asyncio.get_event_loop().time() - start
+
+        # 20 fetches of 50ms each, 5 at a time
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.max_in_flight, 5)
+        self.assertEqual(len(devices), 21)
+        self.assertEqual(len(self.manager.find_devices(device_class=ToggleXMixin)), 21)
+
+        stats = self.manager.last_discovery_stats
+        self.assertEqual(stats.new_devices, 20)
+        self.assertEqual(stats.known_devices, 1)
+        self.assertEqual(stats.ability_timeouts, 0)
+        self.assertIn(PHASE_ENROLL_NEW_DEVICES, stats.phase_timings)
+        self.assertIn(PHASE_UPDATE_KNOWN_DEVICES, stats.phase_timings)
+        self.assertLessEqual(stats.phase_timings[PHASE_ENROLL_NEW_DEVICES], stats.total_time)
+
+    @unittest_run_loop
+    async def test_phase_timings_exclude_slot_waits(self):
+        async def list_hub_subdevices(hub_id):
+            await asyncio.sleep(0.01)
+            return []
+
+        self.manager._http_client.async_list_hub_subdevices = list_hub_subdevices
+        self.manager._discovery_max_concurrency = 1
+        # Subdevices are listed once the hub is enrolled, after the plugs waiting for the only slot
+        http_devices = [_http_info("hub", device_type="discovery-hub")] + [_http_info(f"plug{i}") for i in range(4)]
+        await self.manager.async_device_discovery(update_subdevice_status=False,
+                                                  cached_http_device_list=http_devices)
+
+        stats = self.manager.last_discovery_stats
+        self.assertGreater(stats.total_time, 0.25)
+        self.assertLess(stats.phase_timings[PHASE_LIST_HUB_SUBDEVICES], 0.1)
+
+    @unittest_run_loop
+    async def test_slow_device_is_retried_in_background(self):
+        http_devices = [_http_info("slow")] + [_http_info(f"plug{i}") for i in range(4)]
+        devices = await self.manager.async_device_discovery(cached_http_device_list=http_devices)
+
+        # The slow device is not a known type: it can only be enrolled once it reports its abilities
+        self.assertEqual(len(devices), 4)
+        self.assertEqual(self.manager.last_discovery_stats.ability_timeouts, 1)
+        self.assertLess(self.manager.last_discovery_stats.total_time, 1)
+        self.assertIsNone(self.manager._device_registry.lookup_base_by_uuid("slow"))
+
+        await asyncio.wait_for(self.manager._ability_refresh_tasks["slow"], timeout=2)
+        self.assertEqual(self.slow_attempts, 2)
+        slow = self.manager._device_registry.lookup_base_by_uuid("slow")
+        self.assertIsInstance(slow, ToggleXMixin)
+        self.assertNotIn("slow", self.manager._ability_refresh_tasks)
+
+    @unittest_run_loop
+    async def test_iter_discovery_yields_devices_as_enrolled(self):
+        async def list_hub_subdevices(hub_id):
+            # Listing subdevices is the slowest step of the discovery
+            await asyncio.sleep(0.1)
+            return [HttpSubdeviceInfo(sub_device_id=f"{hub_id}-sensor{i}", true_id=f"{hub_id}-sensor{i}",
+                                      sub_device_type="ms100", sub_device_vendor="meross",
+                                      sub_device_name=f"Sensor {i}", sub_device_icon_id="icon")
+                    for i in range(2)]
+
+        self.manager._http_client.async_list_hub_subdevices = list_hub_subdevices
+        http_devices = [_http_info("hub", device_type="discovery-hub"), _http_info("slow")] + \
+                       [_http_info(f"plug{i}") for i in range(3)]
+
+        start = asyncio.get_event_loop().time()
+        first_device_after = None
+        yielded = []
+        async for device in self.manager.async_iter_discovery(update_subdevice_status=False,
+                                                              cached_http_device_list=http_devices):
+            if first_device_after is None:
+                first_device_after = asyncio.get_event_loop().time() - start
+            yielded.append(device)
+
+        # The first devices are available well before the slow one times out
+        self.assertLess(first_device_after, 0.15)
+        self.assertEqual(len(yielded), 6)
+        self.assertEqual(len([d for d in yielded if isinstance(d, GenericSubDevice)]), 2)
+        self.assertEqual(len([d for d in yielded if isinstance(d, HubDevice)]), 1)
+        # Same registry state of a regular discovery
+        self.assertCountEqual(yielded, self.manager.find_devices())
+        self.assertEqual(self.manager.last_discovery_stats.subdevices, 2)
+
+    @unittest_run_loop
+    async def test_iter_discovery_stops_with_the_caller(self):
+        http_devices = [_http_info(f"plug{i}") for i in range(20)]
+        iterator = self.manager.async_iter_discovery(update_subdevice_status=False,
+                                                     cached_http_device_list=http_devices)
+        first = await iterator.__anext__()
+        await iterator.aclose()
+
+        # Closing the iterator cancels the discovery: no more devices are fetched or enrolled
+        self.assertEqual(self.in_flight, 0)
+        enrolled = len(self.manager.find_devices())
+        await asyncio.sleep(0.2)
+        self.assertIn(first, self.manager.find_devices())
+        self.assertEqual(len(self.manager.find_devices()), enrolled)
+        self.assertLess(enrolled, 20)
@@ -0,0 +1,232 @@
+import os
+import random
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.manager import _INGEST_PUSH
+from meross_iot.model.enums import Namespace
+from meross_iot.model.push.generic import GenericPushNotification
+from meross_iot.utilities.dispatcher import PushDispatcher, PushCoalescingPolicy
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestPushDispatcher(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    @unittest_run_loop
+    async def test_per_key_order(self):
+        processed = {}
+
+        async def process(item):
+            key, seq = item
+            # Random delays would reorder the items of a key, if they were processed concurrently
+            await asyncio.sleep(random.random() * 0.005)
+            processed.setdefault(key, []).append(seq)
+
+        dispatcher = PushDispatcher(process=process, max_concurrency=4)
+        for seq in range(20):
+            for key in ("a", "b", "c"):
+                dispatcher.submit(key, (key, seq))
+        await dispatcher.async_join()
+        for key in ("a", "b", "c"):
+            self.assertEqual(processed[key], list(range(20)))
+        self.assertEqual(dispatcher.backlog, 0)
+        self.assertEqual(dispatcher.active_keys, 0)
+
+    @unittest_run_loop
+    async def test_concurrency_cap(self):
+        running = 0
+        max_running = 0
+
+        async def process(item):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        dispatcher = PushDispatcher(process=process, max_concurrency=3)
+        for key in range(10):
+            dispatcher.submit(key, key)
+        await dispatcher.async_join()
+        self.assertEqual(max_running, 3)
+
+    @unittest_run_loop
+    async def test_handlers_run_concurrently_with_timeout(self):
+        fast_done = asyncio.Event()
+
+        async def slow_handler(*args):
+            await asyncio.sleep(10)
+
+        async def fast_handler(*args):
+            fast_done.set()
+
+        async def failing_handler(*args):
+            raise ValueError("boom")
+
+        dispatcher = PushDispatcher(process=None, handler_timeout=0.05)
+        dispatcher.set_handler_timeout(failing_handler, None)
+        start = asyncio.get_event_loop().time()
+        await dispatcher.async_invoke_handlers([slow_handler, fast_handler, failing_handler], "push")
+        self.assertLess(asyncio.get_event_loop().time() - start, 1)
+        self.assertTrue(fast_done.is_set())
+
+        stats = {s.name.split(".")[-1]: s for s in dispatcher.handler_stats()}
+        self.assertEqual(stats["slow_handler"].timeouts, 1)
+        self.assertGreaterEqual(stats["slow_handler"].max_time, 0.05)
+        self.assertEqual(stats["fast_handler"].calls, 1)
+        self.assertEqual(stats["fast_handler"].errors, 0)
+        self.assertEqual(stats["failing_handler"].errors, 1)
+
+    @unittest_run_loop
+    async def test_processing_errors_do_not_stop_the_queue(self):
+        processed = []
+
+        async def process(item):
+            if item == 1:
+                raise ValueError("boom")
+            processed.append(item)
+
+        dispatcher = PushDispatcher(process=process)
+        for i in range(3):
+            dispatcher.submit("dev", i)
+        await dispatcher.async_join()
+        self.assertEqual(processed, [0, 2])
+
+    @unittest_run_loop
+    async def test_overload_coalescing_and_drops(self):
+        processed = []
+        gate = asyncio.Event()
+
+        async def process(item):
+            await gate.wait()
+            processed.append(item)
+
+        # Items are (name, coalescing key): items with no coalescing key are never coalesced
+        dispatcher = PushDispatcher(process=process, max_backlog=6, coalescing_threshold=2,
+                                    coalescing_key=lambda item: item[1])
+        # Below the threshold nothing is coalesced: the first item is taken by the worker right away
+        for i in range(2):
+            self.assertTrue(dispatcher.submit("dev", (f"temp{i}", "temp")))
+        await asyncio.sleep(0)
+        self.assertEqual(dispatcher.backlog, 1)
+
+        # Past the threshold, the latest temp item replaces the queued one
+        for i in range(2, 10):
+            self.assertTrue(dispatcher.submit("dev", (f"temp{i}", "temp")))
+        self.assertEqual(dispatcher.backlog, 3)
+        self.assertEqual(dispatcher.coalesced, 6)
+
+        # Keep-all items fill the backlog, then get dropped
+        for i in range(5):
+            dispatcher.submit("dev", (f"alert{i}", None))
+        self.assertEqual(dispatcher.backlog, 6)
+        self.assertEqual(dispatcher.dropped, 2)
+        # A full backlog still accepts items superseding a queued one
+        self.assertTrue(dispatcher.submit("dev", ("temp10", "temp")))
+
+        gate.set()
+        await dispatcher.async_join()
+        self.assertEqual([p[0] for p in processed],
+                         ["temp0", "temp1", "temp2", "alert0", "alert1", "alert2", "temp10"])
+        self.assertEqual(dispatcher.backlog, 0)
+        self.assertEqual(dispatcher.max_observed_backlog, 6)
+
+    @unittest_run_loop
+    async def test_items_waiting_for_a_slot_stay_in_the_backlog(self):
+        processed = []
+        gate = asyncio.Event()
+
+        async def process(item):
+            await gate.wait()
+            processed.append(item[0])
+
+        dispatcher = PushDispatcher(process=process, max_concurrency=1, max_backlog=4, coalescing_threshold=1,
+                                    coalescing_key=lambda item: item[1])
+        # "a" takes the only slot, while "b" waits for it: its item is still queued, and can be coalesced
+        dispatcher.submit("a", ("a0", "temp"))
+        dispatcher.submit("b", ("b0", "temp"))
+        await asyncio.sleep(0)
+        self.assertEqual(dispatcher.backlog, 1)
+        self.assertTrue(dispatcher.submit("b", ("b1", "temp")))
+        self.assertEqual(dispatcher.backlog, 1)
+        self.assertEqual(dispatcher.coalesced, 1)
+
+        # The backlog limit accounts for the items waiting for a slot; forced items are queued anyway
+        for key in ("c", "d", "e"):
+            self.assertTrue(dispatcher.submit(key, (key, None)))
+        self.assertFalse(dispatcher.submit("f", ("f0", None)))
+        self.assertTrue(dispatcher.submit("f", ("f1", None), force=True))
+        self.assertEqual(dispatcher.backlog, 5)
+        self.assertEqual(dispatcher.dropped, 1)
+
+        gate.set()
+        await dispatcher.async_join()
+        self.assertEqual(processed, ["a0", "b1", "c", "d", "e", "f1"])
+        self.assertEqual(dispatcher.backlog, 0)
+
+
+class TestManagerPushOverload(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.manager = build_offline_manager(push_backlog_limit=20)
+
+    async def tearDownAsync(self):
+        self.manager.close()
+
+    @unittest_run_loop
+    async def test_sensor_burst_is_coalesced(self):
+        received = []
+        gate = asyncio.Event()
+
+        async def handler(push_notification, target_devices, manager):
+            await gate.wait()
+            received.append((push_notification.namespace, push_notification.raw_data))
+
+        self.manager.register_push_notification_handler_coroutine(handler)
+        batch = []
+        for i in range(100):
+            sensor = "sensor-a" if i % 2 == 0 else "sensor-b"
+            batch.append((_INGEST_PUSH, GenericPushNotification(
+                namespace=Namespace.HUB_SENSOR_TEMPHUM, originating_device_uuid="hub",
+                raw_data={"tempHum": [{"id": sensor, "latestTemperature": i}]})))
+            if i % 25 == 0:
+                batch.append((_INGEST_PUSH, GenericPushNotification(
+                    namespace=Namespace.HUB_SENSOR_ALERT, originating_device_uuid="hub",
+                    raw_data={"alert": [{"id": "sensor-a", "value": i}]})))
+        self.manager._process_ingested_messages(batch)
+        gate.set()
+        await self.manager.async_wait_push_dispatch()
+
+        alerts = [data["alert"][0]["value"] for ns, data in received if ns == Namespace.HUB_SENSOR_ALERT]
+        self.assertEqual(alerts, [0, 25, 50, 75])
+        temperatures = [data["tempHum"][0] for ns, data in received if ns == Namespace.HUB_SENSOR_TEMPHUM]
+        self.assertEqual(temperatures[-2:], [{"id": "sensor-a", "latestTemperature": 98},
+                                             {"id": "sensor-b", "latestTemperature": 99}])
+        self.assertEqual(len(received), 104 - self.manager.push_coalesced)
+        self.assertGreater(self.manager.push_coalesced, 80)
+        self.assertEqual(self.manager.push_dropped, 0)
+
+    @unittest_run_loop
+    async def test_keep_all_policy(self):
+        self.assertEqual(self.manager.get_push_coalescing_policy(Namespace.HUB_SENSOR_TEMPHUM),
+                         PushCoalescingPolicy.LATEST_WINS)
+        self.manager.set_push_coalescing_policy(Namespace.HUB_SENSOR_TEMPHUM, PushCoalescingPolicy.KEEP_ALL)
+        batch = [(_INGEST_PUSH, GenericPushNotification(namespace=Namespace.HUB_SENSOR_TEMPHUM,
+                                                        originating_device_uuid="hub",
+                                                        raw_data={"tempHum": [{"id": "sensor-a"}]}))
+                 for _ in range(30)]
+        self.manager._process_ingested_messages(batch)
+        self.assertEqual(self.manager.push_coalesced, 0)
+        self.assertEqual(self.manager.push_dropped, 10)
+        await self.manager.async_wait_push_dispatch()
@@ -0,0 +1,27 @@
+import unittest
+from datetime import timedelta
+
+from meross_iot.error_budget import ErrorBudgetManager
+
+
+class TestErrorBudget(unittest.TestCase):
+    def test_errors_are_accounted_per_device(self):
+        budget = ErrorBudgetManager(max_errors=2, time_window=timedelta(seconds=60))
+        self.assertFalse(budget.is_out_of_budget("dev1"))
+
+        budget.notify_error("dev1")
+        self.assertFalse(budget.is_out_of_budget("dev1"))
+        budget.notify_error("dev1")
+        # The device ran out of budget, so LAN commands fall back to MQTT
+        self.assertTrue(budget.is_out_of_budget("dev1"))
+        self.assertFalse(budget.is_out_of_budget("dev2"))
+        self.assertEqual(budget.get_budgets(), {"dev1": 0, "dev2": 2})
+
+    def test_budget_is_restored_when_the_window_expires(self):
+        budget = ErrorBudgetManager(max_errors=1, time_window=timedelta(seconds=60))
+        budget.notify_error("dev1")
+        self.assertTrue(budget.is_out_of_budget("dev1"))
+
+        budget._devices_budget["dev1"].window_start -= timedelta(seconds=61)
+        self.assertEqual(budget.get_budgets(), {"dev1": 1})
+        self.assertFalse(budget.is_out_of_budget("dev1"))
@@ -0,0 +1,54 @@
+import os
+import threading
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.utilities.ingest import BatchedIngestQueue
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestIngestQueue(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        await super().setUpAsync()
+        self.batches = []
+        loop = asyncio.get_event_loop()
+        self.queue = BatchedIngestQueue(consumer=self.batches.append,
+                                        wake=loop.call_soon_threadsafe,
+                                        reschedule=loop.call_soon,
+                                        max_batch_size=10)
+
+    @unittest_run_loop
+    async def test_burst_is_drained_in_batches(self):
+        def producer():
+            for i in range(25):
+                self.queue.put(i)
+
+        t = threading.Thread(target=producer)
+        t.start()
+        t.join()
+
+        # Let the loop drain the queue
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        drained = [i for b in self.batches for i in b]
+        self.assertEqual(drained, list(range(25)))
+        self.assertTrue(all(len(b) <= 10 for b in self.batches))
+        self.assertEqual(len(self.batches), 3)
+        self.assertEqual(self.queue.stats.queue_depth, 0)
+        self.assertEqual(self.queue.stats.max_queue_depth, 25)
+        self.assertEqual(self.queue.stats.batches, 3)
+
+    @unittest_run_loop
+    async def test_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            self.queue.max_batch_size = 0
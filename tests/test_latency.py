@@ -0,0 +1,93 @@
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from meross_iot.utilities import latency
+from meross_iot.utilities.latency import LatencyRecorder, LatencyTransport, WindowedLatencyHistogram
+
+
+class TestLatencyHistograms(unittest.TestCase):
+    def test_percentiles(self):
+        recorder = LatencyRecorder()
+        for i in range(1, 1001):
+            recorder.record(transport=LatencyTransport.MQTT, namespace="Appliance.System.All", latency=i / 1000,
+                            device_uuid="dev1")
+        stats = recorder.get_stats(device_uuid="dev1")
+        self.assertEqual(stats.count, 1000)
+        self.assertAlmostEqual(stats.p50, 0.5, delta=0.5 * 0.05)
+        self.assertAlmostEqual(stats.p90, 0.9, delta=0.9 * 0.05)
+        self.assertAlmostEqual(stats.p99, 0.99, delta=0.99 * 0.05)
+        self.assertEqual(stats.max, 1.0)
+
+    def test_filters(self):
+        recorder = LatencyRecorder()
+        recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.1, device_uuid="dev1")
+        recorder.record(transport=LatencyTransport.LAN_HTTP, namespace="ns1", latency=0.01, device_uuid="dev1")
+        recorder.record(transport=LatencyTransport.MQTT, namespace="ns2", latency=0.2, device_uuid="dev2")
+        recorder.record(transport=LatencyTransport.HTTP_API, namespace="https://iot.meross.com/v1/Device/devList",
+                        latency=0.3)
+
+        self.assertEqual(recorder.get_stats().count, 4)
+        self.assertEqual(recorder.get_stats(transport=LatencyTransport.MQTT).count, 2)
+        self.assertEqual(recorder.get_stats(transport=LatencyTransport.MQTT).max, 0.2)
+        self.assertEqual(recorder.get_stats(namespace="ns1").count, 2)
+        self.assertEqual(recorder.get_stats(device_uuid="dev1", transport=LatencyTransport.LAN_HTTP).max, 0.01)
+        self.assertEqual(recorder.get_stats(device_uuid="unknown").count, 0)
+        self.assertEqual(len(recorder.keys()), 4)
+
+    def test_time_window(self):
+        histogram = WindowedLatencyHistogram(slot_seconds=10, slots=6)
+        histogram.record(5.0, now=1000)
+        histogram.record(0.1, now=1055)
+
+        buckets = {}
+        self.assertEqual(histogram.merge_into(buckets, timedelta(seconds=10), now=1059), 0.1)
+        self.assertEqual(sum(buckets.values()), 1)
+
+        buckets = {}
+        self.assertEqual(histogram.merge_into(buckets, timedelta(minutes=1), now=1059), 5.0)
+        self.assertEqual(sum(buckets.values()), 2)
+
+        # Old slots are recycled: memory does not grow with time
+        histogram.record(0.2, now=1061)
+        buckets = {}
+        self.assertEqual(histogram.merge_into(buckets, timedelta(minutes=10), now=1061), 0.2)
+        self.assertEqual(sum(buckets.values()), 2)
+
+    def test_totals(self):
+        recorder = LatencyRecorder(histogram_bounds=(1.0, 0.1))
+        recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.1, device_uuid="dev1")
+        recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.5, device_uuid="dev2")
+        recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=2.0, device_uuid="dev1")
+        recorder.record(transport=LatencyTransport.LAN_HTTP, namespace="ns1", latency=0.05, device_uuid="dev1")
+
+        totals = recorder.get_totals()
+        self.assertEqual(set(totals), {(LatencyTransport.MQTT, "ns1"), (LatencyTransport.LAN_HTTP, "ns1")})
+        mqtt = totals[(LatencyTransport.MQTT, "ns1")]
+        # Bounds are sorted and inclusive
+        self.assertEqual(mqtt.bounds, (0.1, 1.0))
+        self.assertEqual(mqtt.cumulative_counts, [1, 2, 3])
+        self.assertEqual(mqtt.count, 3)
+        self.assertAlmostEqual(mqtt.sum, 2.6)
+
+        # Returned totals are snapshots
+        recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.1)
+        self.assertEqual(mqtt.count, 3)
+        self.assertEqual(recorder.get_totals()[(LatencyTransport.MQTT, "ns1")].count, 4)
+
+    def test_idle_keys_are_evicted(self):
+        recorder = LatencyRecorder(slot_seconds=10, slots=6)
+        with mock.patch.object(latency.time, "time", return_value=1000):
+            recorder.record(transport=LatencyTransport.HTTP_API, namespace="https://localhost/v1/Auth/signIn",
+                            latency=0.1)
+            recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.1, device_uuid="dev1")
+        with mock.patch.object(latency.time, "time", return_value=1055):
+            recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.2, device_uuid="dev1")
+            self.assertEqual(len(recorder.keys()), 2)
+        # Keys with no samples within the longest window are discarded, their totals are kept
+        with mock.patch.object(latency.time, "time", return_value=1066):
+            recorder.record(transport=LatencyTransport.MQTT, namespace="ns1", latency=0.3, device_uuid="dev2")
+            self.assertEqual(set(recorder.keys()), {("dev1", "ns1", LatencyTransport.MQTT),
+                                                    ("dev2", "ns1", LatencyTransport.MQTT)})
+            self.assertEqual(recorder.get_stats(device_uuid="dev1", time_window=timedelta(minutes=1)).count, 1)
+        self.assertEqual(recorder.get_totals()[(LatencyTransport.HTTP_API, "https://localhost/v1/Auth/signIn")].count, 1)
@@ -0,0 +1,72 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.manager import MerossManager
+from meross_iot.model.exception import RateLimitExceeded
+from meross_iot.utilities.limiter import ApiRateLimiter, RateLimitPolicy, RateLimitDecision, TokenBucket
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestRateLimiter(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    def _build_manager(self, limiter: ApiRateLimiter) -> MerossManager:
+        return build_offline_manager(rate_limiter=limiter)
+
+    @unittest_run_loop
+    async def test_token_bucket(self):
+        bucket = TokenBucket(rate=2, burst=2, now=0)
+        self.assertEqual(bucket.wait_time(0), 0)
+        bucket.consume(0)
+        bucket.consume(0)
+        self.assertAlmostEqual(bucket.wait_time(0), 0.5)
+        # Reservations put the bucket in debt
+        bucket.consume(0)
+        self.assertAlmostEqual(bucket.wait_time(0), 1.0)
+        self.assertAlmostEqual(bucket.wait_time(1.0), 0)
+        # Refill never exceeds the burst size
+        self.assertEqual(bucket.wait_time(100), 0)
+        self.assertEqual(bucket.tokens, 2)
+
+    @unittest_run_loop
+    async def test_device_and_global_budgets(self):
+        limiter = ApiRateLimiter(global_rate=100, global_burst=3, device_rate=1, device_burst=2,
+                                 over_limit_policy=RateLimitPolicy.DROP)
+        self.assertEqual(limiter.acquire("dev1")[0], RateLimitDecision.SEND)
+        self.assertEqual(limiter.acquire("dev1")[0], RateLimitDecision.SEND)
+        # The device budget is over
+        self.assertEqual(limiter.acquire("dev1")[0], RateLimitDecision.DROP)
+        decision, delay = limiter.acquire("dev1", drop_on_overquota=False)
+        self.assertEqual(decision, RateLimitDecision.DELAY)
+        self.assertGreater(delay, 0.9)
+        # The global budget is over too
+        self.assertEqual(limiter.acquire("dev2")[0], RateLimitDecision.DROP)
+
+        limiter.over_limit_policy = RateLimitPolicy.RAISE
+        self.assertEqual(limiter.acquire("dev2", drop_on_overquota=False)[0], RateLimitDecision.DROP)
+
+    @unittest_run_loop
+    async def test_manager_stats(self):
+        manager = self._build_manager(ApiRateLimiter(global_rate=100, global_burst=100, device_rate=50,
+                                                     device_burst=1, over_limit_policy=RateLimitPolicy.DROP))
+        await manager._async_apply_rate_limit(device_uuid="dev1", method="GET", namespace="ns",
+                                              drop_on_overquota=True)
+        with self.assertRaises(RateLimitExceeded):
+            await manager._async_apply_rate_limit(device_uuid="dev1", method="GET", namespace="ns",
+                                                  drop_on_overquota=True)
+        await manager._async_apply_rate_limit(device_uuid="dev1", method="GET", namespace="ns",
+                                              drop_on_overquota=False)
+
+        self.assertEqual(manager.api_stats.get_dropped_api_stats().global_stats.total_calls, 1)
+        self.assertEqual(manager.api_stats.get_delayed_api_stats().global_stats.total_calls, 1)
+        self.assertEqual(manager.api_stats.get_dropped_api_stats().stats_by_uuid("dev1").total_calls, 1)
+        manager.close()
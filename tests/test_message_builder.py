@@ -0,0 +1,62 @@
+import json
+import unittest
+from hashlib import md5
+
+from meross_iot.utilities.mqtt import MqttMessageBuilder, verify_message_signature
+
+_FROM_TOPIC = "/app/12345-0123456789abcdef0123456789abcdef/subscribe"
+_KEY = "0123456789abcdef"
+
+
+def _legacy_build(method, namespace, payload, destination_device_uuid, message_id, timestamp):
+    signature = md5(("%s%s%s" % (message_id, _KEY, timestamp)).encode("utf8")).hexdigest().lower()
+    data = {
+        "header": {
+            "from": _FROM_TOPIC,
+            "messageId": message_id,
+            "method": method,
+            "namespace": namespace,
+            "payloadVersion": 1,
+            "sign": signature,
+            "timestamp": timestamp,
+            "triggerSrc": "Android",
+            "uuid": destination_device_uuid
+        },
+        "payload": payload,
+    }
+    return json.dumps(data, separators=(',', ':')).encode("utf-8")
+
+
+class TestMessageBuilder(unittest.TestCase):
+    def setUp(self):
+        self.builder = MqttMessageBuilder(from_topic=_FROM_TOPIC, key=_KEY)
+
+    def test_byte_compatibility(self):
+        payloads = [
+            ("GET", "Appliance.System.All", {}),
+            ("SET", "Appliance.Control.ToggleX", {"togglex": {"onoff": 1, "channel": 0}}),
+            ("SET", "Appliance.Control.Light", {"light": {"rgb": 16711680, "luminance": 50.5, "capacity": 5}}),
+            ("GET", "Appliance.Hub.Mts100.All", {"all": [{"id": "01008BB8"}]}),
+            ("SET", "Appliance.Control.Spray", {"spray": {"name": "Nöel", "mode": None}}),
+        ]
+        for method, namespace, payload in payloads:
+            expected = _legacy_build(method, namespace, payload, "2008141234567890123448e1e900abcd",
+                                     "fd3a41ba4bc1b6a6b6b0b0e8dfd1d3e1", 1600000000)
+            message, message_id = self.builder.build(method=method, namespace=namespace, payload=payload,
+                                                     destination_device_uuid="2008141234567890123448e1e900abcd",
+                                                     message_id="fd3a41ba4bc1b6a6b6b0b0e8dfd1d3e1",
+                                                     timestamp=1600000000)
+            self.assertEqual(message, expected)
+            self.assertEqual(message_id, "fd3a41ba4bc1b6a6b6b0b0e8dfd1d3e1")
+
+    def test_random_message_id_and_signature(self):
+        message, message_id = self.builder.build(method="GET", namespace="Appliance.System.All", payload={},
+                                                 destination_device_uuid="2008141234567890123448e1e900abcd")
+        header = json.loads(message)["header"]
+        self.assertEqual(len(message_id), 32)
+        self.assertEqual(message_id, message_id.lower())
+        self.assertEqual(header["messageId"], message_id)
+        self.assertTrue(verify_message_signature(header, _KEY))
+        _, other_id = self.builder.build(method="GET", namespace="Appliance.System.All", payload={},
+                                         destination_device_uuid="2008141234567890123448e1e900abcd")
+        self.assertNotEqual(message_id, other_id)
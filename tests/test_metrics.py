@@ -0,0 +1,97 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.model.http.error_codes import ErrorCodes
+from meross_iot.utilities.latency import LatencyTransport
+from meross_iot.utilities.metrics import OpenMetricsExporter
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestMetricsExporter(AioHTTPTestCase):
+    async def get_application(self):
+        self.manager = build_offline_manager()
+        self.http_client = self.manager._http_client
+        self.exporter = OpenMetricsExporter(manager=self.manager, http_client=self.http_client)
+        app = web.Application()
+        app.router.add_get("/metrics", self.exporter.handle_metrics)
+        return app
+
+    async def tearDownAsync(self):
+        self.manager.close()
+
+    def _populate(self):
+        self.manager.api_stats.notify_api_call(device_uuid="dev1", namespace="Appliance.System.All", method="GET")
+        self.manager.api_stats.notify_api_call(device_uuid="dev2", namespace="Appliance.System.All", method="GET")
+        self.manager.api_stats.notify_dropped_call(device_uuid="dev2", namespace="Appliance.Control.Toggle",
+                                                   method="SET")
+        self.manager.error_budget.notify_error("dev1")
+        self.http_client.stats.notify_http_request(request_url="https://localhost/v1/Device/devList", method="POST",
+                                                   http_response_code=200,
+                                                   api_response_code=ErrorCodes.CODE_NO_ERROR)
+
+    @unittest_run_loop
+    async def test_render(self):
+        self._populate()
+        text = self.exporter.render()
+        self.assertIn('meross_api_calls_total{method="GET",namespace="Appliance.System.All"} 2', text)
+        self.assertIn('meross_api_dropped_calls_total{method="SET",namespace="Appliance.Control.Toggle"} 1', text)
+        self.assertIn("# TYPE meross_api_calls_total counter", text)
+        self.assertIn("meross_pending_commands 0", text)
+        self.assertIn('meross_lan_error_budget_remaining{device_uuid="dev1"} 0', text)
+        self.assertIn("meross_lan_error_budget_max 1", text)
+        self.assertIn('meross_http_requests_total{url="https://localhost/v1/Device/devList",http_code="200",'
+                      'api_code="CODE_NO_ERROR"} 1', text)
+        self.assertFalse(text.rstrip().endswith("# EOF"))
+
+        # Label sets are cached, values are not
+        self.manager.api_stats.notify_api_call(device_uuid="dev1", namespace="Appliance.System.All", method="GET")
+        self.assertIn('meross_api_calls_total{method="GET",namespace="Appliance.System.All"} 3',
+                      self.exporter.render())
+
+    @unittest_run_loop
+    async def test_latency_histograms(self):
+        for latency in (0.004, 0.03, 0.03, 0.2, 45.0):
+            self.manager.latency_stats.record(transport=LatencyTransport.MQTT, namespace="Appliance.System.All",
+                                              latency=latency, device_uuid="dev1")
+        self.manager.latency_stats.record(transport=LatencyTransport.MQTT, namespace="Appliance.System.All",
+                                          latency=0.01, device_uuid="dev2")
+        text = self.exporter.render()
+        self.assertIn("# TYPE meross_command_latency_seconds histogram", text)
+        labels = 'transport="MQTT",namespace="Appliance.System.All"'
+        lines = [line for line in text.splitlines() if line.startswith("meross_command_latency_seconds")]
+        buckets = [line for line in lines if line.startswith("meross_command_latency_seconds_bucket")]
+        self.assertEqual(buckets, [
+            "meross_command_latency_seconds_bucket{%s,le=\"%s\"} %d" % (labels, le, count)
+            for le, count in (("0.005", 1), ("0.01", 2), ("0.025", 2), ("0.05", 4), ("0.1", 4), ("0.25", 5),
+                              ("0.5", 5), ("1.0", 5), ("2.5", 5), ("5.0", 5), ("10.0", 5), ("30.0", 5),
+                              ("+Inf", 6))])
+        self.assertIn("meross_command_latency_seconds_count{%s} 6" % labels, lines)
+        sum_line = [line for line in lines if line.startswith("meross_command_latency_seconds_sum")][0]
+        self.assertAlmostEqual(float(sum_line.split(" ")[1]), 45.274)
+
+        # Histograms are cumulative, regardless of the latency time window
+        self.manager.latency_stats.record(transport=LatencyTransport.MQTT, namespace="Appliance.System.All",
+                                          latency=0.01, device_uuid="dev1")
+        self.assertIn("meross_command_latency_seconds_count{%s} 7" % labels, self.exporter.render())
+
+    @unittest_run_loop
+    async def test_endpoint(self):
+        self._populate()
+        resp = await self.client.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+        self.assertEqual(resp.status, 200)
+        self.assertTrue(resp.headers["Content-Type"].startswith("application/openmetrics-text"))
+        text = await resp.text()
+        self.assertIn("# TYPE meross_api_calls counter", text)
+        self.assertIn("# TYPE meross_command_latency_seconds histogram", text)
+        self.assertTrue(text.rstrip().endswith("# EOF"))
+
+        resp = await self.client.get("/metrics")
+        self.assertTrue(resp.headers["Content-Type"].startswith("text/plain"))
@@ -0,0 +1,110 @@
+import os
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.model.enums import Namespace
+from meross_iot.model.exception import CommandError
+from meross_iot.utilities.mqtt import MqttMessageBuilder, build_client_response_topic
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_KEY = "key"
+_DEVICE_UUID = "2008141234567890123448e1e900abcd"
+_DEVICE_TOPIC = f"/appliance/{_DEVICE_UUID}/publish"
+
+
+class TestInboundRouting(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.manager = build_offline_manager(key=_KEY)
+        self.response_topic = self.manager._client_response_topic
+        self.manager._register_inbound_routes(self.response_topic)
+
+    async def tearDownAsync(self):
+        self.manager.close()
+
+    def _receive(self, topic: str, method: str, namespace: str = Namespace.CONTROL_TOGGLEX.value,
+                 payload: dict = None, message_id: str = None, key: str = _KEY) -> str:
+        # Messages sent by the device, either as ACKs or as push notifications
+        builder = MqttMessageBuilder(from_topic=_DEVICE_TOPIC, key=key)
+        message, message_id = builder.build(method=method, namespace=namespace, payload=payload or {},
+                                            destination_device_uuid=_DEVICE_UUID, message_id=message_id)
+        self.manager._on_message(None, None, SimpleNamespace(topic=topic, payload=message))
+        return message_id
+
+    def _register_pending(self, message_id: str) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self.manager._pending_commands.register(message_id, future, _DEVICE_UUID, Namespace.CONTROL_TOGGLEX.value)
+        return future
+
+    @unittest_run_loop
+    async def test_command_acks(self):
+        future = self._register_pending("ack")
+        self._receive(self.response_topic, "SETACK", message_id="ack")
+        response = await asyncio.wait_for(future, timeout=1)
+        self.assertEqual(response["header"]["messageId"], "ack")
+
+        future = self._register_pending("error")
+        self._receive(self.response_topic, "ERROR", payload={"error": {"code": 5000}}, message_id="error")
+        with self.assertRaises(CommandError):
+            await asyncio.wait_for(future, timeout=1)
+
+        # ACKs nobody is waiting for are discarded
+        with self.assertLogs("meross_iot.manager", level="DEBUG") as logs:
+            self._receive(self.response_topic, "GETACK", message_id="unknown")
+        self.assertTrue(any("No pending command" in line for line in logs.output))
+
+    @unittest_run_loop
+    async def test_push_notifications(self):
+        self._receive(self.manager._user_topic, "PUSH", payload={"togglex": [{"channel": 0, "onoff": 1}]})
+        await asyncio.sleep(0)
+        await self.manager.async_wait_push_dispatch()
+        self.assertEqual(self.manager.push_notification_stats, {Namespace.CONTROL_TOGGLEX.value: 1})
+
+    @unittest_run_loop
+    async def test_unrouted_messages(self):
+        future = self._register_pending("misrouted")
+        # Commands sent to devices, ACKs on the push topic and pushes on the response topic are not handled
+        for topic, method in ((f"/appliance/{_DEVICE_UUID}/subscribe", "SET"),
+                              (self.manager._user_topic, "SETACK"),
+                              (self.response_topic, "PUSH")):
+            with self.assertLogs("meross_iot.manager", level="WARNING") as logs:
+                self._receive(topic, method, message_id="misrouted")
+            self.assertIn("does not handle messages", logs.output[0])
+        await asyncio.sleep(0)
+        self.assertFalse(future.done())
+        self.assertEqual(self.manager.push_notification_stats, {})
+
+    @unittest_run_loop
+    async def test_invalid_signature(self):
+        future = self._register_pending("forged")
+        with self.assertLogs("meross_iot.manager", level="ERROR") as logs:
+            self._receive(self.response_topic, "SETACK", message_id="forged", key="another-key")
+        self.assertIn("Invalid signature", logs.output[0])
+        await asyncio.sleep(0)
+        self.assertFalse(future.done())
+
+    @unittest_run_loop
+    async def test_routes_of_pooled_connections(self):
+        # Every pooled connection receives its ACKs on its own response topic
+        other_topic = build_client_response_topic(user_id="1234", app_id="other")
+        self.manager._register_inbound_routes(other_topic)
+        first = self._register_pending("first")
+        second = self._register_pending("second")
+        self._receive(self.response_topic, "GETACK", message_id="first")
+        self._receive(other_topic, "GETACK", message_id="second")
+        await asyncio.wait_for(asyncio.gather(first, second), timeout=1)
+
+        # Malformed messages are not routed at all
+        with self.assertRaises(KeyError):
+            self.manager._on_message(None, None, SimpleNamespace(topic=self.response_topic, payload=b'{"payload":{}}'))
@@ -0,0 +1,61 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.model.exception import TooManyPendingCommandsError
+from meross_iot.utilities.pending import PendingCommandTable
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestPendingCommands(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    @unittest_run_loop
+    async def test_ack_removes_entry(self):
+        table = PendingCommandTable(max_pending=10)
+        fut = asyncio.get_event_loop().create_future()
+        table.register(message_id="m1", future=fut, device_uuid="dev1", namespace="Appliance.System.All")
+        self.assertEqual(len(table), 1)
+        self.assertIs(table.pop("m1").future, fut)
+        table.discard("m1")
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.total_late_responses, 0)
+
+    @unittest_run_loop
+    async def test_late_response_accounting(self):
+        table = PendingCommandTable(max_pending=10)
+        fut = asyncio.get_event_loop().create_future()
+        table.register(message_id="m1", future=fut, device_uuid="dev1", namespace="Appliance.System.All")
+
+        # The caller gives up (timeout or cancellation)
+        table.discard("m1")
+        self.assertEqual(len(table), 0)
+
+        # ... then the ACK arrives
+        self.assertIsNone(table.pop("m1"))
+        self.assertEqual(table.late_responses(), {("dev1", "Appliance.System.All"): 1})
+        self.assertEqual(table.late_responses_by_device("dev1"), [("Appliance.System.All", 1)])
+
+        # Duplicated/unknown ACKs are not accounted twice
+        self.assertIsNone(table.pop("m1"))
+        self.assertIsNone(table.pop("unknown"))
+        self.assertEqual(table.total_late_responses, 1)
+
+    @unittest_run_loop
+    async def test_hard_cap(self):
+        table = PendingCommandTable(max_pending=2)
+        loop = asyncio.get_event_loop()
+        table.register(message_id="m1", future=loop.create_future(), device_uuid="dev1", namespace="ns")
+        table.register(message_id="m2", future=loop.create_future(), device_uuid="dev1", namespace="ns")
+        with self.assertRaises(TooManyPendingCommandsError):
+            table.register(message_id="m3", future=loop.create_future(), device_uuid="dev1", namespace="ns")
+
+        table.cancel_all()
+        self.assertEqual(len(table), 0)
@@ -0,0 +1,50 @@
+import unittest
+
+import paho.mqtt.client as mqtt
+
+from meross_iot.utilities.mqtt import MqttMessageBuilder, build_client_response_topic
+from meross_iot.utilities.pool import MqttConnection, MqttConnectionPool
+
+_BROKER = "mqtt.example.com:443"
+
+
+def _build_pool(size: int) -> MqttConnectionPool:
+    connections = []
+    for index in range(size):
+        app_id = f"app{index}"
+        response_topic = build_client_response_topic(user_id="1234", app_id=app_id)
+        connections.append(MqttConnection(broker=_BROKER,
+                                          index=index,
+                                          client=mqtt.Client(client_id=f"app:{app_id}"),
+                                          app_id=app_id,
+                                          client_id=f"app:{app_id}",
+                                          response_topic=response_topic,
+                                          message_builder=MqttMessageBuilder(from_topic=response_topic, key="key")))
+    return MqttConnectionPool(broker=_BROKER, connections=connections)
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_sharding_is_stable(self):
+        pool = _build_pool(4)
+        uuids = [f"2008141234567890123448e1e9{i:06d}" for i in range(1000)]
+        first = [pool.connection_for(uuid).index for uuid in uuids]
+        self.assertEqual(first, [_build_pool(4).connection_for(uuid).index for uuid in uuids])
+        # Every connection gets a share of the devices
+        self.assertEqual(set(first), {0, 1, 2, 3})
+
+    def test_single_connection(self):
+        pool = _build_pool(1)
+        self.assertIs(pool.connection_for("abcd"), pool.push_connection)
+        self.assertIs(pool.connection_for(None), pool.push_connection)
+        self.assertTrue(pool.push_connection.receives_push_notifications)
+
+    def test_stats(self):
+        pool = _build_pool(2)
+        pool.connections[1].in_flight = 3
+        pool.connections[1].sent = 10
+        stats = pool.stats()
+        self.assertEqual([s.index for s in stats], [0, 1])
+        self.assertEqual(stats[1].in_flight, 3)
+        self.assertEqual(stats[1].sent, 10)
+        self.assertFalse(stats[1].connected)
+        self.assertEqual(stats[1].client_id, "app:app1")
@@ -0,0 +1,176 @@
+import functools
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.controller.device import BaseDevice, HubDevice, GenericSubDevice
+from meross_iot.controller.mixins.toggle import ToggleXMixin
+from meross_iot.device_factory import build_meross_device_from_abilities, build_meross_subdevice
+from meross_iot.model.enums import Namespace, OnlineStatus
+from meross_iot.model.http.subdevice import HttpSubdeviceInfo
+from meross_iot.model.push.unbind import UnbindPushNotification
+from tests import build_http_device_info, build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_PLUG_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                   Namespace.CONTROL_TOGGLEX.value: {}}
+_HUB_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                  Namespace.SYSTEM_DIGEST_HUB.value: {}}
+
+
+_http_info = functools.partial(build_http_device_info, hardware_version="registry")
+
+
+class TestDeviceRegistry(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.manager = build_offline_manager()
+        self.registry = self.manager._device_registry
+        for i in range(10):
+            plug = build_meross_device_from_abilities(http_device_info=_http_info(f"plug{i}", "mss310"),
+                                                      device_abilities=_PLUG_ABILITIES, manager=self.manager)
+            self.registry.enroll_device(plug)
+        self.hub = build_meross_device_from_abilities(http_device_info=_http_info("hub", "msh300"),
+                                                      device_abilities=_HUB_ABILITIES, manager=self.manager)
+        self.registry.enroll_device(self.hub)
+        self.subdevice = build_meross_subdevice(
+            http_subdevice_info=HttpSubdeviceInfo(sub_device_id="sub1", true_id="sub1", sub_device_type="ms100",
+                                                  sub_device_vendor="meross", sub_device_name="Sensor",
+                                                  sub_device_icon_id="icon"),
+            hub_uuid="hub", hub_reported_abilities={}, manager=self.manager)
+        self.registry.enroll_device(self.subdevice)
+
+    async def tearDownAsync(self):
+        self.manager.close()
+
+    @unittest_run_loop
+    async def test_lookups(self):
+        self.assertIs(self.registry.lookup_base_by_uuid("hub"), self.hub)
+        self.assertIsNone(self.registry.lookup_base_by_uuid("unknown"))
+        self.assertEqual(self.registry.find_all_by(device_uuids=("hub",)), [self.hub, self.subdevice])
+        self.assertEqual(self.registry.find_all_by(device_uuids=("hub",), exclude_classes=(GenericSubDevice,)),
+                         [self.hub])
+        self.assertEqual(len(self.registry.find_all_by(device_type="mss310")), 10)
+        self.assertEqual(len(self.registry.find_all_by(device_class=ToggleXMixin)), 10)
+        self.assertEqual(self.registry.find_all_by(device_class=HubDevice), [self.hub])
+        # Devices matching more than one class are reported once, in enrollment order
+        devices = self.registry.find_all_by(device_class=(BaseDevice, ToggleXMixin))
+        self.assertEqual(len(devices), 12)
+        self.assertEqual(devices, self.registry.find_all_by())
+        self.assertEqual([d.uuid for d in self.registry.find_all_by(device_type="mss310", device_name="plug3")],
+                         ["plug3"])
+        self.assertEqual(len(self.registry.find_all_by(internal_ids=("#BASE:plug1", "#BASE:missing"))), 1)
+
+    @unittest_run_loop
+    async def test_single_uuid_string(self):
+        self.assertEqual(self.registry.find_all_by(device_uuids="hub"), [self.hub, self.subdevice])
+        self.assertEqual(self.registry.find_all_by(internal_ids="#BASE:plug1"),
+                         [self.registry.lookup_base_by_uuid("plug1")])
+
+    @unittest_run_loop
+    async def test_unbind_push_relinquishes_devices(self):
+        await self.manager._handle_and_dispatch_push_notification(
+            UnbindPushNotification(originating_device_uuid="hub", raw_data={}))
+        self.assertEqual(self.registry.find_all_by(device_uuids=("hub",)), [])
+        self.assertIsNone(self.registry.lookup_base_by_uuid("hub"))
+        self.assertEqual(len(self.registry.find_all_by()), 10)
+
+    @unittest_run_loop
+    async def test_online_status_index(self):
+        self.assertEqual(len(self.registry.find_all_by(online_status=OnlineStatus.ONLINE)), 11)
+        # Subdevices did not report their status yet
+        self.assertEqual(self.registry.find_all_by(online_status=OnlineStatus.UNKNOWN), [self.subdevice])
+
+        plug = self.registry.lookup_base_by_uuid("plug0")
+        await plug.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
+                                                  data={'online': {'status': OnlineStatus.OFFLINE.value}})
+        self.assertEqual(self.registry.find_all_by(online_status=OnlineStatus.OFFLINE), [plug])
+
+        # Subdevices follow the online status of their hub
+        await self.hub.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
+                                                      data={'online': {'status': OnlineStatus.OFFLINE.value}})
+        self.assertEqual(self.registry.find_all_by(online_status=OnlineStatus.OFFLINE),
+                         [plug, self.hub, self.subdevice])
+        self.assertEqual(len(self.registry.find_all_by(online_status=OnlineStatus.ONLINE)), 9)
+
+        await self.hub.update_from_http_state(_http_info("hub", "msh300", online_status=OnlineStatus.ONLINE))
+        self.assertEqual(len(self.registry.find_all_by(online_status=OnlineStatus.ONLINE)), 10)
+        self.assertEqual(self.registry.find_all_by(online_status=OnlineStatus.UNKNOWN), [self.subdevice])
+
+    @unittest_run_loop
+    async def test_relinquish(self):
+        self.registry.relinquish_device(self.subdevice.internal_id)
+        self.registry.relinquish_device("#BASE:plug0")
+        self.assertEqual(self.registry.find_all_by(device_uuids=("hub",)), [self.hub])
+        self.assertIsNone(self.registry.lookup_base_by_uuid("plug0"))
+        self.assertEqual(len(self.registry.find_all_by(device_class=ToggleXMixin)), 9)
+        self.assertEqual(len(self.registry.find_all_by(online_status=OnlineStatus.ONLINE)), 10)
+        self.assertEqual(self.registry.find_all_by(online_status=OnlineStatus.UNKNOWN), [])
+
+        self.registry.clear()
+        self.assertEqual(self.registry.find_all_by(), [])
+        self.assertEqual(self.registry.find_all_by(device_class=BaseDevice), [])
+
+    @unittest_run_loop
+    async def test_live_view(self):
+        added = []
+        removed = []
+        view = self.manager.create_view(device_class=ToggleXMixin, online_status=OnlineStatus.ONLINE)
+        view.register_added_callback(added.append)
+        view.register_removed_callback(removed.append)
+        self.assertEqual(len(view), 10)
+
+        plug = self.registry.lookup_base_by_uuid("plug0")
+        await plug.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
+                                                  data={'online': {'status': OnlineStatus.OFFLINE.value}})
+        self.assertNotIn(plug, view)
+        self.assertEqual(removed, [plug])
+
+        await plug.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
+                                                  data={'online': {'status': OnlineStatus.ONLINE.value}})
+        self.assertIn(plug, view)
+        self.assertEqual(added, [plug])
+
+        new_plug = build_meross_device_from_abilities(http_device_info=_http_info("plug10", "mss310"),
+                                                      device_abilities=_PLUG_ABILITIES, manager=self.manager)
+        self.registry.enroll_device(new_plug)
+        self.assertEqual(added, [plug, new_plug])
+        self.assertEqual(len(view), 11)
+
+        # Devices not matching the filters do not affect the view
+        await self.hub.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
+                                                      data={'online': {'status': OnlineStatus.OFFLINE.value}})
+        self.assertEqual(len(removed), 1)
+
+        self.registry.relinquish_device(new_plug.internal_id)
+        self.assertEqual(removed, [plug, new_plug])
+        self.assertCountEqual(view.devices, self.manager.find_devices(device_class=ToggleXMixin,
+                                                                      online_status=OnlineStatus.ONLINE))
+
+        view.close()
+        self.registry.relinquish_device("#BASE:plug1")
+        self.assertEqual(len(view), 10)
+
+    @unittest_run_loop
+    async def test_coroutine_view_callback(self):
+        added = asyncio.Event()
+
+        async def on_added(device):
+            added.set()
+
+        view = self.manager.create_view(online_status=OnlineStatus.OFFLINE)
+        view.register_added_callback(on_added)
+        await self.hub.async_handle_push_notification(namespace=Namespace.SYSTEM_ONLINE,
+                                                      data={'online': {'status': OnlineStatus.OFFLINE.value}})
+        await asyncio.wait_for(added.wait(), timeout=1)
+        # The subdevice follows its hub
+        self.assertEqual(view.devices, [self.hub, self.subdevice])
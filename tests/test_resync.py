@@ -0,0 +1,67 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.utilities.resync import DeviceResyncJob
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class TestDeviceResync(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    @unittest_run_loop
+    async def test_bounded_concurrency(self):
+        in_flight = 0
+        max_in_flight = 0
+        refreshed = []
+
+        async def refresh(uuid):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            refreshed.append(uuid)
+            if uuid == "dev3":
+                raise Exception("Refresh failed")
+
+        refreshes = [(f"dev{i}", lambda i=i: refresh(f"dev{i}")) for i in range(20)]
+        job = DeviceResyncJob(max_concurrency=5)
+        job.start(job.async_refresh(refreshes))
+        progress = await job
+
+        self.assertEqual(max_in_flight, 5)
+        self.assertEqual(progress.total, 20)
+        self.assertEqual(progress.completed, 20)
+        self.assertEqual(progress.failed, 1)
+        self.assertTrue(progress.done)
+        self.assertFalse(progress.cancelled)
+        # Devices are refreshed in the given order
+        self.assertEqual(refreshed[:5], [f"dev{i}" for i in range(5)])
+
+    @unittest_run_loop
+    async def test_cancel(self):
+        async def refresh():
+            await asyncio.sleep(10)
+
+        job = DeviceResyncJob(max_concurrency=2)
+        job.start(job.async_refresh([(f"dev{i}", refresh) for i in range(10)]))
+        await asyncio.sleep(0.01)
+        self.assertFalse(job.done)
+        self.assertEqual(job.progress.total, 10)
+
+        job.cancel()
+        progress = await asyncio.wait_for(job.async_wait(), timeout=1)
+        self.assertTrue(progress.cancelled)
+        self.assertEqual(progress.completed, 0)
+        # Workers do not survive the job
+        await asyncio.sleep(0)
+        self.assertEqual(len([t for t in asyncio.all_tasks() if t is not asyncio.current_task()
+                              and "refresh" in repr(t)]), 0)
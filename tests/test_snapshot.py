@@ -0,0 +1,183 @@
+import functools
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.controller.device import HubDevice
+from meross_iot.controller.mixins.light import LightMixin
+from meross_iot.controller.mixins.thermostat import ThermostatState
+from meross_iot.controller.mixins.toggle import ToggleXMixin
+from meross_iot.controller.subdevice import Ms100Sensor
+from meross_iot.device_factory import build_meross_device_from_abilities
+from meross_iot.manager import MerossManager
+from meross_iot.model.enums import Namespace, OnlineStatus
+from meross_iot.model.http.subdevice import HttpSubdeviceInfo
+from meross_iot.model.plugin.light import LightInfo
+from meross_iot.utilities import snapshot
+from meross_iot.utilities.snapshot import decode_value, encode_value
+from tests import build_http_device_info, build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+_BULB_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                   Namespace.CONTROL_TOGGLEX.value: {}, Namespace.CONTROL_LIGHT.value: {"capacity": 7}}
+_HUB_ABILITIES = {Namespace.SYSTEM_ALL.value: {}, Namespace.SYSTEM_ONLINE.value: {},
+                  Namespace.SYSTEM_DIGEST_HUB.value: {}}
+
+
+_http_info = functools.partial(build_http_device_info, hardware_version="snapshot", channels=[{}],
+                               bind_time=datetime(2020, 1, 1))
+
+
+class TestRegistrySnapshot(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "registry.snapshot")
+        self.managers = []
+
+    async def tearDownAsync(self):
+        for m in self.managers:
+            m.close()
+        shutil.rmtree(self.directory)
+
+    def _new_manager(self) -> MerossManager:
+        manager = build_offline_manager()
+        self.managers.append(manager)
+        return manager
+
+    async def _populate(self, manager: MerossManager) -> None:
+        bulb = build_meross_device_from_abilities(http_device_info=_http_info("bulb", "snapshot-bulb"),
+                                                  device_abilities=_BULB_ABILITIES, manager=manager)
+        manager._device_registry.enroll_device(bulb)
+        await bulb.async_handle_update(namespace=Namespace.SYSTEM_ALL, data={"all": {
+            "system": {"firmware": {"innerIp": "192.168.1.10"}, "hardware": {"macAddress": "aa:bb:cc:dd:ee:ff"},
+                       "online": {"status": 1}},
+            "digest": {"togglex": [{"channel": 0, "onoff": 1}],
+                       "light": {"channel": 0, "rgb": 0xFF0000, "luminance": 50, "capacity": 1, "onoff": 1}}}})
+
+        hub = build_meross_device_from_abilities(http_device_info=_http_info("hub", "snapshot-hub"),
+                                                 device_abilities=_HUB_ABILITIES, manager=manager)
+        manager._device_registry.enroll_device(hub)
+        sensor = await manager._async_enroll_new_http_subdev(
+            subdevice_info=HttpSubdeviceInfo(sub_device_id="sensor", true_id="sensor", sub_device_type="ms100",
+                                             sub_device_vendor="meross", sub_device_name="Sensor",
+                                             sub_device_icon_id="icon"),
+            hub=hub, hub_reported_abilities=hub.abilities)
+        await sensor.async_handle_subdevice_notification(namespace=Namespace.HUB_SENSOR_ALL, data={
+            "id": "sensor", "online": {"status": 1}, "temperature": {"latest": 215}, "humidity": {"latest": 480}})
+
+    def test_value_encoding(self):
+        value = {0: (255, 0, 0), "mode": OnlineStatus.ONLINE, "samples": [{"at": datetime(2021, 5, 1)}]}
+        encoded = encode_value(value)
+        self.assertEqual(decode_value(json.loads(json.dumps(encoded))), value)
+        light = decode_value(json.loads(json.dumps(encode_value(LightInfo(rgb=0x00FF00, luminance=30, onoff=1)))))
+        self.assertIsInstance(light, LightInfo)
+        self.assertEqual((light.rgb_tuple, light.luminance, light.is_on), ((0, 255, 0), 30, True))
+        thermostat = decode_value(encode_value(ThermostatState({"onoff": 1, "mode": 2})))
+        self.assertTrue(thermostat.is_on)
+
+        # Only the allowed state types are rebuilt
+        for encoded in ({"__object__": "os:_wrap_close", "state": {}},
+                        {"__object__": "meross_iot.model.credentials:MerossCloudCreds", "state": {}},
+                        {"__enum__": "meross_iot.utilities.latency:LatencyTransport", "value": "MQTT"}):
+            with self.assertRaises(ValueError):
+                decode_value(encoded)
+        with self.assertRaises(TypeError):
+            encode_value(HttpSubdeviceInfo(sub_device_id="sensor", true_id=None, sub_device_type="ms100",
+                                           sub_device_vendor=None, sub_device_name="Sensor", sub_device_icon_id=None))
+
+    @unittest_run_loop
+    async def test_warm_start(self):
+        manager = self._new_manager()
+        await self._populate(manager)
+        bulb = manager.find_devices(device_uuids=("bulb",))[0]
+        reported_at = bulb.state_timestamps["_channel_togglex_status"]
+        await manager.async_dump_device_registry(self.path)
+        with open(self.path, "rb") as f:
+            self.assertEqual(json.loads(gzip.decompress(f.read()))["version"], 1)
+        self.assertEqual(os.listdir(self.directory), ["registry.snapshot"])
+
+        # The synchronous dump is written before returning, keeping the permissions of the replaced file
+        os.chmod(self.path, 0o644)
+        manager.dump_device_registry(self.path)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+        self.assertEqual(os.listdir(self.directory), ["registry.snapshot"])
+        restarted = self._new_manager()
+        restarted.load_devices_from_dump(self.path)
+        self.assertEqual(len(restarted.find_devices()), 3)
+        bulb = restarted.find_devices(device_uuids=("bulb",), device_class=LightMixin)[0]
+        self.assertEqual(bulb.lan_ip, "192.168.1.10")
+        self.assertTrue(bulb.is_on(channel=0))
+        self.assertEqual(bulb.get_rgb_color(channel=0), (255, 0, 0))
+        self.assertEqual(bulb.state_timestamps["_channel_togglex_status"], reported_at)
+        self.assertTrue(bulb.is_state_stale)
+
+        # Fields are confirmed one by one, as the device reports them
+        await bulb.async_handle_push_notification(namespace=Namespace.CONTROL_TOGGLEX,
+                                                  data={"togglex": {"channel": 0, "onoff": 0}})
+        self.assertFalse(bulb.is_on(channel=0))
+        self.assertNotIn("_channel_togglex_status", bulb.stale_state_fields)
+        self.assertIn("_inner_ip", bulb.stale_state_fields)
+        self.assertGreaterEqual(bulb.state_timestamps["_channel_togglex_status"], reported_at)
+
+        hub = restarted.find_devices(device_class=HubDevice)[0]
+        sensor = hub.get_subdevice("sensor")
+        self.assertIsInstance(sensor, Ms100Sensor)
+        info = sensor.cached_http_subdevice_info
+        self.assertEqual((info.true_id, info.sub_device_vendor, info.sub_device_icon_id), ("sensor", "meross", "icon"))
+        self.assertIn(sensor, restarted.find_devices())
+        self.assertEqual(sensor.last_sampled_temperature, 21.5)
+        self.assertEqual(sensor.online_status, OnlineStatus.ONLINE)
+        self.assertTrue(sensor.is_state_stale)
+
+    @unittest_run_loop
+    async def test_close_waits_for_pending_dumps(self):
+        manager = self._new_manager()
+        await self._populate(manager)
+
+        def slow_write(filename, raw):
+            time.sleep(0.3)
+            snapshot.write_snapshot(filename, raw)
+
+        with mock.patch("meross_iot.manager.write_snapshot", slow_write):
+            dump = asyncio.ensure_future(manager.async_dump_device_registry(self.path))
+            await asyncio.sleep(0)
+            manager.close()
+        self.assertTrue(os.path.exists(self.path))
+        await dump
+        # New snapshots get the permissions granted by the umask
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o666 & ~umask)
+        restarted = self._new_manager()
+        restarted.load_devices_from_dump(self.path)
+        self.assertEqual(len(restarted.find_devices()), 3)
+
+    @unittest_run_loop
+    async def test_legacy_dump(self):
+        with open(self.path, "wt") as f:
+            json.dump([{"abilities": _BULB_ABILITIES,
+                        "info": {"uuid": "bulb", "onlineStatus": 1, "devName": "bulb", "deviceType": "snapshot-bulb",
+                                 "channels": [{}], "fmwareVersion": "1.0.0", "hdwareVersion": "snapshot",
+                                 "domain": "mqtt-eu.meross.com", "reservedDomain": "mqtt-eu.meross.com"}}], f)
+        manager = self._new_manager()
+        manager.load_devices_from_dump(self.path)
+        bulb = manager.find_devices()[0]
+        self.assertIsInstance(bulb, ToggleXMixin)
+        self.assertFalse(bulb.is_state_stale)
@@ -0,0 +1,93 @@
+import unittest
+from datetime import timedelta
+
+from meross_iot.model.http.error_codes import ErrorCodes
+from meross_iot.utilities.stats import ApiCounter, HttpStatsCounter, TimeBucketedCounter
+
+
+class TestWindowedStats(unittest.TestCase):
+    def test_bucketed_counter_window(self):
+        counter = TimeBucketedCounter(bucket_seconds=1, buckets=60)
+        counter.increment("a", timestamp=1000.2)
+        counter.increment("a", timestamp=1000.7)
+        counter.increment("b", timestamp=1030)
+
+        buckets = list(counter.iter_window(timedelta(seconds=10), timestamp=1030.5))
+        self.assertEqual(buckets, [{"b": 1}])
+        buckets = list(counter.iter_window(timedelta(minutes=1), timestamp=1030.5))
+        self.assertEqual(buckets, [{"a": 2}, {"b": 1}])
+
+        # Expired buckets are recycled and never reported
+        counter.increment("c", timestamp=1060)
+        buckets = list(counter.iter_window(timedelta(hours=1), timestamp=1060))
+        self.assertEqual(buckets, [{"b": 1}, {"c": 1}])
+        self.assertEqual(counter.max_time_window, timedelta(minutes=1))
+
+    def test_api_counter(self):
+        counter = ApiCounter()
+        for _ in range(5):
+            counter.notify_api_call(device_uuid="dev1", namespace="Appliance.System.All", method="GET")
+        counter.notify_api_call(device_uuid="dev2", namespace="Appliance.Control.Toggle", method="SET")
+        counter.notify_dropped_call(device_uuid="dev2", namespace="Appliance.Control.Toggle", method="SET")
+
+        stats = counter.get_api_stats()
+        self.assertEqual(stats.global_stats.total_calls, 6)
+        self.assertEqual(stats.stats_by_uuid("dev1").total_calls, 5)
+        self.assertEqual(dict(stats.stats_by_uuid("dev1").by_method_namespace()), {"GET Appliance.System.All": 5})
+        self.assertEqual(counter.get_dropped_api_stats().global_stats.total_calls, 1)
+        self.assertEqual(counter.get_delayed_api_stats().global_stats.total_calls, 0)
+        self.assertIn("dev1", repr(stats))
+
+    def test_http_counter(self):
+        counter = HttpStatsCounter()
+        counter.notify_http_request(request_url="/v1/Auth/signIn", method="POST", http_response_code=200,
+                                    api_response_code=ErrorCodes.CODE_NO_ERROR)
+        counter.notify_http_request(request_url="/v1/Device/devList", method="POST", http_response_code=200,
+                                    api_response_code=ErrorCodes.CODE_NO_ERROR)
+        counter.notify_http_request(request_url="/v1/Device/devList", method="POST", http_response_code=500,
+                                    api_response_code=None)
+
+        stats = counter.get_stats()
+        self.assertEqual(stats.global_stats.total_calls, 3)
+        self.assertEqual(stats.stats_by_url("/v1/Device/devList").total_calls, 2)
+        self.assertEqual(dict(stats.global_stats.by_http_reponse_code()), {200: 2, 500: 1})
+        self.assertIn("/v1/Device/devList", repr(stats))
+
+    def test_max_samples(self):
+        counter = TimeBucketedCounter(bucket_seconds=1, buckets=60)
+        for ts in (1000, 1000, 1010, 1020, 1020):
+            counter.increment("a", timestamp=ts)
+        counter.increment("b", timestamp=1020)
+        buckets = list(counter.iter_timed_window(timedelta(minutes=1), timestamp=1020, max_samples=4))
+        # Only the most recent samples are reported, the oldest bucket is truncated
+        self.assertEqual(buckets, [(1010.0, {"a": 1}), (1020.0, {"a": 2, "b": 1})])
+
+        http_counter = HttpStatsCounter(max_samples=2)
+        for code in (200, 200, 500):
+            http_counter.notify_http_request(request_url="/v1/Device/devList", method="POST",
+                                             http_response_code=code, api_response_code=None)
+        self.assertEqual(http_counter.get_stats().global_stats.total_calls, 2)
+        self.assertEqual(HttpStatsCounter(1000).get_stats().global_stats.total_calls, 0)
+
+    def test_legacy_samples(self):
+        counter = ApiCounter(max_samples=3)
+        for _ in range(5):
+            counter.notify_api_call(device_uuid="dev1", namespace="Appliance.System.All", method="GET")
+        counter.notify_delayed_call(device_uuid="dev2", namespace="Appliance.Control.Toggle", method="SET")
+
+        self.assertEqual(len(counter.api_calls), 3)
+        self.assertEqual(counter.get_api_stats().global_stats.total_calls, 3)
+        sample = counter.delayed_calls[0]
+        self.assertEqual((sample.device_uuid, sample.namespace, sample.method),
+                         ("dev2", "Appliance.Control.Toggle", "SET"))
+        self.assertIsNotNone(sample.timestamp)
+        self.assertEqual(len(counter.dropped_calls), 0)
+        with self.assertRaises(AttributeError):
+            counter.api_calls = []
+
+        # Without max_samples, the statistics count every message, the sample views keep the former bound
+        counter = ApiCounter()
+        for _ in range(1500):
+            counter.notify_api_call(device_uuid="dev1", namespace="Appliance.System.All", method="GET")
+        self.assertEqual(counter.get_api_stats().global_stats.total_calls, 1500)
+        self.assertEqual(len(counter.api_calls), 1000)
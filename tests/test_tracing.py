@@ -0,0 +1,90 @@
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+
+from meross_iot.model.enums import Namespace
+from meross_iot.model.exception import RateLimitExceeded
+from meross_iot.model.push.generic import GenericPushNotification
+from meross_iot.utilities.limiter import ApiRateLimiter, RateLimitPolicy
+from meross_iot.utilities.tracing import SpanCallback, register_span_callback, unregister_span_callback, \
+    trace_span, is_tracing_enabled, SPAN_EXECUTE_COMMAND, SPAN_DISPATCH_PUSH_NOTIFICATION, SPAN_PUSH_HANDLER
+from tests import build_offline_manager
+
+if os.name == 'nt':
+    import asyncio
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    import asyncio
+
+
+class _RecordingCallback(SpanCallback):
+    def __init__(self):
+        self.started = []
+        self.ended = []
+
+    def on_span_start(self, span):
+        self.started.append(span.name)
+
+    def on_span_end(self, span):
+        self.ended.append(span)
+
+
+class TestTracing(AioHTTPTestCase):
+    async def get_application(self):
+        return web.Application()
+
+    async def setUpAsync(self):
+        self.callback = _RecordingCallback()
+        self.limiter = ApiRateLimiter(device_burst=1, over_limit_policy=RateLimitPolicy.RAISE)
+        self.manager = build_offline_manager(rate_limiter=self.limiter)
+
+    async def tearDownAsync(self):
+        unregister_span_callback(self.callback)
+        self.manager.close()
+
+    @unittest_run_loop
+    async def test_noop_when_unregistered(self):
+        self.assertFalse(is_tracing_enabled())
+        self.assertIs(trace_span("a"), trace_span("b", {"key": "value"}))
+
+    @unittest_run_loop
+    async def test_span_error(self):
+        register_span_callback(self.callback)
+        with self.assertRaises(ValueError):
+            with trace_span("outer") as outer:
+                outer.set_attribute("key", "value")
+                with trace_span("inner"):
+                    raise ValueError()
+        self.assertEqual(self.callback.started, ["outer", "inner"])
+        self.assertEqual([s.name for s in self.callback.ended], ["inner", "outer"])
+        self.assertIsInstance(self.callback.ended[1].error, ValueError)
+        self.assertEqual(self.callback.ended[1].attributes, {"key": "value"})
+        self.assertGreaterEqual(self.callback.ended[1].duration, 0)
+
+    @unittest_run_loop
+    async def test_execute_cmd_span(self):
+        register_span_callback(self.callback)
+        # Exhaust the device budget, so that the command fails without reaching any broker
+        self.limiter.acquire("dev1")
+        with self.assertRaises(RateLimitExceeded):
+            await self.manager.async_execute_cmd(mqtt_hostname="localhost", mqtt_port=2001,
+                                                 destination_device_uuid="dev1", method="GET",
+                                                 namespace=Namespace.SYSTEM_ALL, payload={})
+        span = self.callback.ended[-1]
+        self.assertEqual(span.name, SPAN_EXECUTE_COMMAND)
+        self.assertEqual(span.attributes["meross.namespace"], Namespace.SYSTEM_ALL.value)
+        self.assertIsInstance(span.error, RateLimitExceeded)
+
+    @unittest_run_loop
+    async def test_push_dispatch_spans(self):
+        async def handler(push_notification, target_devices, manager):
+            pass
+
+        self.manager.register_push_notification_handler_coroutine(handler)
+        register_span_callback(self.callback)
+        await self.manager._handle_and_dispatch_push_notification(
+            GenericPushNotification(namespace=Namespace.SYSTEM_ONLINE, originating_device_uuid="dev1",
+                                    raw_data={}))
+        self.assertEqual([s.name for s in self.callback.ended], [SPAN_PUSH_HANDLER, SPAN_DISPATCH_PUSH_NOTIFICATION])
+        self.assertEqual(self.callback.ended[1].attributes["meross.device_uuid"], "dev1")